@@ -2,9 +2,14 @@
 from collections import namedtuple
 from dataclasses import dataclass
 from enum import Enum
+import functools
+import itertools
+import math
+import operator
 import re
 import sys
 import tokenize
+import weakref
 
 class TokenStream:
     """Class representing a consumable stream of input tokens"""
@@ -47,10 +52,124 @@ class TokenStream:
     def token_value(self):
         return self.token[1]
 
+@dataclass
+class ParseError:
+    """A syntax error found by parse_line(); column is 1-based."""
+    message: str
+    input: str
+    column: int
+
+    def __str__(self):
+        return f"{self.message} at column {self.column}"
+
+# Token kind for each alternative of the regex, dispatched on by group name.
+TOKEN_KINDS = {
+    "NUMBER": tokenize.NUMBER,
+    "NAME": tokenize.NAME,
+    "LPAR": tokenize.LPAR,
+    "RPAR": tokenize.RPAR,
+    "OP": tokenize.OP,
+    "ERRORTOKEN": tokenize.ERRORTOKEN,
+    "ENDMARKER": tokenize.ENDMARKER,
+}
+
+TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<NUMBER>\d+(?:\.\d*)?|\.\d+)
+      | (?P<NAME>[^\W\d]\w*)
+      | (?P<LPAR>\()
+      | (?P<RPAR>\))
+      | (?P<OP>\*\*|//|[-+*/%@&|^~<>=!.,:;\[\]{}])
+      | (?P<ERRORTOKEN>\S)
+      | (?P<ENDMARKER>\Z)
+    )""", re.VERBOSE)
+
+class RegexTokenStream(TokenStream):
+    """A TokenStream using TOKEN_RE instead of the tokenize module.
+
+    Syntax errors are recorded in `error` (the first one only) rather
+    than printed.
+    """
+    def __init__(self, input):
+        self.input = input
+        self.error = None
+        self.tokens = []
+        pos = 0
+        while True:
+            m = TOKEN_RE.match(input, pos)
+            kind = m.lastgroup
+            if kind == "ENDMARKER":
+                self.tokens.append((tokenize.ENDMARKER, None, m.start(kind)))
+                break
+            self.tokens.append((TOKEN_KINDS[kind], m.group(kind), m.start(kind)))
+            pos = m.end()
+        self.index = -1
+        self.next()
+
+    def next(self):
+        self.index = min(self.index + 1, len(self.tokens) - 1)
+        token_type, value, self.pos = self.tokens[self.index]
+        self.token = (token_type, value)
+
+    def syntax(self, msg):
+        if self.error is None:
+            self.error = ParseError(msg, self.input, self.pos + 1)
+        return None
+
+def _intern_key(value):
+    """The part of a node's interning key for one of its fields.
+
+    Nodes are interned, so they stand for themselves.  Other values
+    are keyed by type too, so 1, 1.0 and True (and 0.0 and -0.0)
+    don't collapse into one node.
+    """
+    if isinstance(value, Node):
+        return value
+    if isinstance(value, float):
+        return (float, value, math.copysign(1.0, value))
+    return (type(value), value)
+
+class Node:
+    """Base class for expression nodes.
+
+    Nodes are immutable and hash-consed: constructing a node equal to
+    an existing one returns the existing object, so parsing produces a
+    DAG in which identical subexpressions are shared, and nodes can be
+    compared and hashed by identity.
+    """
+    __slots__ = ("__weakref__",)
+    _interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, *fields):
+        if len(fields) != len(cls.__match_args__):
+            raise TypeError(f"{cls.__name__} takes fields {', '.join(cls.__match_args__)}")
+        key = (cls, *map(_intern_key, fields))
+        node = Node._interned.get(key)
+        if node is None:
+            node = object.__new__(cls)
+            for name, value in zip(cls.__match_args__, fields):
+                object.__setattr__(node, name, value)
+            node._init()
+            Node._interned[key] = node
+        return node
+
+    def _init(self):
+        """Set derived fields of a newly created node."""
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} objects are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} objects are immutable")
+
+    def __reduce__(self):
+        return (type(self), tuple(getattr(self, name) for name in self.__match_args__))
+
 # Note definition of __match_args__ to support sequence destructuring.
-class BinaryOp:
+class BinaryOp(Node):
     """A binary operator expression."""
-    __match_args__ = ["op", "left", "right"]
+    __match_args__ = ("op", "left", "right")
+    __slots__ = ("op", "left", "right", "precedence")
 
     PRECEDENCE = {
         '+': 3,
@@ -59,33 +178,55 @@ class BinaryOp:
         '/': 4,
     }
 
-    def __init__(self, op, left, right):
-        self.op = op
-        self.left = left
-        self.right = right
-        self.precedence = BinaryOp.PRECEDENCE[op]
+    def _init(self):
+        object.__setattr__(self, "precedence", BinaryOp.PRECEDENCE[self.op])
 
     def __repr__(self):
         return f"({repr(self.left)} {self.op} {repr(self.right)})"
 
-@dataclass
-class UnaryOp:
+class UnaryOp(Node):
     """A unary operator expression."""
-    op: str
-    arg: object
+    __match_args__ = ("op", "arg")
+    __slots__ = ("op", "arg")
 
     def __repr__(self):
         return f"({self.op} {repr(self.arg)})"
 
-@dataclass
-class VarExpr:
+class VarExpr(Node):
     """A reference to a variable."""
-
-    name: str
+    __match_args__ = ("name",)
+    __slots__ = ("name",)
 
     def __repr__(self):
         return self.name
 
+_SAME = object()
+
+def memoize_nodes(fn):
+    """Cache the result of fn(node) for each node.
+
+    As nodes are interned, a shared subexpression is only processed
+    once.  Results are dropped with their node; other arguments
+    (numbers) are passed straight to fn.
+    """
+    cache = weakref.WeakKeyDictionary()
+
+    @functools.wraps(fn)
+    def wrapper(expr):
+        if not isinstance(expr, Node):
+            return fn(expr)
+        result = cache.get(expr)
+        if result is None:
+            result = fn(expr)
+            # Don't let the cache keep its own key alive.
+            cache[expr] = _SAME if result is expr else result
+        elif result is _SAME:
+            result = expr
+        return result
+
+    wrapper.cache = cache
+    return wrapper
+
 def parse_expr(tokstream: TokenStream):
     """Parse an expression."""
     result = parse_binop(tokstream)
@@ -96,6 +237,36 @@ def parse_expr(tokstream: TokenStream):
         tokstream.syntax(f"Expression expected")
     return result
 
+def parse_line(line):
+    """Parse one expression, returning the tree or a ParseError."""
+    tokstream = RegexTokenStream(line)
+    result = parse_expr(tokstream)
+    if tokstream.error is not None:
+        return tokstream.error
+    return result
+
+def _parse_chunk(lines):
+    return [parse_line(line) for line in lines]
+
+def parse_many(lines, workers=1, chunksize=10000):
+    """Parse many expressions, returning a list of trees and ParseErrors.
+
+    With workers > 1 (or None, for one per CPU) the lines are split
+    into chunks that are parsed in a pool of worker processes.
+    """
+    lines = list(lines)
+    if workers == 1 or len(lines) <= chunksize:
+        return _parse_chunk(lines)
+    from concurrent.futures import ProcessPoolExecutor
+    chunks = [lines[i:i + chunksize] for i in range(0, len(lines), chunksize)]
+    with ProcessPoolExecutor(workers) as executor:
+        return list(itertools.chain.from_iterable(executor.map(_parse_chunk, chunks)))
+
+def parse_file(path, workers=1, chunksize=10000):
+    """Parse a file with one expression per line, like parse_many()."""
+    with open(path) as f:
+        return parse_many((line.rstrip("\n") for line in f), workers, chunksize)
+
 OpStackEntry = namedtuple("OpStackEntry", "op precedence")
 
 def parse_binop(tokstream: TokenStream):
@@ -127,11 +298,11 @@ def parse_binop(tokstream: TokenStream):
     # Simple operator precedence parser
     while tokstream.token_type != tokenize.ENDMARKER:
         match tokstream.token:
-            case [tokenize.OP, value := "*"|"/"]:
+            case [tokenize.OP, ("*"|"/") as value]:
                 reduce(4)
                 tokstream.next()
                 opstack.append(OpStackEntry(value, 4))
-            case [tokenize.OP, value := "+"|"-"]:
+            case [tokenize.OP, ("+"|"-") as value]:
                 reduce(3)
                 tokstream.next()
                 opstack.append(OpStackEntry(value, 3))
@@ -153,7 +324,7 @@ def parse_binop(tokstream: TokenStream):
 def parse_unop(tokstream: TokenStream):
     """Parse unary operator."""
     match tokstream.token:
-        case [tokenize.OP, value := "+"|"-"]:
+        case [tokenize.OP, ("+"|"-") as value]:
             tokstream.next()
             arg = parse_unop(tokstream)
             if arg is None:
@@ -180,7 +351,7 @@ def parse_primary(tokstream: TokenStream):
       case tokenize.LPAR:
           tokstream.next()
           expr = parse_binop(tokstream)
-          if not expr:
+          if expr is None:
               return None
           token, value = tokstream.token
           if token == tokenize.RPAR:
@@ -228,6 +399,7 @@ def format_expr_tree(expr, indent=""):
         case _:
             raise ValueError(f"Invalid expression value: {repr(expr)}")
 
+@memoize_nodes
 def eval_expr(expr):
     """Evaluate an expression and return the result."""
     match expr:
@@ -250,6 +422,94 @@ def eval_expr(expr):
         case _:
             raise ValueError(f"Invalid expression value: {repr(expr)}")
 
+BINARY_OPERATORS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+}
+
+def _apply(fn, *args):
+    """Apply an operator to scalars, NumPy arrays or lists (elementwise)."""
+    if not any(isinstance(arg, list) for arg in args):
+        return fn(*args)  # Scalars broadcast against NumPy arrays
+    columns = [arg if isinstance(arg, list) else itertools.repeat(arg) for arg in args]
+    return list(map(fn, *columns))
+
+def compile_expr(expr, number=None):
+    """Compile an expression into a function of the variable values.
+
+    The function takes a mapping from variable names to values and
+    evaluates the whole tree without any further matching.  A value may
+    be a number, a NumPy array or a list, so one call can evaluate many
+    rows at once.  Subtrees without variables come out as plain numbers,
+    converted by `number` if given (e.g. numpy.float64, so that constant
+    arithmetic follows NumPy rules too).
+    """
+    match expr:
+        case BinaryOp(op, left, right) if op in BINARY_OPERATORS:
+            fn = BINARY_OPERATORS[op]
+            left_fn = compile_expr(left, number)
+            right_fn = compile_expr(right, number)
+            return lambda env: _apply(fn, left_fn(env), right_fn(env))
+        case UnaryOp('+', arg):
+            return compile_expr(arg, number)
+        case UnaryOp('-', arg):
+            arg_fn = compile_expr(arg, number)
+            return lambda env: _apply(operator.neg, arg_fn(env))
+        case VarExpr(name):
+            def lookup(env):
+                try:
+                    return env[name]
+                except KeyError:
+                    raise ValueError(f"Unknown value of: {name}") from None
+            return lookup
+        case float() | int():
+            value = expr if number is None else number(expr)
+            return lambda env: value
+        case _:
+            raise ValueError(f"Invalid expression value: {repr(expr)}")
+
+@functools.lru_cache(maxsize=None)
+def _numpy():
+    """NumPy, or None if not installed; imported lazily as it is slow to import"""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+def eval_batch(expr, columns, use_numpy=None):
+    """Evaluate an expression for many sets of variable values at once.
+
+    `columns` maps each variable name to a sequence holding its value
+    for every row; all of them must have the same length.  With NumPy
+    (used by default if installed) the result is a float array and
+    division by zero gives inf/nan, also between constants; without it
+    the result is a list and division by zero raises, like eval_expr().
+    """
+    numpy = _numpy()
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    elif use_numpy and numpy is None:
+        raise ImportError("eval_batch(use_numpy=True) requires NumPy")
+    lengths = {len(values) for values in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError("All columns must have the same length")
+    rows = lengths.pop() if lengths else 1
+    if use_numpy:
+        fn = compile_expr(expr, numpy.float64)
+        env = {name: numpy.asarray(values, dtype=float) for name, values in columns.items()}
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return numpy.broadcast_to(fn(env), (rows,)).copy()
+    fn = compile_expr(expr)
+    env = {name: list(values) for name, values in columns.items()}
+    result = fn(env)
+    if not isinstance(result, list):
+        result = [result] * rows
+    return result
+
+@memoize_nodes
 def simplify_expr(expr):
     """Simplify an expression by folding constants and removing identities."""
     match expr:
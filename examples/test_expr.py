@@ -1,4 +1,11 @@
-from expr import BinaryOp, UnaryOp, VarExpr, eval_expr, format_expr, simplify_expr
+import pickle
+
+import pytest
+
+from expr import (
+    BinaryOp, ParseError, TokenStream, UnaryOp, VarExpr, compile_expr, eval_batch, eval_expr,
+    format_expr, parse_expr, parse_file, parse_line, parse_many, simplify_expr
+)
 
 def test_eval_binary():
     assert eval_expr(BinaryOp('+', 1, 2)) == 3
@@ -95,3 +102,101 @@ def test_simplify():
 
     # Double minus
     assert format_expr(simplify_expr(UnaryOp('-', UnaryOp('-', VarExpr('x'))))) == 'x'
+
+def test_eval_batch():
+    # 2 * x + y / 4 - -x
+    expr = BinaryOp('-',
+        BinaryOp('+', BinaryOp('*', 2, VarExpr('x')), BinaryOp('/', VarExpr('y'), 4)),
+        UnaryOp('-', VarExpr('x')))
+    columns = {'x': [1, 2, 3], 'y': [4, 8, 0]}
+    assert eval_batch(expr, columns, use_numpy=False) == [4, 8, 9]
+    assert eval_batch(BinaryOp('+', 1, 2), columns, use_numpy=False) == [3, 3, 3]
+    assert compile_expr(expr)({'x': 1, 'y': 4}) == 4
+
+def test_eval_batch_unknown_variable():
+    with pytest.raises(ValueError):
+        eval_batch(VarExpr('z'), {'x': [1]}, use_numpy=False)
+
+def test_eval_batch_numpy():
+    numpy = pytest.importorskip("numpy")
+    expr = BinaryOp('/', BinaryOp('+', VarExpr('x'), 1), VarExpr('y'))
+    result = eval_batch(expr, {'x': [1, 2, 3], 'y': [2, 3, 0]}, use_numpy=True)
+    assert isinstance(result, numpy.ndarray)
+    assert list(result) == [1.0, 1.0, float('inf')]
+    assert list(eval_batch(UnaryOp('-', 2), {'x': [1, 2]}, use_numpy=True)) == [-2, -2]
+    # Constants divide like columns, not like Python numbers.
+    assert list(eval_batch(BinaryOp('/', 1, 0), {'x': [1, 2]}, use_numpy=True)) == [float('inf')] * 2
+    assert numpy.isnan(eval_batch(BinaryOp('/', 0, BinaryOp('-', 1, 1)), {}, use_numpy=True)).all()
+
+def test_eval_batch_without_numpy(monkeypatch):
+    monkeypatch.setattr("expr._numpy", lambda: None)
+    with pytest.raises(ImportError, match="requires NumPy"):
+        eval_batch(BinaryOp('/', 1, 2), {'x': [1]}, use_numpy=True)
+    assert eval_batch(BinaryOp('/', 1, 2), {'x': [1]}) == [0.5]
+    with pytest.raises(ZeroDivisionError):
+        eval_batch(BinaryOp('/', 1, 0), {'x': [1]})
+
+def test_parse_line():
+    for line in ["1 + 2 * x", "-(a - b) / 2.5", "((x))", "a * -b + +c / d - 4"]:
+        expected = parse_expr(TokenStream(line))
+        assert format_expr(parse_line(line)) == format_expr(expected)
+
+def random_line(rng, depth=3):
+    r = rng.random()
+    if depth == 0 or r < 0.3:
+        return rng.choice(["x", "y1", "42", "2.5", "0"])
+    if r < 0.4:
+        return rng.choice("+-") + random_line(rng, depth - 1)
+    if r < 0.5:
+        return "(" + random_line(rng, depth - 1) + ")"
+    op = rng.choice(["+", "-", "*", "/", " * ", "  -"])
+    return random_line(rng, depth - 1) + op + random_line(rng, depth - 1)
+
+def test_parse_line_same_as_tokenize():
+    import random
+    rng = random.Random(0)
+    for _ in range(300):
+        line = random_line(rng)
+        # Nodes are interned, so == compares whole trees.
+        assert parse_line(line) == parse_expr(TokenStream(line)), line
+
+def test_parse_line_errors(capsys):
+    assert parse_line("1 +") == ParseError("Expression expected after operator", "1 +", 4)
+    assert parse_line("(1 + 2") == ParseError("Closing paren expected", "(1 + 2", 7)
+    assert parse_line("1 $ 2").message == "Unrecognized token 'ERRORTOKEN'"
+    assert parse_line("").message == "Expression expected"
+    assert capsys.readouterr().out == ""
+
+def test_parse_many():
+    lines = [f"x{i} * {i} + (y - {i})" for i in range(50)] + ["1 +"]
+    expected = [parse_line(line) for line in lines]
+    for workers in [1, 2]:
+        result = parse_many(lines, workers=workers, chunksize=7)
+        assert [format_expr(r) for r in result[:-1]] == [format_expr(e) for e in expected[:-1]]
+        assert result[-1] == expected[-1]
+
+def test_parse_file(tmp_path):
+    lines = ["1 + 2 * x", "(a - b", "-c"]
+    path = tmp_path / "exprs.txt"
+    path.write_text("\n".join(lines) + "\n")
+    assert parse_file(path) == [parse_line(line) for line in lines]
+
+def test_nodes_are_interned():
+    x = BinaryOp('*', VarExpr('x'), 2)
+    assert BinaryOp('*', VarExpr('x'), 2) is x
+    assert BinaryOp('*', VarExpr('x'), 2.0) is not x
+    assert UnaryOp('-', 0.0) is not UnaryOp('-', -0.0)
+    assert len({x, BinaryOp('*', VarExpr('x'), 2)}) == 1
+    with pytest.raises(AttributeError):
+        x.op = '+'
+    assert pickle.loads(pickle.dumps(x)) is x
+    # Parsing shares identical subexpressions.
+    tree = parse_line("(a + 1) * (a + 1)")
+    assert tree.left is tree.right
+
+def test_memoized_simplify():
+    shared = BinaryOp('+', BinaryOp('*', 1, VarExpr('x')), 0)
+    tree = BinaryOp('-', shared, UnaryOp('-', shared))
+    assert format_expr(simplify_expr(tree)) == 'x - -x'
+    assert simplify_expr.cache[shared] is VarExpr('x')
+    assert eval_expr(BinaryOp('*', BinaryOp('+', 1, 2), BinaryOp('+', 1, 2))) == 9
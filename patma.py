@@ -1,10 +1,21 @@
 # mypy: disallow-untyped-defs
 
+import abc
 import collections.abc as cabc
-import dataclasses
 import itertools
 import sys
-from typing import Dict, List, Mapping, Optional, Set, Type
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
 
 __all__ = [
     "Pattern",
@@ -19,6 +30,8 @@ __all__ = [
     "BindingsError",
     "InconsistentBindings",
     "DuplicateBindings",
+    "match_first",
+    "match_batch",
 ]
 
 
@@ -86,8 +99,27 @@ class Pattern:
     pattern (e.g. ``a: int``) uses a ``Pattern`` to represent the
     variable, but the syntax constrains what appears to the left of
     the colon and where the ``a: int`` pattern can occur.
+
+    Patterns are immutable: subclasses declare their fields in
+    ``__slots__``, set them once in ``__init__`` using ``_init()``, and
+    keep nested patterns in tuples.  ``_args()`` returns the
+    constructor arguments, which is what pickling uses.
     """
 
+    __slots__ = ()
+
+    def __setattr__(self, name: str, value: object) -> None:
+        raise AttributeError(f"{type(self).__name__} objects are immutable")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} objects are immutable")
+
+    def __reduce__(self) -> Tuple[type, Tuple]:
+        return (type(self), self._args())
+
+    def _args(self) -> Tuple:
+        raise NotImplementedError
+
     def match(self, x: object) -> Optional[Dict[str, object]]:
         raise NotImplementedError
 
@@ -113,6 +145,24 @@ class Pattern:
         """
         raise NotImplementedError
 
+    def specialize(self, schema: object) -> "Pattern":
+        """Return an equivalent pattern for subjects of type schema.
+
+        schema is a type annotation, such as a dataclass or
+        ``Tuple[str, int]``; checks it guarantees are dropped, and a
+        pattern that can never match becomes a NeverPattern.  See
+        patma_specialize.
+        """
+        from patma_specialize import specialize
+
+        return specialize(self, schema)
+
+
+def _init(_self: Pattern, **fields: object) -> None:
+    """Set the fields of a newly constructed (immutable) Pattern."""
+    for name, value in fields.items():
+        object.__setattr__(_self, name, value)
+
 
 def _is_instance(x: object, t: type) -> bool:
     """Like instance() but pretend int subclasses float.
@@ -128,8 +178,14 @@ class ConstantPattern(Pattern):
     The matched value's type must be a subtype of the constant's type.
     """
 
+    __slots__ = ("constant",)
+    constant: object
+
     def __init__(self, constant: object):
-        self.constant = constant
+        _init(self, constant=constant)
+
+    def _args(self) -> Tuple:
+        return (self.constant,)
 
     def match(self, x: object) -> Optional[Dict[str, object]]:
         if _is_instance(x, type(self.constant)) and x == self.constant:
@@ -154,8 +210,14 @@ class AlternativesPattern(Pattern):
     This is a sequence of patterns separated by bars (``|``).
     """
 
-    def __init__(self, patterns: List[Pattern]):
-        self.patterns = patterns
+    __slots__ = ("patterns",)
+    patterns: Tuple[Pattern, ...]
+
+    def __init__(self, patterns: Iterable[Pattern]):
+        _init(self, patterns=tuple(patterns))
+
+    def _args(self) -> Tuple:
+        return (self.patterns,)
 
     def match(self, x: object) -> Optional[Dict[str, object]]:
         for p in self.patterns:
@@ -190,8 +252,14 @@ class VariablePattern(Pattern):
     that produces a new name binding.
     """
 
+    __slots__ = ("name",)
+    name: str
+
     def __init__(self, name: str):
-        self.name = name
+        _init(self, name=name)
+
+    def _args(self) -> Tuple:
+        return (self.name,)
 
     def match(self, x: object) -> Dict[str, object]:
         return {self.name: x}
@@ -225,9 +293,15 @@ class AnnotatedPattern(Pattern):
           context to the match() call.
     """
 
+    __slots__ = ("pattern", "cls")
+    pattern: Pattern
+    cls: Type
+
     def __init__(self, pattern: Pattern, cls: Type):
-        self.pattern = pattern
-        self.cls = cls
+        _init(self, pattern=pattern, cls=cls)
+
+    def _args(self) -> Tuple:
+        return (self.pattern, self.cls)
 
     def match(self, x: object) -> Optional[Dict[str, object]]:
         if _is_instance(x, self.cls):
@@ -242,6 +316,31 @@ class AnnotatedPattern(Pattern):
         return self.pattern.bindings(strict)
 
 
+# Whether instances of a type are matched by sequence patterns, cached
+# by exact type.  Like functools.singledispatch, the cache is dropped
+# whenever an ABC registration may have changed the answer.  The cache
+# is replaced rather than cleared, so a thread still holding the old
+# one can't put a stale answer into the new one.
+_sequence_types: Tuple[object, Dict[type, bool]] = (abc.get_cache_token(), {})
+
+
+def _is_sequence(x: object) -> bool:
+    """Is x a Sequence (but not str or bytes)?"""
+    global _sequence_types
+    token, cache = _sequence_types
+    if token != abc.get_cache_token():
+        token = abc.get_cache_token()
+        cache = {}
+        _sequence_types = (token, cache)
+    cls = type(x)
+    try:
+        return cache[cls]
+    except KeyError:
+        result = isinstance(x, cabc.Sequence) and not isinstance(x, (str, bytes))
+        cache[cls] = result
+        return result
+
+
 class SequencePattern(Pattern):
     """A pattern for a (fixed) sequence of subpatterns.
 
@@ -250,28 +349,37 @@ class SequencePattern(Pattern):
     memoryview).
     """
 
-    def __init__(self, patterns: List[Pattern]):
-        self.patterns = patterns
+    __slots__ = ("patterns",)
+    patterns: Tuple[Pattern, ...]
+
+    def __init__(self, patterns: Iterable[Pattern]):
+        _init(self, patterns=tuple(patterns))
+
+    def _args(self) -> Tuple:
+        return (self.patterns,)
 
     def match(self, x: object) -> Optional[Dict[str, object]]:
-        if (
-            isinstance(x, cabc.Sequence)
-            and not isinstance(x, (str, bytes))
-            and len(x) == len(self.patterns)
-        ):
-            matches = {}
-            for pattern, item in zip(self.patterns, x):
-                match = pattern.match(item)
-                if match is None:
-                    return None
-                matches.update(match)
-            return matches
-        return None
+        cls = type(x)
+        if cls is not tuple and cls is not list and not _is_sequence(x):
+            return None
+        if len(x) != len(self.patterns):  # type: ignore
+            return None
+        matches = {}
+        for pattern, item in zip(self.patterns, x):  # type: ignore
+            match = pattern.match(item)
+            if match is None:
+                return None
+            matches.update(match)
+        return matches
 
     def translate(self, target: str) -> str:
-        # TODO: arrange to import Sequence; exclude str/bytes
+        # TODO: arrange to import Sequence
         per_item = (p.translate(f"{target}[{i}]") for i, p in enumerate(self.patterns))
-        return f"(isinstance({target}, Sequence) and len({target}) == {len(self.patterns)} and {' and '.join(per_item)})"
+        is_sequence = (
+            f"(type({target}) in (tuple, list) or isinstance({target}, Sequence)"
+            f" and not isinstance({target}, (str, bytes)))"
+        )
+        return f"({is_sequence} and len({target}) == {len(self.patterns)} and {' and '.join(per_item)})"
 
     def bindings(self, strict=True) -> Set[str]:
         result = set()
@@ -290,16 +398,30 @@ class MappingPattern(Pattern):
 
     This uses constants for keys but patterns for values.
     Extra key/value pairs are ignored.
+
+    The keys and value patterns are stored as two parallel tuples;
+    the ``patterns`` property rebuilds the mapping.
     """
 
+    __slots__ = ("keys", "values")
+    keys: Tuple[object, ...]
+    values: Tuple[Pattern, ...]
+
     def __init__(self, patterns: Mapping[object, Pattern]):
-        self.patterns = patterns
+        _init(self, keys=tuple(patterns), values=tuple(patterns.values()))
+
+    @property
+    def patterns(self) -> Dict[object, Pattern]:
+        return dict(zip(self.keys, self.values))
+
+    def _args(self) -> Tuple:
+        return (self.patterns,)
 
     def match(self, x: object) -> Optional[Dict[str, object]]:
         if not isinstance(x, Mapping):
             return None
         matches = {}
-        for key, pattern in self.patterns.items():
+        for key, pattern in zip(self.keys, self.values):
             try:
                 value = x[key]
             except KeyError:
@@ -314,13 +436,13 @@ class MappingPattern(Pattern):
         # TODO: arrange to import Mapping
         per_item = (
             f"({key!r} in {target} and " + pat.translate(f"{target}[{key!r}]") + ")"
-            for key, pat in self.patterns.items()
+            for key, pat in zip(self.keys, self.values)
         )
         return f"(isinstance({target}, Mapping) and {' and '.join(per_item)})"
 
     def bindings(self, strict=True) -> Set[str]:
         result = set()
-        for key, p in self.patterns.items():
+        for p in self.values:
             b = p.bindings(strict)
             if strict and b & result:
                 raise DuplicateBindings(
@@ -341,6 +463,26 @@ def _get_stack_depth() -> int:
         i += 1
 
 
+# Positional field names by exact type, filled in by _positional_fields().
+_field_names: Dict[type, Tuple[str, ...]] = {}
+
+
+def _positional_fields(x: object) -> Tuple[str, ...]:
+    """Names of the attributes that positional subpatterns match."""
+    names = _field_names.get(type(x))
+    if names is None:
+        # dataclasses is slow to import, and is already imported if x
+        # is a dataclass instance.
+        import dataclasses
+
+        try:
+            fields = dataclasses.fields(x)  # type: ignore
+        except RuntimeError:
+            fields = ()
+        names = _field_names[type(x)] = tuple(field.name for field in fields)
+    return names
+
+
 class InstancePattern(Pattern):
     """A pattern that matches a class instance.
 
@@ -348,23 +490,39 @@ class InstancePattern(Pattern):
     ``x`` and ``y``.
 
     TODO: Same problem for the class name as AnnotatedPattern.
+
+    Keyword patterns are stored like MappingPattern's items.
     """
 
+    __slots__ = ("cls", "posargs", "kwnames", "kwpatterns")
+    cls: Type
+    posargs: Tuple[Pattern, ...]
+    kwnames: Tuple[str, ...]
+    kwpatterns: Tuple[Pattern, ...]
+
     def __init__(
-        self, cls: Type, posargs: List[Pattern], kwargs: Mapping[str, Pattern]
+        self, cls: Type, posargs: Iterable[Pattern], kwargs: Mapping[str, Pattern]
     ):
-        self.cls = cls
-        self.posargs = posargs
-        self.kwargs = kwargs
+        _init(
+            self,
+            cls=cls,
+            posargs=tuple(posargs),
+            kwnames=tuple(kwargs),
+            kwpatterns=tuple(kwargs.values()),
+        )
+
+    @property
+    def kwargs(self) -> Dict[str, Pattern]:
+        return dict(zip(self.kwnames, self.kwpatterns))
+
+    def _args(self) -> Tuple:
+        return (self.cls, self.posargs, self.kwargs)
 
     def match(self, x: object) -> Optional[Dict[str, object]]:
         if not _is_instance(x, self.cls):
             return None
 
-        try:
-            fields = dataclasses.fields(x)
-        except RuntimeError:
-            fields = ()
+        fields = _positional_fields(x)
 
         if len(self.posargs) > len(fields):
             return None  # Can't match: more positional patterns than fields.
@@ -373,7 +531,7 @@ class InstancePattern(Pattern):
         matches = {}
 
         for field, pattern in zip(fields, self.posargs):
-            value = getattr(x, field.name, missing)
+            value = getattr(x, field, missing)
             if value is missing:
                 return None  # Can't match: attribute not set.
             match = pattern.match(value)
@@ -381,7 +539,7 @@ class InstancePattern(Pattern):
                 return None
             matches.update(match)
 
-        for name, pattern in self.kwargs.items():
+        for name, pattern in zip(self.kwnames, self.kwpatterns):
             value = getattr(x, name, missing)
             if value is missing:
                 return None  # Can't match: attribute not set.
@@ -413,7 +571,7 @@ class InstancePattern(Pattern):
                     f"({item} := getattr({tmpvar}, {fields}[{i}], _Nope)) is not _Nope"
                 )
                 conditions.append(self.posargs[i].translate(item))
-        for kw, pat in self.kwargs.items():
+        for kw, pat in zip(self.kwnames, self.kwpatterns):
             conditions.append(
                 f"({item} := getattr({tmpvar}, {kw!r}, _Nope)) is not _Nope"
             )
@@ -430,7 +588,7 @@ class InstancePattern(Pattern):
 
     def bindings(self, strict=True) -> Set[str]:
         result = set()
-        for p in itertools.chain(self.posargs, self.kwargs.values()):
+        for p in itertools.chain(self.posargs, self.kwpatterns):
             b = p.bindings(strict)
             if strict and b & result:
                 raise DuplicateBindings(
@@ -448,9 +606,15 @@ class WalrusPattern(Pattern):
     extracted into ``a``.
     """
 
+    __slots__ = ("name", "pattern")
+    name: str
+    pattern: Pattern
+
     def __init__(self, name: str, pattern: Pattern):
-        self.name = name
-        self.pattern = pattern
+        _init(self, name=name, pattern=pattern)
+
+    def _args(self) -> Tuple:
+        return (self.name, self.pattern)
 
     def match(self, x: object) -> Optional[Dict[str, object]]:
         match = self.pattern.match(x)
@@ -468,3 +632,84 @@ class WalrusPattern(Pattern):
                 raise DuplicateBindings("Duplicate bindings in walrus pattern")
             result |= {self.name}
         return result
+
+
+CaseMatch = Tuple[int, Dict[str, object]]
+
+
+def _as_cases(pattern_or_cases: Union[Pattern, Sequence[Pattern]]) -> Sequence[Pattern]:
+    if isinstance(pattern_or_cases, Pattern):
+        return (pattern_or_cases,)
+    return pattern_or_cases
+
+
+def match_first(
+    pattern_or_cases: Union[Pattern, Sequence[Pattern]], x: object
+) -> Optional[CaseMatch]:
+    """Match x against a list of cases, like a match statement would.
+
+    Returns ``(case_index, bindings)`` for the first case that matches,
+    or None if none does.  A single Pattern is treated as a one-case
+    list.
+    """
+    for i, case in enumerate(_as_cases(pattern_or_cases)):
+        match = case.match(x)
+        if match is not None:
+            return i, match
+    return None
+
+
+def match_batch(
+    pattern_or_cases: Union[Pattern, Sequence[Pattern]], items: Iterable[object]
+) -> List[Optional[CaseMatch]]:
+    """Apply match_first() to each item, returning results in order.
+
+    This is the synchronous batch path; it is a module-level function
+    so that it can be shipped to a process pool.
+    """
+    cases = _as_cases(pattern_or_cases)
+    return [match_first(cases, item) for item in items]
+
+
+# Names exported by the engine modules, which are imported on first
+# use so that "import patma" stays cheap.  They aren't in __all__, so
+# "from patma import *" doesn't import them either.
+_LAZY_NAMES = {
+    "amatch_stream": "patma_async",
+    "SequenceTrie": "patma_dispatch",
+    "explain": "patma_explain",
+    "explain_cases": "patma_explain",
+    "IndexedCollection": "patma_index",
+    "compile_json": "patma_json",
+    "match_json": "patma_json",
+    "TypeDispatch": "patma_dispatch",
+    "compile_native": "patma_native",
+    "optimize": "patma_optimize",
+    "profile": "patma_optimize",
+    "specialize": "patma_specialize",
+    "unmatchable": "patma_specialize",
+    "StringDispatch": "patma_string",
+    "StringPattern": "patma_string",
+    "MatcherRegistry": "patma_registry",
+    "PatternTable": "patma_table",
+    "dumps": "patma_table",
+    "loads": "patma_table",
+    "dump": "patma_table",
+    "load": "patma_table",
+    "freeze": "patma_table",
+}
+
+
+def __getattr__(name: str) -> object:
+    module = _LAZY_NAMES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value  # Later lookups don't get here.
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(_LAZY_NAMES))
@@ -0,0 +1,154 @@
+# mypy: disallow-untyped-defs
+"""Matching patterns against asyncio event sources.
+
+Items are pulled from the async iterable by a reader task into a
+bounded buffer.  Whatever has accumulated in the buffer (up to
+``batch_size`` items) is matched as one batch using
+``patma.match_batch()``, so a busy source gets large batches and a
+trickling one gets low latency.  The reader blocks when the buffer is
+full, which propagates backpressure to the source.
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+from typing import (
+    AsyncIterable,
+    AsyncGenerator,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from patma import CaseMatch, Pattern, _as_cases, match_batch
+
+__all__ = ["amatch_stream"]
+
+
+class _End:
+    """Marks the end of the source (possibly with an exception)."""
+
+    def __init__(self, exc: Optional[Exception] = None):
+        self.exc = exc
+
+
+async def _read(source: AsyncIterable[object], buffer: "asyncio.Queue[object]") -> None:
+    # Errors are handed to the consumer in order, after the items read
+    # before them; KeyboardInterrupt, SystemExit and CancelledError end
+    # the reader task at once (see _next_batch()).
+    try:
+        async for item in source:
+            await buffer.put(item)
+    except Exception as exc:
+        await buffer.put(_End(exc))
+    else:
+        await buffer.put(_End())
+
+
+async def _next_batch(
+    buffer: "asyncio.Queue[object]", batch_size: int, reader: "asyncio.Task[None]"
+) -> Tuple[List[object], Optional[_End]]:
+    """Wait for one item, then take whatever else is already buffered."""
+    batch: List[object] = []
+    if buffer.empty():
+        # The reader puts an _End when the source ends or fails, unless
+        # it ends with a BaseException; then there's nothing to get.
+        get = asyncio.ensure_future(buffer.get())
+        try:
+            await asyncio.wait([get, reader], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not get.done():
+                get.cancel()
+        if get.done():
+            item = get.result()
+        else:
+            reader.result()  # Raises what ended the reader.
+            item = buffer.get_nowait()
+    else:
+        item = buffer.get_nowait()
+    while not isinstance(item, _End):
+        batch.append(item)
+        if len(batch) >= batch_size or buffer.empty():
+            return batch, None
+        item = buffer.get_nowait()
+    return batch, item
+
+
+async def amatch_stream(
+    pattern_or_cases: Union[Pattern, Sequence[Pattern]],
+    aiterable: AsyncIterable[object],
+    *,
+    batch_size: int = 256,
+    max_pending: int = 4,
+    executor: Optional[concurrent.futures.Executor] = None,
+) -> AsyncGenerator[Tuple[object, Optional[int], Optional[Dict[str, object]]], None]:
+    """Match each item of an async iterable, yielding results in order.
+
+    Yields ``(item, case_index, bindings)`` for every item; unmatched
+    items are yielded as ``(item, None, None)``.
+
+    Up to ``batch_size * max_pending`` items wait in the buffer, and
+    up to ``max_pending`` batches of at most ``batch_size`` items are
+    being matched or handed out, so ``2 * batch_size * max_pending``
+    items (and one the reader waits to put) are held ahead of the
+    consumer at most.  If
+    ``executor`` is given (thread or process pool), batches are matched
+    there, so the event loop isn't blocked; otherwise they are matched
+    inline, in between awaiting the source.  For a process pool the
+    patterns and items must be picklable.
+
+    An exception raised by the source is raised here after the items
+    before it have been yielded; KeyboardInterrupt, SystemExit and
+    CancelledError are raised at once.
+    """
+    if batch_size < 1 or max_pending < 1:
+        raise ValueError("batch_size and max_pending must be positive")
+    cases = tuple(_as_cases(pattern_or_cases))
+    loop = asyncio.get_running_loop()
+    buffer: "asyncio.Queue[object]" = asyncio.Queue(batch_size * max_pending)
+    reader = loop.create_task(_read(aiterable, buffer))
+    pending: Deque[
+        Tuple[List[object], "asyncio.Future[List[Optional[CaseMatch]]]"]
+    ] = collections.deque()
+    end: Optional[_End] = None
+    try:
+        while True:
+            # Keep the pipeline full, but don't wait on the source
+            # while there are results ready to be handed out.
+            while end is None and len(pending) < max_pending:
+                if pending and buffer.empty():
+                    break
+                batch, end = await _next_batch(buffer, batch_size, reader)
+                if not batch:
+                    break
+                if executor is None:
+                    future = loop.create_future()
+                    future.set_result(match_batch(cases, batch))
+                else:
+                    future = loop.run_in_executor(executor, match_batch, cases, batch)
+                pending.append((batch, future))
+            if not pending:
+                break
+            batch, future = pending.popleft()
+            for item, result in zip(batch, await future):
+                if result is None:
+                    yield item, None, None
+                else:
+                    yield item, result[0], result[1]
+        if end is not None and end.exc is not None:
+            raise end.exc
+    finally:
+        for _, future in pending:
+            future.cancel()
+        if not reader.done():
+            reader.cancel()
+            try:
+                await reader
+            except asyncio.CancelledError:
+                pass
+        elif not reader.cancelled():
+            reader.exception()  # Already raised; don't log it again.
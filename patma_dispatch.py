@@ -0,0 +1,327 @@
+# mypy: disallow-untyped-defs
+"""Dispatch structures that match one subject against many cases.
+
+These give the same results as ``patma.match_first()`` over the case
+list, but avoid trying cases that can't match.
+"""
+
+import abc
+import collections.abc as cabc
+import operator
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from patma import (
+    AlternativesPattern,
+    AnnotatedPattern,
+    CaseMatch,
+    ConstantPattern,
+    InstancePattern,
+    MappingPattern,
+    Pattern,
+    SequencePattern,
+    WalrusPattern,
+    _is_instance,
+    _is_sequence,
+    _positional_fields,
+)
+
+__all__ = ["SequenceTrie", "TypeDispatch"]
+
+# (case index, (position, subpattern) pairs left to check), where None
+# means the whole case must be matched.
+_Entry = Tuple[int, Optional[Tuple[Tuple[int, Pattern], ...]]]
+
+
+def _constants(pattern: Pattern) -> Optional[List[object]]:
+    """The constants a subpattern is equivalent to, if it is that simple."""
+    if isinstance(pattern, ConstantPattern):
+        constants = [pattern.constant]
+    elif isinstance(pattern, AlternativesPattern) and all(
+        isinstance(p, ConstantPattern) for p in pattern.patterns
+    ):
+        constants = [p.constant for p in pattern.patterns]  # type: ignore
+    else:
+        return None
+    try:
+        for c in constants:
+            hash(c)
+    except TypeError:
+        return None
+    return constants
+
+
+class _TrieNode:
+    __slots__ = ("constants", "wild", "entries")
+
+    def __init__(self) -> None:
+        # Constant value -> [(type of constant, constant, child)], since
+        # equal constants of different types (1, 1.0, True) share a key.
+        self.constants: Dict[object, List[Tuple[type, object, _TrieNode]]] = {}
+        self.wild: Optional[_TrieNode] = None  # For non-constant elements.
+        self.entries: List[_Entry] = []  # Cases ending here.
+
+    def insert(self, elements: Sequence[Pattern], pos: int, entry: _Entry) -> None:
+        if pos == len(elements):
+            self.entries.append(entry)
+            return
+        constants = _constants(elements[pos])
+        if constants is None:
+            if self.wild is None:
+                self.wild = _TrieNode()
+            self.wild.insert(elements, pos + 1, entry)
+            return
+        for c in constants:
+            bucket = self.constants.setdefault(c, [])
+            for ctype, constant, child in bucket:
+                if ctype is type(c) and constant == c:
+                    break
+            else:
+                child = _TrieNode()
+                bucket.append((type(c), c, child))
+            child.insert(elements, pos + 1, entry)
+
+
+class SequenceTrie:
+    """Match a subject against many cases that are mostly sequences.
+
+    Sequence patterns are grouped by length and put in a trie keyed
+    on their constant elements (constants, or alternatives of
+    constants), position by position.  A subject is looked up by
+    walking the trie with its items, which yields the few candidate
+    cases whose constants all match; only their other subpatterns are
+    then evaluated, in case order.  Cases that aren't sequence
+    patterns are always candidates.
+    """
+
+    def __init__(self, cases: Sequence[Pattern]):
+        self.cases = tuple(cases)
+        self.roots: Dict[int, _TrieNode] = {}
+        self.others: List[int] = []
+        for i, case in enumerate(self.cases):
+            if not isinstance(case, SequencePattern):
+                self.others.append(i)
+                continue
+            elements = case.patterns
+            checks = tuple(
+                (pos, p) for pos, p in enumerate(elements) if _constants(p) is None
+            )
+            root = self.roots.get(len(elements))
+            if root is None:
+                root = self.roots[len(elements)] = _TrieNode()
+            root.insert(elements, 0, (i, checks))
+
+    def _entries(self, x: object) -> List[_Entry]:
+        """Candidate entries for x, in case order."""
+        entries: List[_Entry] = [(i, None) for i in self.others]
+        if type(x) is tuple or type(x) is list or _is_sequence(x):
+            root = self.roots.get(len(x))  # type: ignore
+            if root is not None:
+                nodes = [root]
+                for item in x:  # type: ignore
+                    found = []
+                    for node in nodes:
+                        if node.wild is not None:
+                            found.append(node.wild)
+                        try:
+                            bucket = node.constants.get(item)
+                        except TypeError:  # Unhashable, so no constant matches.
+                            continue
+                        if bucket is not None:
+                            for ctype, constant, child in bucket:
+                                if _is_instance(item, ctype) and item == constant:
+                                    found.append(child)
+                    nodes = found
+                    if not nodes:
+                        break
+                for node in nodes:
+                    entries.extend(node.entries)
+        if len(entries) > 1:
+            entries.sort(key=operator.itemgetter(0))
+            # The same case may be reached twice via alternatives.
+            entries = [
+                e for j, e in enumerate(entries) if j == 0 or entries[j - 1][0] != e[0]
+            ]
+        return entries
+
+    def _check(self, entry: _Entry, x: object) -> Optional[Dict[str, object]]:
+        i, checks = entry
+        if checks is None:
+            return self.cases[i].match(x)
+        matches: Dict[str, object] = {}
+        for pos, pattern in checks:
+            match = pattern.match(x[pos])  # type: ignore
+            if match is None:
+                return None
+            matches.update(match)
+        return matches
+
+    def candidates(self, x: object) -> List[int]:
+        """Indices of the cases that might match x."""
+        return [i for i, _ in self._entries(x)]
+
+    def match_first(self, x: object) -> Optional[CaseMatch]:
+        for entry in self._entries(x):
+            match = self._check(entry, x)
+            if match is not None:
+                return entry[0], match
+        return None
+
+    def match_all(self, x: object) -> List[CaseMatch]:
+        """All matching cases, in case order."""
+        result = []
+        for entry in self._entries(x):
+            match = self._check(entry, x)
+            if match is not None:
+                result.append((entry[0], match))
+        return result
+
+
+def _is_subtype(t: type, cls: type) -> bool:
+    """Whether instances of t pass _is_instance(x, cls)."""
+    return issubclass(t, cls) or (cls is float and issubclass(t, int))
+
+
+def _may_match_type(pattern: Pattern, t: type) -> bool:
+    """Whether pattern can match some instance of exactly type t."""
+    if isinstance(pattern, ConstantPattern):
+        return _is_subtype(t, type(pattern.constant))
+    if isinstance(pattern, AnnotatedPattern):
+        return _is_subtype(t, pattern.cls) and _may_match_type(pattern.pattern, t)
+    if isinstance(pattern, InstancePattern):
+        return _is_subtype(t, pattern.cls)
+    if isinstance(pattern, WalrusPattern):
+        return _may_match_type(pattern.pattern, t)
+    if isinstance(pattern, AlternativesPattern):
+        return any(_may_match_type(p, t) for p in pattern.patterns)
+    if isinstance(pattern, SequencePattern):
+        return t is tuple or t is list or (
+            issubclass(t, cabc.Sequence) and not issubclass(t, (str, bytes))
+        )
+    if isinstance(pattern, MappingPattern):
+        return issubclass(t, cabc.Mapping)
+    return True  # A VariablePattern, or a pattern we know nothing about.
+
+
+def _attribute_constants(pattern: Pattern, fields: Sequence[str]) -> Dict[str, List[object]]:
+    """Attributes an instance pattern requires to equal some constant.
+
+    Maps each attribute name to the constants it may equal, for the
+    positional (named by fields) and keyword subpatterns of pattern.
+    """
+    while isinstance(pattern, WalrusPattern):
+        pattern = pattern.pattern
+    if not isinstance(pattern, InstancePattern) or len(pattern.posargs) > len(fields):
+        return {}
+    names = list(fields[: len(pattern.posargs)]) + list(pattern.kwnames)
+    result: Dict[str, List[object]] = {}
+    for name, p in zip(names, pattern.posargs + pattern.kwpatterns):
+        constants = _constants(p)
+        if constants is not None:
+            result.setdefault(name, constants)
+    return result
+
+
+class _TypeEntry:
+    """The cases that may match instances of one type."""
+
+    __slots__ = ("candidates", "attribute", "buckets", "others")
+
+    def __init__(self, cases: Sequence[Pattern], t: type, x: object):
+        self.candidates = [i for i, case in enumerate(cases) if _may_match_type(case, t)]
+        self.attribute: Optional[str] = None
+        # Attribute value -> candidates; others is for any other value.
+        self.buckets: Dict[object, List[int]] = {}
+        self.others = self.candidates
+        required: Dict[int, Dict[str, List[object]]] = {}
+        if any(isinstance(cases[i], (InstancePattern, WalrusPattern)) for i in self.candidates):
+            try:
+                fields = _positional_fields(x)
+            except TypeError:  # Not a dataclass; instance patterns will raise.
+                return
+            required = {i: _attribute_constants(cases[i], fields) for i in self.candidates}
+        # Discriminate on the attribute the most candidates constrain.
+        counts: Dict[str, int] = {}
+        for constraints in required.values():
+            for name in constraints:
+                counts[name] = counts.get(name, 0) + 1
+        if not counts:
+            return
+        attribute = max(counts, key=counts.__getitem__)  # Earliest of the most common.
+        self.attribute = attribute
+        self.others = [i for i in self.candidates if attribute not in required[i]]
+        for i in self.candidates:
+            for c in required[i].get(attribute, ()):
+                self.buckets.setdefault(c, [])
+        for key, bucket in self.buckets.items():
+            bucket.extend(
+                i
+                for i in self.candidates
+                if attribute not in required[i] or key in required[i][attribute]
+            )
+
+    def lookup(self, x: object) -> List[int]:
+        if self.attribute is None:
+            return self.candidates
+        value = getattr(x, self.attribute, _MISSING)
+        try:
+            return self.buckets.get(value, self.others)
+        except TypeError:  # Unhashable, so it equals no constant.
+            return self.others
+
+
+_MISSING = object()
+
+
+class TypeDispatch:
+    """Match a subject against many cases, mostly instance patterns.
+
+    The cases that can match a subject are found from ``type(x)``
+    alone, once per type: a case is a candidate if the classes it
+    requires (of instance and annotated patterns and constants, the
+    sequence and mapping ABCs) are in the type's MRO.  Among those,
+    if instance patterns require an attribute to equal a constant
+    (such as an operator name in the first positional field), the
+    attribute most of them constrain is looked up in a dict of
+    constants to narrow the candidates further.  Subjects of unrelated
+    types are rejected without trying any case.
+
+    Like the sequence check in patma, this assumes isinstance(x, cls)
+    depends only on type(x); the per-type cache is dropped when an ABC
+    registration changes.
+    """
+
+    def __init__(self, cases: Sequence[Pattern]):
+        self.cases = tuple(cases)
+        self._entries: Tuple[object, Dict[type, _TypeEntry]] = (abc.get_cache_token(), {})
+
+    def _entry(self, x: object) -> _TypeEntry:
+        token, entries = self._entries
+        if token != abc.get_cache_token():
+            entries = {}
+            self._entries = (abc.get_cache_token(), entries)
+        t = type(x)
+        entry = entries.get(t)
+        if entry is None:
+            entry = entries[t] = _TypeEntry(self.cases, t, x)
+        return entry
+
+    def candidates(self, x: object) -> List[int]:
+        """Indices of the cases that might match x."""
+        return list(self._entry(x).lookup(x))
+
+    def match_first(self, x: object) -> Optional[CaseMatch]:
+        cases = self.cases
+        for i in self._entry(x).lookup(x):
+            match = cases[i].match(x)
+            if match is not None:
+                return i, match
+        return None
+
+    def match_all(self, x: object) -> List[CaseMatch]:
+        """All matching cases, in case order."""
+        result = []
+        for i in self._entry(x).lookup(x):
+            match = self.cases[i].match(x)
+            if match is not None:
+                result.append((i, match))
+        return result
@@ -0,0 +1,230 @@
+# mypy: disallow-untyped-defs
+"""Explain why a subject does or doesn't match a pattern.
+
+``explain(pattern, x)`` matches like ``pattern.match(x)``, but with a
+separate, instrumented engine that records a trace of every pattern it
+visited, so the regular match() code stays untouched.  Each trace node
+says where in the subject it looked (written like a translate()
+target, e.g. ``x[0]['key'].attr``) and, if it failed, which check
+failed: ``type``, ``length``, ``key``, ``attribute``, ``fields``,
+``constant`` or ``alternatives``.
+"""
+
+import collections.abc as cabc
+import dataclasses
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from patma import (
+    AlternativesPattern,
+    AnnotatedPattern,
+    ConstantPattern,
+    InstancePattern,
+    MappingPattern,
+    Pattern,
+    SequencePattern,
+    VariablePattern,
+    WalrusPattern,
+    _is_instance,
+    _is_sequence,
+    _positional_fields,
+)
+
+__all__ = ["Trace", "Explanation", "explain", "explain_cases"]
+
+
+@dataclasses.dataclass
+class Trace:
+    """One pattern visited while matching, with its subpatterns."""
+
+    pattern: Pattern
+    subject: object
+    path: str
+    matched: bool = False
+    check: Optional[str] = None  # The failed check, if it failed here.
+    reason: str = ""
+    children: List["Trace"] = dataclasses.field(default_factory=list)
+
+    def failure(self) -> Optional["Trace"]:
+        """The trace node of the first failing check, if any."""
+        node = self
+        while not node.matched and node.check is None and node.children:
+            node = node.children[-1]  # Matching stops at the first failure.
+        return None if node.matched else node
+
+    def format(self, indent: str = "") -> str:
+        if self.matched:
+            status = "ok"
+        elif self.check is None:
+            status = "FAIL"  # A subpattern failed.
+        else:
+            status = f"FAIL ({self.check}: {self.reason})"
+        lines = [f"{indent}{self.path}: {_describe(self.pattern)} {status}"]
+        for child in self.children:
+            lines.append(child.format(indent + "  "))
+        return "\n".join(lines)
+
+
+@dataclasses.dataclass
+class Explanation:
+    """The result of explain()."""
+
+    trace: Trace
+    bindings: Optional[Dict[str, object]]
+
+    @property
+    def matched(self) -> bool:
+        return self.bindings is not None
+
+    @property
+    def failure(self) -> Optional[Trace]:
+        return self.trace.failure()
+
+    def __str__(self) -> str:
+        return self.trace.format()
+
+
+def _describe(pattern: Pattern) -> str:
+    name = type(pattern).__name__
+    if isinstance(pattern, ConstantPattern):
+        return f"{name}({pattern.constant!r})"
+    if isinstance(pattern, (VariablePattern, WalrusPattern)):
+        return f"{name}({pattern.name!r})"
+    if isinstance(pattern, (AnnotatedPattern, InstancePattern)):
+        return f"{name}({pattern.cls.__qualname__})"
+    return name
+
+
+def _fail(trace: Trace, check: str, reason: str) -> None:
+    trace.check = check
+    trace.reason = reason
+
+
+def _explain(
+    pattern: Pattern, x: object, path: str, parent: Optional[Trace]
+) -> Tuple[Trace, Optional[Dict[str, object]]]:
+    trace = Trace(pattern, x, path)
+    if parent is not None:
+        parent.children.append(trace)
+    match = _explain_node(pattern, x, trace)
+    trace.matched = match is not None
+    return trace, match
+
+
+def _explain_node(pattern: Pattern, x: object, trace: Trace) -> Optional[Dict[str, object]]:
+    path = trace.path
+    if isinstance(pattern, ConstantPattern):
+        if not _is_instance(x, type(pattern.constant)):
+            _fail(trace, "type", f"{type(x).__name__} is not {type(pattern.constant).__name__}")
+            return None
+        if x != pattern.constant:
+            _fail(trace, "constant", f"{x!r} != {pattern.constant!r}")
+            return None
+        return {}
+
+    if isinstance(pattern, VariablePattern):
+        return {pattern.name: x}
+
+    if isinstance(pattern, AnnotatedPattern):
+        if not _is_instance(x, pattern.cls):
+            _fail(trace, "type", f"{type(x).__name__} is not {pattern.cls.__name__}")
+            return None
+        return _explain(pattern.pattern, x, path, trace)[1]
+
+    if isinstance(pattern, WalrusPattern):
+        match = _explain(pattern.pattern, x, path, trace)[1]
+        if match is not None:
+            match[pattern.name] = x
+        return match
+
+    if isinstance(pattern, AlternativesPattern):
+        for p in pattern.patterns:
+            match = _explain(p, x, path, trace)[1]
+            if match is not None:
+                return match
+        _fail(trace, "alternatives", f"none of {len(pattern.patterns)} alternatives matched")
+        return None
+
+    matches: Dict[str, object] = {}
+
+    if isinstance(pattern, SequencePattern):
+        if not (type(x) is tuple or type(x) is list or _is_sequence(x)):
+            _fail(trace, "type", f"{type(x).__name__} is not a sequence")
+            return None
+        if len(x) != len(pattern.patterns):  # type: ignore
+            _fail(trace, "length", f"length {len(x)} != {len(pattern.patterns)}")  # type: ignore
+            return None
+        for i, (p, item) in enumerate(zip(pattern.patterns, x)):  # type: ignore
+            match = _explain(p, item, f"{path}[{i}]", trace)[1]
+            if match is None:
+                return None
+            matches.update(match)
+        return matches
+
+    if isinstance(pattern, MappingPattern):
+        if not isinstance(x, cabc.Mapping):
+            _fail(trace, "type", f"{type(x).__name__} is not a mapping")
+            return None
+        for key, p in zip(pattern.keys, pattern.values):
+            try:
+                value = x[key]
+            except KeyError:
+                _fail(trace, "key", f"missing key {key!r}")
+                return None
+            match = _explain(p, value, f"{path}[{key!r}]", trace)[1]
+            if match is None:
+                return None
+            matches.update(match)
+        return matches
+
+    if isinstance(pattern, InstancePattern):
+        if not _is_instance(x, pattern.cls):
+            _fail(trace, "type", f"{type(x).__name__} is not {pattern.cls.__name__}")
+            return None
+        fields = _positional_fields(x)
+        if len(pattern.posargs) > len(fields):
+            _fail(
+                trace,
+                "fields",
+                f"{len(pattern.posargs)} positional patterns but {len(fields)} fields",
+            )
+            return None
+        names = fields[: len(pattern.posargs)] + pattern.kwnames
+        missing = object()
+        for name, p in zip(names, pattern.posargs + pattern.kwpatterns):
+            value = getattr(x, name, missing)
+            if value is missing:
+                _fail(trace, "attribute", f"missing attribute {name!r}")
+                return None
+            match = _explain(p, value, f"{path}.{name}", trace)[1]
+            if match is None:
+                return None
+            matches.update(match)
+        return matches
+
+    # A Pattern subclass we know nothing about.
+    match = pattern.match(x)
+    if match is None:
+        _fail(trace, "match", f"{type(pattern).__name__}.match() returned None")
+    return match
+
+
+def explain(pattern: Pattern, x: object, target: str = "x") -> Explanation:
+    """Match x against pattern, recording a Trace of how it went.
+
+    The bindings are the same as pattern.match(x) returns.
+    """
+    trace, match = _explain(pattern, x, target, None)
+    return Explanation(trace, match)
+
+
+def explain_cases(
+    cases: Sequence[Pattern], x: object, target: str = "x"
+) -> List[Explanation]:
+    """Explain each case in turn, up to and including the first match."""
+    result = []
+    for case in cases:
+        explanation = explain(case, x, target)
+        result.append(explanation)
+        if explanation.matched:
+            break
+    return result
@@ -0,0 +1,497 @@
+# mypy: disallow-untyped-defs
+"""Differential fuzzing of the match engines against each other.
+
+Generates random case lists and subjects (many built to match, some
+not), runs every engine on them and checks that each returns exactly
+what ``match_first()`` over ``Pattern.match()`` returns: the same case
+index and the same bindings, with the same types.  It also times each
+engine, to compare their speed on the same workload.
+
+Run it with ``python patma_fuzz.py [--seed N] [--rounds N] ...``; a
+mismatch is reported with the seed and round that reproduce it.  Only
+the standard library is used.
+
+Engines (see ENGINES):
+
+- ``match``: ``match_first()``, the reference.
+- ``batch``: ``match_batch()`` over all subjects at once.
+- ``explain``: ``explain_cases()``.
+- ``optimized``: ``match_first()`` after ``patma_optimize.optimize()``.
+- ``trie``: ``SequenceTrie``.
+- ``types``: ``TypeDispatch``.
+- ``table``: ``PatternTable.from_patterns()``.
+- ``table_bytes``: ``loads(dumps(cases))``.
+- ``native``: ``compile_native()``, on Python 3.10+.
+- ``translate``: ``Pattern.translate()``, compared like ``checks()`` in
+  test_patma.py and only on the cases it supports; it doesn't follow
+  the int->float rule for annotations, nor support instance patterns,
+  bool, bytes, complex or enum constants, or empty sequence and mapping
+  patterns, and it doesn't see the keys a ``__missing__`` method
+  supplies (so subjects with a MissingZero aren't translated).
+"""
+
+import argparse
+import collections
+import collections.abc as cabc
+import dataclasses
+import enum
+import random
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from patma import (
+    AlternativesPattern,
+    AnnotatedPattern,
+    CaseMatch,
+    ConstantPattern,
+    InstancePattern,
+    MappingPattern,
+    Pattern,
+    SequencePattern,
+    VariablePattern,
+    WalrusPattern,
+    match_batch,
+    match_first,
+)
+
+__all__ = [
+    "PatternGenerator",
+    "Mismatch",
+    "ENGINES",
+    "fuzz",
+    "show",
+    "main",
+]
+
+
+class Color(enum.Enum):
+    RED = 1
+    GREEN = 2
+
+
+@dataclasses.dataclass
+class Point:
+    x: object
+    y: object
+
+
+@dataclasses.dataclass
+class Point3(Point):
+    z: object = None
+
+
+class MissingZero(dict):
+    """A dict whose missing keys read as 0, like a defaultdict that
+    doesn't insert them (so matching can't change the subject)."""
+
+    def __missing__(self, key: object) -> int:
+        return 0
+
+    def __repr__(self) -> str:
+        return f"MissingZero({dict.__repr__(self)})"
+
+
+class Record(cabc.Mapping):
+    """A Mapping that isn't a dict."""
+
+    def __init__(self, items: Dict[object, object]):
+        self._items = dict(items)
+
+    def __getitem__(self, key: object) -> object:
+        return self._items[key]
+
+    def __iter__(self) -> Iterator[object]:
+        return iter(self._items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __repr__(self) -> str:
+        return f"Record({self._items!r})"
+
+
+CONSTANTS: List[object] = [
+    0, 1, 2, 1.0, 2.5, 1j, 1 + 0j, True, False, None, "a", "b", "", b"a", Color.RED, Color.GREEN
+]
+NAMES = ["a", "b", "c", "d", "_"]
+CLASSES: List[type] = [int, float, complex, bool, str, tuple, list, dict, Point, Point3, object]
+KEYS: List[object] = ["k", "l", 1, 2.0]
+FIELDS = ["x", "y", "z", "w"]
+
+
+class PatternGenerator:
+    """Random Pattern trees, and subjects likely to match them."""
+
+    def __init__(self, rng: random.Random, max_depth: int = 3, mutation: float = 0.1):
+        self.rng = rng
+        self.max_depth = max_depth
+        self.mutation = mutation
+
+    def pattern(self, depth: int = 0) -> Pattern:
+        rng = self.rng
+        if depth >= self.max_depth or rng.random() < 0.3:
+            r = rng.random()
+            if r < 0.5:
+                return ConstantPattern(rng.choice(CONSTANTS))
+            if r < 0.8:
+                return VariablePattern(rng.choice(NAMES))
+            return AnnotatedPattern(VariablePattern(rng.choice(NAMES)), rng.choice(CLASSES))
+        depth += 1
+        r = rng.random()
+        if r < 0.3:
+            return SequencePattern([self.pattern(depth) for _ in range(rng.randrange(4))])
+        if r < 0.45:
+            keys = rng.sample(KEYS, rng.randrange(3))
+            return MappingPattern({k: self.pattern(depth) for k in keys})
+        if r < 0.6:
+            return AlternativesPattern([self.pattern(depth) for _ in range(rng.randrange(1, 4))])
+        if r < 0.7:
+            return WalrusPattern(rng.choice(NAMES), self.pattern(depth))
+        if r < 0.85:
+            cls = rng.choice([Point, Point3])
+            posargs = [self.pattern(depth) for _ in range(rng.randrange(3))]
+            kwnames = rng.sample(FIELDS, rng.randrange(2))
+            return InstancePattern(cls, posargs, {k: self.pattern(depth) for k in kwnames})
+        return AnnotatedPattern(self.pattern(depth), rng.choice(CLASSES))
+
+    def cases(self, n: int) -> List[Pattern]:
+        return [self.pattern() for _ in range(n)]
+
+    def subject(self, depth: int = 0) -> object:
+        """A random subject."""
+        rng = self.rng
+        r = rng.random()
+        if depth >= self.max_depth or r < 0.5:
+            return rng.choice(CONSTANTS + [3, 1.5, 2j, "ab", b"ab", Point(1, 2)])
+        depth += 1
+        if r < 0.7:
+            items = [self.subject(depth) for _ in range(rng.randrange(4))]
+            return tuple(items) if rng.random() < 0.5 else items
+        if r < 0.85:
+            return self.mapping({k: self.subject(depth) for k in rng.sample(KEYS, rng.randrange(3))})
+        return Point(self.subject(depth), self.subject(depth))
+
+    def mapping(self, items: Dict[object, object]) -> object:
+        """items as a dict, mostly, or as another kind of Mapping.
+
+        A defaultdict gains the keys matching looks up, so it's the
+        MissingZero subjects that catch engines getting missing keys
+        differently.
+        """
+        r = self.rng.random()
+        if r < 0.6:
+            return items
+        if r < 0.7:
+            return collections.OrderedDict(items)
+        if r < 0.8:
+            return collections.defaultdict(int, items)
+        if r < 0.9:
+            return MissingZero(items)
+        return Record(items)
+
+    def subject_for(self, pattern: Pattern, depth: int = 0) -> object:
+        """A subject built to match pattern, with a few mutations."""
+        rng = self.rng
+        if rng.random() < self.mutation:
+            return self.subject(depth)
+        if isinstance(pattern, ConstantPattern):
+            c = pattern.constant
+            if rng.random() < 0.2 and isinstance(c, (int, float)):
+                return rng.choice([int(c), float(c), bool(c), complex(c)])  # Equal, other type.
+            return c
+        if isinstance(pattern, (AnnotatedPattern, WalrusPattern)):
+            return self.subject_for(pattern.pattern, depth)
+        if isinstance(pattern, AlternativesPattern):
+            if not pattern.patterns:
+                return self.subject(depth)
+            return self.subject_for(rng.choice(pattern.patterns), depth)
+        if isinstance(pattern, SequencePattern):
+            items = [self.subject_for(p, depth + 1) for p in pattern.patterns]
+            return tuple(items) if rng.random() < 0.5 else items
+        if isinstance(pattern, MappingPattern):
+            result = {k: self.subject_for(p, depth + 1) for k, p in zip(pattern.keys, pattern.values)}
+            if rng.random() < 0.3:
+                result["extra"] = self.subject(depth + 1)
+            return self.mapping(result)
+        if isinstance(pattern, InstancePattern):
+            fields = [f.name for f in dataclasses.fields(pattern.cls)]
+            values = {f: self.subject(depth + 1) for f in fields}
+            for name, p in zip(fields, pattern.posargs):
+                values[name] = self.subject_for(p, depth + 1)
+            instance = pattern.cls(**values)
+            for name, p in zip(pattern.kwnames, pattern.kwpatterns):
+                object.__setattr__(instance, name, self.subject_for(p, depth + 1))
+            return instance
+        return self.subject(depth)
+
+    def subjects(self, cases: Sequence[Pattern], n: int) -> List[object]:
+        result: List[object] = []
+        for _ in range(n):
+            r = self.rng.random()
+            if r < 0.6 and cases:
+                result.append(self.subject_for(self.rng.choice(cases)))
+            elif r < 0.95:
+                result.append(self.subject())
+            else:
+                result.append(bytearray(b"ab"))
+        return result
+
+
+# An engine compiles a case list into a function matching a list of
+# subjects, returning what match_first() would for each.
+Engine = Callable[[Sequence[Pattern]], Callable[[Sequence[object]], List[Optional[CaseMatch]]]]
+
+
+def _match_engine(cases: Sequence[Pattern]) -> Callable[[Sequence[object]], List[Optional[CaseMatch]]]:
+    return lambda subjects: [match_first(cases, x) for x in subjects]
+
+
+def _optimized_engine(cases: Sequence[Pattern]) -> Callable[[Sequence[object]], List[Optional[CaseMatch]]]:
+    from patma_optimize import optimize
+
+    optimized = [optimize(case) for case in cases]
+    return lambda subjects: [match_first(optimized, x) for x in subjects]
+
+
+def _batch_engine(cases: Sequence[Pattern]) -> Callable[[Sequence[object]], List[Optional[CaseMatch]]]:
+    return lambda subjects: match_batch(cases, subjects)
+
+
+def _explain_engine(cases: Sequence[Pattern]) -> Callable[[Sequence[object]], List[Optional[CaseMatch]]]:
+    from patma_explain import explain_cases
+
+    def run(subjects: Sequence[object]) -> List[Optional[CaseMatch]]:
+        results: List[Optional[CaseMatch]] = []
+        for x in subjects:
+            explanations = explain_cases(cases, x)
+            last = explanations[-1] if explanations else None
+            if last is not None and last.bindings is not None:
+                results.append((len(explanations) - 1, last.bindings))
+            else:
+                results.append(None)
+        return results
+
+    return run
+
+
+def _first_engine(compile: Callable[[Sequence[Pattern]], object]) -> Engine:
+    """An engine for compilers of objects with a match_first() method."""
+
+    def engine(cases: Sequence[Pattern]) -> Callable[[Sequence[object]], List[Optional[CaseMatch]]]:
+        match = compile(cases).match_first  # type: ignore
+        return lambda subjects: [match(x) for x in subjects]
+
+    return engine
+
+
+def _trie(cases: Sequence[Pattern]) -> object:
+    from patma_dispatch import SequenceTrie
+
+    return SequenceTrie(cases)
+
+
+def _type_dispatch(cases: Sequence[Pattern]) -> object:
+    from patma_dispatch import TypeDispatch
+
+    return TypeDispatch(cases)
+
+
+def _table(cases: Sequence[Pattern]) -> object:
+    from patma_table import PatternTable
+
+    return PatternTable.from_patterns(cases)
+
+
+def _table_bytes(cases: Sequence[Pattern]) -> object:
+    from patma_table import dumps, loads
+
+    return loads(dumps(cases), validate=False)  # Random cases bind inconsistently.
+
+
+def _native(cases: Sequence[Pattern]) -> object:
+    from patma_native import compile_native
+
+    return compile_native(cases)
+
+
+_MISSING = object()
+
+
+def _translatable(pattern: Pattern) -> bool:
+    """Whether translate() is expected to agree with match()."""
+    if isinstance(pattern, ConstantPattern):
+        c = pattern.constant
+        return not isinstance(c, (bool, bytes, complex, enum.Enum))
+    if isinstance(pattern, VariablePattern):
+        return True
+    if isinstance(pattern, AnnotatedPattern):
+        return pattern.cls is not float and _translatable(pattern.pattern)
+    if isinstance(pattern, WalrusPattern):
+        return _translatable(pattern.pattern)
+    if isinstance(pattern, AlternativesPattern):
+        return all(_translatable(p) for p in pattern.patterns)
+    if isinstance(pattern, SequencePattern):
+        return bool(pattern.patterns) and all(_translatable(p) for p in pattern.patterns)
+    if isinstance(pattern, MappingPattern):
+        return bool(pattern.values) and all(_translatable(p) for p in pattern.values)
+    return False
+
+
+def _has_missing(x: object) -> bool:
+    """Whether x contains a MissingZero."""
+    if isinstance(x, MissingZero):
+        return True
+    if isinstance(x, (tuple, list)):
+        return any(map(_has_missing, x))
+    if isinstance(x, cabc.Mapping):
+        return any(map(_has_missing, x.values()))
+    if isinstance(x, Point):
+        return any(_has_missing(getattr(x, f.name)) for f in dataclasses.fields(x))
+    return False
+
+
+def _translate_engine(cases: Sequence[Pattern]) -> Callable[[Sequence[object]], List[Optional[CaseMatch]]]:
+    """Evaluate translate() for each case, where supported.
+
+    Cases translate() doesn't support are matched with match(), so the
+    case numbering stays the same.  Like checks() in test_patma.py,
+    only the bound names match() reports are compared, since failed
+    alternatives may leave other names behind.
+    """
+    compiled = [
+        compile(case.translate("X"), "<translate>", "eval") if _translatable(case) else None
+        for case in cases
+    ]
+    module = sys.modules[__name__]
+
+    def run(subjects: Sequence[object]) -> List[Optional[CaseMatch]]:
+        results: List[Optional[CaseMatch]] = []
+        for x in subjects:
+            result: Optional[CaseMatch] = None
+            plain = not _has_missing(x)
+            for i, (case, code) in enumerate(zip(cases, compiled)):
+                if code is None or not plain:
+                    match = case.match(x)
+                else:
+                    ns: Dict[str, object] = {
+                        "X": x,
+                        "Sequence": cabc.Sequence,
+                        "Mapping": cabc.Mapping,
+                        "_Nope": object(),
+                        module.__name__: module,
+                    }
+                    if not eval(code, ns):
+                        continue
+                    expected = case.match(x)
+                    if expected is None:
+                        match = {"<translate() matched>": x}  # Can't be right.
+                    else:
+                        match = {k: ns.get(k, _MISSING) for k in expected}
+                if match is not None:
+                    result = (i, match)
+                    break
+            results.append(result)
+        return results
+
+    return run
+
+
+ENGINES: Dict[str, Engine] = {
+    "match": _match_engine,
+    "batch": _batch_engine,
+    "explain": _explain_engine,
+    "optimized": _optimized_engine,
+    "trie": _first_engine(_trie),
+    "types": _first_engine(_type_dispatch),
+    "table": _first_engine(_table),
+    "table_bytes": _first_engine(_table_bytes),
+    "translate": _translate_engine,
+}
+if sys.version_info >= (3, 10):
+    ENGINES["native"] = _first_engine(_native)
+
+
+class Mismatch(AssertionError):
+    """An engine disagreed with match_first()."""
+
+
+def _same(a: object, b: object) -> bool:
+    """Equal, with the same types all the way down."""
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_same(v, b[k]) for k, v in a.items())  # type: ignore
+    if isinstance(a, (tuple, list)):
+        return len(a) == len(b) and all(_same(u, v) for u, v in zip(a, b))  # type: ignore
+    return a is b or a == b
+
+
+def show(obj: object) -> str:
+    """A readable repr of patterns, to report mismatches."""
+    if isinstance(obj, Pattern):
+        return f"{type(obj).__name__}({', '.join(show(a) for a in obj._args())})"
+    if isinstance(obj, (list, tuple)):
+        return "[" + ", ".join(show(item) for item in obj) + "]"
+    if isinstance(obj, dict):
+        return "{" + ", ".join(f"{k!r}: {show(v)}" for k, v in obj.items()) + "}"
+    if isinstance(obj, type):
+        return obj.__qualname__
+    return repr(obj)
+
+
+def fuzz(
+    seed: int = 0,
+    rounds: int = 100,
+    ncases: int = 8,
+    nsubjects: int = 50,
+    engines: Optional[Sequence[str]] = None,
+) -> Dict[str, Tuple[float, float]]:
+    """Run the engines on random workloads.
+
+    Returns the seconds each engine spent compiling and matching.
+    Raises Mismatch on the first disagreement with match_first().
+    """
+    names = list(engines or ENGINES)
+    times = {name: [0.0, 0.0] for name in names}
+    for round in range(rounds):
+        rng = random.Random(f"{seed}-{round}")
+        generator = PatternGenerator(rng)
+        cases = generator.cases(rng.randrange(1, ncases + 1))
+        subjects = generator.subjects(cases, nsubjects)
+        expected = [match_first(cases, x) for x in subjects]
+        for name in names:
+            start = time.perf_counter()
+            run = ENGINES[name](cases)
+            compiled = time.perf_counter()
+            results = run(subjects)
+            times[name][0] += compiled - start
+            times[name][1] += time.perf_counter() - compiled
+            for x, want, got in zip(subjects, expected, results):
+                if not _same(want, got):
+                    raise Mismatch(
+                        f"seed {seed} round {round}: engine {name!r} returned {got!r}"
+                        f" instead of {want!r}\n  subject: {x!r}\n  cases: {show(cases)}"
+                    )
+    return {name: (compiling, matching) for name, (compiling, matching) in times.items()}
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--cases", type=int, default=8, help="maximum cases per round")
+    parser.add_argument("--subjects", type=int, default=100, help="subjects per round")
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES), default=list(ENGINES))
+    args = parser.parse_args(argv)
+    times = fuzz(args.seed, args.rounds, args.cases, args.subjects, args.engines)
+    base = times["match"][1] if "match" in times else None
+    print(f"{args.rounds} rounds agreed.")
+    print(f"  {'engine':12} {'compile':>9} {'match':>9}")
+    for name, (compiling, matching) in sorted(times.items(), key=lambda item: item[1][1]):
+        relative = f"  {matching / base:6.2f}x match" if base else ""
+        print(f"  {name:12} {compiling:8.3f}s {matching:8.3f}s{relative}")
+
+
+if __name__ == "__main__":
+    main()
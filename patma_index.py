@@ -0,0 +1,258 @@
+# mypy: disallow-untyped-defs
+"""A collection of objects indexed for pattern queries.
+
+``IndexedCollection`` holds objects (such as dataclass instances) and
+answers ``query(pattern)``, which gives the same result as
+``[o for o in objects if pattern.match(o) is not None]`` without
+matching every object.
+
+Patterns are searched for constant leaves every match must satisfy,
+such as ``"paid"`` in ``Order(status="paid")``, each at a path of
+attribute names and keys leading to it from the subject (``status``
+here).  Paths can be indexed: an index is a dict from the value found
+at the path to the objects with that value.  A query looks up the
+constants of its indexed leaves, intersects the results, and only
+matches the remaining candidates in full.
+
+Indexes are declared with ``add_index()``, or created automatically for
+paths that have been queried ``auto_index`` times.  They are updated
+as objects are added and removed; an object whose indexed values
+change must be passed to ``update()``.
+"""
+
+import dataclasses
+from typing import Dict, Iterable, Iterator, List, Set, Tuple, Union
+
+from patma import (
+    AnnotatedPattern,
+    InstancePattern,
+    MappingPattern,
+    Pattern,
+    SequencePattern,
+    WalrusPattern,
+)
+from patma_dispatch import _constants
+
+__all__ = ["IndexedCollection", "Key", "leaves"]
+
+
+class Key:
+    """A path step looking up a mapping key or sequence index."""
+
+    __slots__ = ("key",)
+
+    def __init__(self, key: object):
+        self.key = key
+
+    def __eq__(self, other: object) -> bool:
+        return (
+            isinstance(other, Key)
+            and type(self.key) is type(other.key)
+            and self.key == other.key
+        )
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def __repr__(self) -> str:
+        return f"Key({self.key!r})"
+
+
+# A path step is an attribute name or a Key.
+Path = Tuple[Union[str, Key], ...]
+
+_MISSING = object()
+
+
+def _get(x: object, path: Path) -> object:
+    """The value at path from x, or _MISSING."""
+    for step in path:
+        if isinstance(step, str):
+            x = getattr(x, step, _MISSING)
+            if x is _MISSING:
+                return x
+        else:
+            try:
+                x = x[step.key]  # type: ignore
+            except (KeyError, IndexError, TypeError):
+                return _MISSING
+    return x
+
+
+def leaves(pattern: Pattern, path: Path = ()) -> Iterator[Tuple[Path, List[object]]]:
+    """The constant leaves of pattern that every match must satisfy.
+
+    Yields (path, constants) pairs: a subject can only match if the
+    value at path equals one of the constants.
+    """
+    if isinstance(pattern, (AnnotatedPattern, WalrusPattern)):
+        yield from leaves(pattern.pattern, path)
+        return
+    constants = _constants(pattern)
+    if constants is not None:
+        yield path, constants
+    elif isinstance(pattern, SequencePattern):
+        for i, p in enumerate(pattern.patterns):
+            yield from leaves(p, path + (Key(i),))
+    elif isinstance(pattern, MappingPattern):
+        for key, p in zip(pattern.keys, pattern.values):
+            yield from leaves(p, path + (Key(key),))
+    elif isinstance(pattern, InstancePattern):
+        names: List[str] = []
+        if isinstance(pattern.cls, type) and dataclasses.is_dataclass(pattern.cls):
+            fields = [f.name for f in dataclasses.fields(pattern.cls)]
+            if len(pattern.posargs) <= len(fields):
+                names = fields[: len(pattern.posargs)]
+        for name, p in zip(names, pattern.posargs):  # Nothing if not a dataclass.
+            yield from leaves(p, path + (name,))
+        for name, p in zip(pattern.kwnames, pattern.kwpatterns):
+            yield from leaves(p, path + (name,))
+
+
+class _Index:
+    """The objects of a collection by their value at a path."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.values: Dict[int, object] = {}  # Serial number -> value.
+        self.buckets: Dict[object, Dict[int, None]] = {}  # Value -> serial numbers.
+
+    def add(self, serial: int, x: object) -> None:
+        value = _get(x, self.path)
+        if value is _MISSING:
+            return  # Can't match a pattern with a leaf at this path.
+        try:
+            bucket = self.buckets.setdefault(value, {})
+        except TypeError:
+            return  # Unhashable, so equal to no constant.
+        bucket[serial] = None
+        self.values[serial] = value
+
+    def remove(self, serial: int) -> None:
+        value = self.values.pop(serial, _MISSING)
+        if value is not _MISSING:
+            bucket = self.buckets[value]
+            del bucket[serial]
+            if not bucket:
+                del self.buckets[value]
+
+    def lookup(self, constants: List[object]) -> Set[int]:
+        result: Set[int] = set()
+        for c in constants:
+            bucket = self.buckets.get(c)
+            if bucket is not None:
+                result.update(bucket)
+        return result
+
+
+class IndexedCollection:
+    """Objects, with indexes for answering pattern queries.
+
+    Objects are kept in insertion order and compared by identity.
+    indexes are paths to index up front; auto_index is the number of
+    queries with a leaf at a path after which that path is indexed (0
+    to only use declared indexes).
+    """
+
+    def __init__(
+        self,
+        objects: Iterable[object] = (),
+        indexes: Iterable[Path] = (),
+        auto_index: int = 2,
+    ):
+        self.auto_index = auto_index
+        self._objects: Dict[int, object] = {}  # Serial number -> object.
+        self._serials: Dict[int, int] = {}  # id(object) -> serial number.
+        self._next = 0
+        self._indexes: Dict[Path, _Index] = {}
+        self._queried: Dict[Path, int] = {}  # Queries per unindexed path.
+        for path in indexes:
+            self.add_index(*path)
+        for x in objects:
+            self.add(x)
+
+    def __len__(self) -> int:
+        return len(self._objects)
+
+    def __iter__(self) -> Iterator[object]:
+        return iter(list(self._objects.values()))
+
+    def __contains__(self, x: object) -> bool:
+        return id(x) in self._serials
+
+    def add(self, x: object) -> None:
+        if id(x) in self._serials:
+            raise ValueError("Object already in collection")
+        serial = self._next
+        self._next += 1
+        self._objects[serial] = x
+        self._serials[id(x)] = serial
+        for index in self._indexes.values():
+            index.add(serial, x)
+
+    def remove(self, x: object) -> None:
+        serial = self._serials.pop(id(x), None)
+        if serial is None:
+            raise ValueError("Object not in collection")
+        del self._objects[serial]
+        for index in self._indexes.values():
+            index.remove(serial)
+
+    def update(self, x: object) -> None:
+        """Reindex x after its indexed values changed."""
+        serial = self._serials.get(id(x))
+        if serial is None:
+            raise ValueError("Object not in collection")
+        for index in self._indexes.values():
+            index.remove(serial)
+            index.add(serial, x)
+
+    def add_index(self, *path: Union[str, Key]) -> None:
+        """Index the values at path, e.g. add_index("address", Key("city"))."""
+        if path in self._indexes:
+            return
+        index = _Index(path)
+        for serial, x in self._objects.items():
+            index.add(serial, x)
+        self._indexes[path] = index
+        self._queried.pop(path, None)
+
+    @property
+    def indexes(self) -> List[Path]:
+        return list(self._indexes)
+
+    def _candidates(self, pattern: Pattern) -> Iterable[object]:
+        found: List[Set[int]] = []
+        counted: Set[Path] = set()
+        for path, constants in leaves(pattern):
+            index = self._indexes.get(path)
+            if index is None and self.auto_index and path not in counted:
+                counted.add(path)
+                count = self._queried[path] = self._queried.get(path, 0) + 1
+                if count >= self.auto_index:
+                    self.add_index(*path)
+                    index = self._indexes[path]
+            if index is not None:
+                found.append(index.lookup(constants))
+        if not found:
+            return self._objects.values()
+        found.sort(key=len)
+        serials = found[0].intersection(*found[1:])
+        return [self._objects[serial] for serial in sorted(serials)]
+
+    def candidates(self, pattern: Pattern) -> List[object]:
+        """The objects the indexes can't rule out for pattern."""
+        return list(self._candidates(pattern))
+
+    def matches(self, pattern: Pattern) -> List[Tuple[object, Dict[str, object]]]:
+        """(object, bindings) for each object matching pattern."""
+        result = []
+        for x in self._candidates(pattern):
+            match = pattern.match(x)
+            if match is not None:
+                result.append((x, match))
+        return result
+
+    def query(self, pattern: Pattern) -> List[object]:
+        """The objects matching pattern, in insertion order."""
+        return [x for x, _ in self.matches(pattern)]
@@ -0,0 +1,377 @@
+# mypy: disallow-untyped-defs
+"""Matching patterns against JSON text without building the document.
+
+``compile_json(pattern)`` turns a Pattern into a projection that runs
+directly on a JSON token stream.  Mapping and sequence patterns are
+followed structurally: only the values under keys (and positions) the
+pattern mentions are materialized, everything else is skipped at the
+character level, and the scan stops as soon as a type, length or
+constant check fails.  Other patterns are applied to the materialized
+value of the position they occupy.
+
+The result is the same as ``pattern.match(json.loads(text))``, with two
+caveats: skipped and unread parts of the document are not validated,
+and for duplicate object keys the first occurrence is used, where
+json.loads keeps the last one.
+"""
+
+import json
+import json.decoder
+import json.scanner
+import re
+from typing import IO, Callable, Dict, List, Optional, Union
+
+from patma import (
+    ConstantPattern,
+    MappingPattern,
+    Pattern,
+    SequencePattern,
+    VariablePattern,
+)
+
+__all__ = ["JSONMatcher", "compile_json", "match_json"]
+
+_WS = re.compile(r"[ \t\n\r]*")
+_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_STRING_PREFIX = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*\\?', re.DOTALL)
+_NUMBER = json.scanner.NUMBER_RE
+_NUMBER_PREFIX = re.compile(r"-?\d*(?:\.\d*)?(?:[eE][-+]?\d*)?")
+_DIGITS = set("0123456789")
+_SKIP = re.compile(r'[^"\[\]{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"\[\]{}]*)*')
+_LITERALS = {
+    "true": True,
+    "false": False,
+    "null": None,
+    "NaN": float("nan"),
+    "Infinity": float("inf"),
+    "-Infinity": float("-inf"),
+}
+_MAX_LITERAL = max(map(len, _LITERALS))
+
+
+def _container_regex(depth: int) -> "re.Pattern[str]":
+    """Build a regex matching a container nested at most depth levels.
+
+    This lets the regex engine skip whole containers without a Python
+    level step per bracket.  Brackets aren't checked to pair up.
+    """
+    plain = r'[^"\[\]{}]*'
+    alternatives = _STRING.pattern
+    for _ in range(depth):
+        container = rf"[\[{{]{plain}(?:(?:{alternatives}){plain})*[\]}}]"
+        alternatives = f"{_STRING.pattern}|{container}"
+    return re.compile(container, re.DOTALL)
+
+
+_CONTAINER = _container_regex(8)
+
+# First character of the JSON values a constant can possibly equal
+# (bools are ints, and ints match floats).
+_CONSTANT_STARTS = {
+    str: '"',
+    bool: "tf",
+    type(None): "n",
+    int: "-0123456789tf",
+    float: "-0123456789NItf",
+}
+
+
+class _Reject(Exception):
+    """Raised inside a projection as soon as the subject can't match."""
+
+
+class _Lexer:
+    """A JSON scanner over a string or a text file read in chunks."""
+
+    def __init__(self, source: Union[str, IO[str]], chunk_size: int = 65536):
+        if isinstance(source, str):
+            self.buf = source
+            self.file: Optional[IO[str]] = None
+        else:
+            self.buf = ""
+            self.file = source
+        self.pos = 0
+        self.chunk_size = chunk_size
+
+    def _fill(self) -> bool:
+        """Append a chunk to the buffer, dropping the consumed part.
+
+        The chunk is at least as long as the unconsumed text, so a token
+        spanning many chunks is copied a bounded number of times.
+        """
+        if self.file is None:
+            return False
+        chunk = self.file.read(max(self.chunk_size, len(self.buf) - self.pos))
+        if not chunk:
+            self.file = None
+            return False
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def _more(self, partial: "re.Pattern[str]") -> int:
+        """Read on while the token at pos may continue in the next chunk.
+
+        partial matches the longest text that can start a token (e.g.
+        "1" may be followed by ".5" or "e-3"); returns where it ends.
+        """
+        while True:
+            end = partial.match(self.buf, self.pos).end()  # type: ignore
+            if end < len(self.buf) or not self._fill():
+                return end
+
+    def error(self, msg: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(msg, self.buf, self.pos)
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ('' at EOF)."""
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()  # type: ignore
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        c = self.peek()
+        if not c or c not in chars:
+            raise self.error(f"Expecting one of {chars!r}")
+        self.pos += 1
+        return c
+
+    def read_string(self) -> str:
+        self._more(_STRING_PREFIX)
+        if not self.buf.startswith('"', self.pos):
+            raise self.error("Expecting string")
+        value, self.pos = json.decoder.scanstring(  # type: ignore
+            self.buf, self.pos + 1
+        )
+        return value
+
+    def read_scalar(self) -> object:
+        # Numbers and literals are told apart by their first characters,
+        # so a literal never makes the lexer look for a longer number.
+        while len(self.buf) - self.pos < 2 and self._fill():
+            pass
+        start = self.buf[self.pos : self.pos + 2]
+        if start[:1] in _DIGITS or start[:1] == "-" and start != "-I":
+            self._more(_NUMBER_PREFIX)
+            m = _NUMBER.match(self.buf, self.pos)
+            if m is not None:
+                integer, frac, exp = m.groups()
+                self.pos = m.end()
+                if frac or exp:
+                    return float(integer + (frac or "") + (exp or ""))
+                return int(integer)
+            raise self.error("Expecting value")
+        while len(self.buf) - self.pos < _MAX_LITERAL and self._fill():
+            pass
+        for literal, value in _LITERALS.items():
+            if self.buf.startswith(literal, self.pos):
+                self.pos += len(literal)
+                return value
+        raise self.error("Expecting value")
+
+    def read_value(self) -> object:
+        c = self.peek()
+        if c == '"':
+            return self.read_string()
+        if c == "[":
+            self.pos += 1
+            items: List[object] = []
+            if self.peek() == "]":
+                self.pos += 1
+                return items
+            while True:
+                items.append(self.read_value())
+                if self.expect(",]") == "]":
+                    return items
+        if c == "{":
+            self.pos += 1
+            obj: Dict[str, object] = {}
+            if self.peek() == "}":
+                self.pos += 1
+                return obj
+            while True:
+                self.peek()
+                key = self.read_string()
+                self.expect(":")
+                obj[key] = self.read_value()
+                if self.expect(",}") == "}":
+                    return obj
+        return self.read_scalar()
+
+    def skip_value(self) -> None:
+        c = self.peek()
+        if c == '"':
+            self._skip_string()
+            return
+        if c not in ("[", "{"):
+            self.read_scalar()
+            return
+        depth = 0
+        while True:
+            if self.pos < len(self.buf) and self.buf[self.pos] in "[{":
+                m = _CONTAINER.match(self.buf, self.pos)
+                if m is not None:
+                    self.pos = m.end()
+                    if depth == 0:
+                        return
+            self.pos = _SKIP.match(self.buf, self.pos).end()  # type: ignore
+            if self.pos == len(self.buf):
+                if not self._fill():
+                    raise self.error("Unterminated container")
+                continue
+            c = self.buf[self.pos]
+            if c == '"':
+                self._skip_string()
+            elif c in "[{":
+                depth += 1
+                self.pos += 1
+            else:
+                depth -= 1
+                self.pos += 1
+                if depth == 0:
+                    return
+
+    def _skip_string(self) -> None:
+        end = self._more(_STRING_PREFIX)
+        if not self.buf.startswith('"', end):
+            raise self.error("Unterminated string")
+        self.pos = end + 1
+
+
+_Step = Callable[[_Lexer], Dict[str, object]]
+
+
+def _compile(pattern: Pattern) -> _Step:
+    if isinstance(pattern, MappingPattern):
+        return _compile_mapping(pattern)
+    if isinstance(pattern, SequencePattern):
+        return _compile_sequence(pattern)
+    if isinstance(pattern, VariablePattern):
+        name = pattern.name
+        return lambda lexer: {name: lexer.read_value()}
+    if isinstance(pattern, ConstantPattern):
+        starts = _CONSTANT_STARTS.get(type(pattern.constant))
+        if starts is not None:
+            generic = _compile_generic(pattern)
+
+            def constant_step(lexer: _Lexer) -> Dict[str, object]:
+                if lexer.peek() not in starts:
+                    raise _Reject
+                return generic(lexer)
+
+            return constant_step
+    return _compile_generic(pattern)
+
+
+def _compile_generic(pattern: Pattern) -> _Step:
+    def step(lexer: _Lexer) -> Dict[str, object]:
+        match = pattern.match(lexer.read_value())
+        if match is None:
+            raise _Reject
+        return match
+
+    return step
+
+
+def _compile_mapping(pattern: MappingPattern) -> _Step:
+    keys = pattern.keys
+    if not all(isinstance(key, str) for key in keys):
+        # JSON object keys are always strings.
+        def never(lexer: _Lexer) -> Dict[str, object]:
+            raise _Reject
+
+        return never
+    steps = {key: _compile(p) for key, p in zip(pattern.keys, pattern.values)}
+
+    def step(lexer: _Lexer) -> Dict[str, object]:
+        if lexer.peek() != "{":
+            raise _Reject
+        lexer.pos += 1
+        found: Dict[object, Dict[str, object]] = {}
+        if lexer.peek() == "}":
+            lexer.pos += 1
+        else:
+            while True:
+                lexer.peek()
+                key = lexer.read_string()
+                lexer.expect(":")
+                sub = steps.get(key)
+                if sub is None or key in found:
+                    lexer.skip_value()
+                else:
+                    found[key] = sub(lexer)
+                if lexer.expect(",}") == "}":
+                    break
+        if len(found) != len(keys):
+            raise _Reject  # Missing key.
+        matches: Dict[str, object] = {}
+        for k in keys:
+            matches.update(found[k])
+        return matches
+
+    return step
+
+
+def _compile_sequence(pattern: SequencePattern) -> _Step:
+    steps = [_compile(p) for p in pattern.patterns]
+
+    def step(lexer: _Lexer) -> Dict[str, object]:
+        if lexer.peek() != "[":
+            raise _Reject
+        lexer.pos += 1
+        matches: Dict[str, object] = {}
+        count = 0
+        if lexer.peek() == "]":
+            lexer.pos += 1
+        else:
+            while True:
+                if count == len(steps):
+                    raise _Reject  # Too long.
+                matches.update(steps[count](lexer))
+                count += 1
+                if lexer.expect(",]") == "]":
+                    break
+        if count != len(steps):
+            raise _Reject  # Too short.
+        return matches
+
+    return step
+
+
+class JSONMatcher:
+    """A pattern compiled into a projection over JSON text."""
+
+    def __init__(self, pattern: Pattern):
+        self.pattern = pattern
+        self._step = _compile(pattern)
+
+    def match(
+        self, source: Union[str, IO[str]], chunk_size: int = 65536
+    ) -> Optional[Dict[str, object]]:
+        """Match a JSON document given as a string or text file.
+
+        Returns the bindings like Pattern.match(); raises
+        json.JSONDecodeError for malformed input that had to be read.
+        """
+        lexer = _Lexer(source, chunk_size)
+        try:
+            match = self._step(lexer)
+        except _Reject:
+            return None
+        if lexer.peek():
+            raise lexer.error("Extra data")
+        return match
+
+
+def compile_json(pattern: Pattern) -> JSONMatcher:
+    return JSONMatcher(pattern)
+
+
+def match_json(
+    pattern: Pattern, source: Union[str, IO[str]]
+) -> Optional[Dict[str, object]]:
+    """One-shot version of compile_json(pattern).match(source)."""
+    return JSONMatcher(pattern).match(source)
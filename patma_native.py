@@ -0,0 +1,231 @@
+# mypy: disallow-untyped-defs
+"""Compile a list of cases into a native match statement.
+
+Unlike ``Pattern.translate()``, which emits expressions for the old
+``__match__`` protocol, ``compile_native(cases)`` generates a function
+containing a real ``match``/``case`` statement (Python 3.10+), so the
+interpreter's own sequence, mapping and class matching does the work.
+
+Where native semantics differ from ``Pattern.match()`` the generated
+patterns compensate:
+
+- Constants only match values of their own type (plus int for float,
+  the ``_is_instance()`` rule): ``ConstantPattern(1.0)`` becomes
+  ``float(1.0) | int(1.0)`` rather than the literal ``1.0``.
+- ``AnnotatedPattern(p, float)`` becomes ``float(p) | int(p)``.
+- Positional subpatterns of an InstancePattern are matched by the
+  dataclass field names, not ``__match_args__``.
+- ``_`` is bound like any other name.
+- bytearray subjects, which native sequence patterns refuse, go to
+  ``Pattern.match()``.  (A bytearray nested in a subject is the one
+  remaining difference.)
+- Native mapping patterns look keys up with ``get()`` rather than
+  ``x[key]``, which differ for e.g. a defaultdict.  So mapping patterns
+  are only emitted at the top of a case, and subjects that are
+  mappings other than plain dicts go to ``Pattern.match()``.
+
+A case that can't be expressed natively (e.g. a constant of a type
+with its own ``__eq__``, duplicate bindings, or a class that isn't a
+dataclass) is compiled to a guard that calls its ``match()`` method.
+"""
+
+import collections.abc
+import dataclasses
+import enum
+import sys
+import types
+from typing import Callable, Dict, List, Optional, Sequence
+
+from patma import (
+    AlternativesPattern,
+    AnnotatedPattern,
+    CaseMatch,
+    ConstantPattern,
+    InstancePattern,
+    MappingPattern,
+    Pattern,
+    SequencePattern,
+    VariablePattern,
+    WalrusPattern,
+    _as_cases,
+    match_first,
+)
+
+__all__ = ["NativeMatcher", "compile_native"]
+
+# Classes whose single positional subpattern matches the subject itself.
+_SELF_MATCHING = (bool, bytearray, bytes, dict, float, frozenset, int, list, set, str, tuple)
+
+# Constant types written as a class pattern around a literal, e.g. int(42).
+_LITERAL_TYPES = (int, float, str, bytes)
+
+
+class _Unsupported(Exception):
+    """The pattern can't be expressed as a native pattern."""
+
+
+class _Emitter:
+    """Generates the source of native patterns for one case."""
+
+    def __init__(self, refs: Dict[int, str], namespace: types.SimpleNamespace):
+        self.refs = refs
+        self.namespace = namespace
+        self.captures: Dict[str, str] = {}  # Binding name -> variable.
+        self.mapping = False  # Whether a mapping pattern was emitted.
+
+    def ref(self, obj: object) -> str:
+        """A dotted name (usable as a value or class pattern) for obj."""
+        name = self.refs.get(id(obj))
+        if name is None:
+            name = self.refs[id(obj)] = f"k{len(self.refs)}"
+            setattr(self.namespace, name, obj)
+        return f"_c.{name}"
+
+    def capture(self, name: str) -> str:
+        var = self.captures.get(name)
+        if var is None:
+            var = self.captures[name] = f"_b{len(self.captures)}"
+        return var
+
+    def literal(self, value: object) -> Optional[str]:
+        """Source of a literal pattern equal to value, if there is one."""
+        if value is None or isinstance(value, bool):
+            return repr(value)
+        if type(value) in (int, str, bytes):
+            return repr(value)
+        if type(value) is float and value - value == 0:  # Not inf or nan.
+            return repr(value)
+        return None
+
+    def emit(self, p: Pattern, top: bool = False) -> str:
+        """Source of p; top is true if p is matched against the subject itself."""
+        if isinstance(p, ConstantPattern):
+            return self.constant(p.constant)
+        if isinstance(p, VariablePattern):
+            return self.capture(p.name)
+        if isinstance(p, WalrusPattern):
+            return f"({self.emit(p.pattern, top)} as {self.capture(p.name)})"
+        if isinstance(p, AlternativesPattern):
+            if not p.patterns:
+                raise _Unsupported("empty alternatives")
+            return "(" + " | ".join(self.emit(q, top) for q in p.patterns) + ")"
+        if isinstance(p, SequencePattern):
+            return "[" + "".join(self.emit(q) + ", " for q in p.patterns) + "]"
+        if isinstance(p, MappingPattern):
+            if not top:
+                raise _Unsupported("mapping pattern inside another pattern")
+            self.mapping = True
+            items = []
+            for key, q in zip(p.keys, p.values):
+                literal = self.literal(key)
+                items.append(f"{literal or self.ref(key)}: {self.emit(q)}")
+            return "{" + ", ".join(items) + "}"
+        if isinstance(p, AnnotatedPattern):
+            return self.annotated(p)
+        if isinstance(p, InstancePattern):
+            return self.instance(p)
+        raise _Unsupported(type(p).__name__)
+
+    def constant(self, c: object) -> str:
+        if c is None or isinstance(c, bool):
+            return repr(c)
+        if type(c) in _LITERAL_TYPES:
+            value = self.literal(c) or self.ref(c)
+            if type(c) is float:
+                return f"(float({value}) | int({value}))"
+            return f"{type(c).__name__}({value})"
+        if isinstance(c, enum.Enum) and type(c).__eq__ is object.__eq__:
+            # Equality is identity, so no type check is needed.
+            return self.ref(c)
+        raise _Unsupported(f"constant of type {type(c).__name__}")
+
+    def annotated(self, p: AnnotatedPattern) -> str:
+        cls = p.cls
+        if cls is float:
+            inner = self.emit(p.pattern)
+            return f"(float({inner}) | int({inner}))"
+        if cls in _SELF_MATCHING:
+            return f"{cls.__name__}({self.emit(p.pattern)})"
+        if isinstance(p.pattern, VariablePattern):
+            return f"({self.ref(cls)}() as {self.capture(p.pattern.name)})"
+        raise _Unsupported(f"annotation with {cls!r}")
+
+    def instance(self, p: InstancePattern) -> str:
+        cls = p.cls
+        if not (isinstance(cls, type) and dataclasses.is_dataclass(cls)):
+            raise _Unsupported(f"instance of non-dataclass {cls!r}")
+        fields = [f.name for f in dataclasses.fields(cls)]
+        if len(p.posargs) > len(fields):
+            raise _Unsupported("more positional patterns than fields")
+        names = fields[: len(p.posargs)] + list(p.kwnames)
+        if len(set(names)) < len(names):
+            raise _Unsupported("attribute matched twice")
+        args = [f"{name}={self.emit(q)}" for name, q in zip(names, p.posargs + p.kwpatterns)]
+        return f"{self.ref(cls)}({', '.join(args)})"
+
+
+def _irrefutable(p: Pattern) -> bool:
+    """Whether the compiler considers the native pattern irrefutable."""
+    if isinstance(p, VariablePattern):
+        return True
+    if isinstance(p, WalrusPattern):
+        return _irrefutable(p.pattern)
+    if isinstance(p, AlternativesPattern):
+        return any(_irrefutable(q) for q in p.patterns)
+    return False
+
+
+class NativeMatcher:
+    """A case list compiled into a function with a match statement."""
+
+    def __init__(self, cases: Sequence[Pattern]):
+        if sys.version_info < (3, 10):
+            raise RuntimeError("Native match statements need Python 3.10 or later")
+        self.cases = tuple(cases)
+        namespace = types.SimpleNamespace()
+        refs: Dict[int, str] = {}
+        lines = []
+        mapping = False
+        self.native: List[bool] = []
+        for i, case in enumerate(self.cases):
+            emitter = _Emitter(refs, namespace)
+            try:
+                source = emitter.emit(case, top=True)
+                # Let the compiler reject e.g. inconsistent alternatives.
+                compile(f"match x:\n case {source}: pass", "<pattern>", "exec")
+            except (_Unsupported, SyntaxError):
+                lines.append(f"        case _ if (_m := _cases[{i}].match(x)) is not None:")
+                lines.append(f"            return {i}, _m")
+                self.native.append(False)
+                continue
+            bindings = ", ".join(f"{name!r}: {var}" for name, var in emitter.captures.items())
+            # A guard keeps an irrefutable case from ending the statement.
+            guard = " if True" if _irrefutable(case) else ""
+            lines.append(f"        case {source}{guard}:")
+            lines.append(f"            return {i}, {{{bindings}}}")
+            self.native.append(True)
+            mapping = mapping or emitter.mapping
+        fallback = "isinstance(x, bytearray)"
+        if mapping:
+            fallback += " or (type(x) is not dict and isinstance(x, _Mapping))"
+        lines[:0] = [
+            "def _native_match(x):",
+            f"    if {fallback}:",
+            "        return _match_first(_cases, x)",
+            "    match x:",
+        ]
+        lines.append("    return None")
+        self.source = "\n".join(lines) + "\n"
+        globals_ = {
+            "_c": namespace,
+            "_cases": self.cases,
+            "_match_first": match_first,
+            "_Mapping": collections.abc.Mapping,
+        }
+        exec(compile(self.source, "<patma_native>", "exec"), globals_)
+        self.match_first: Callable[[object], Optional[CaseMatch]] = globals_["_native_match"]  # type: ignore
+
+
+def compile_native(cases: "Sequence[Pattern] | Pattern") -> NativeMatcher:
+    """Compile cases into a NativeMatcher; see the module docstring."""
+    return NativeMatcher(_as_cases(cases))
@@ -0,0 +1,394 @@
+# mypy: disallow-untyped-defs
+"""Reorder the checks inside patterns, cheap and selective ones first.
+
+Sequence, mapping and instance patterns match their subpatterns left to
+right, so a subject that a cheap constant at the end would reject is
+first taken apart by everything before it.  ``optimize(pattern)``
+returns an equivalent pattern whose compound patterns try their
+subpatterns in order of increasing ``cost / (1 - pass_rate)``, which
+minimizes the expected cost of a chain of independent checks.
+
+Costs are static estimates.  Pass rates are static guesses too, unless
+statistics collected by ``profile()`` over representative subjects are
+given, in which case the measured rates are used.
+
+Reordered patterns are instances of OrderedSequencePattern,
+OrderedMappingPattern and OrderedInstancePattern.  These subclass the
+plain pattern classes, storing the subpatterns in their original order
+plus the order to try them in, so other engines (translate(),
+PatternTable, explain(), ...) treat them as the plain pattern.  Their
+match() merges bindings in the original order, so the result is the
+same dict, in the same insertion order.  Patterns whose subpatterns
+bind overlapping names aren't reordered, since the last binding wins.
+
+Subpatterns are assumed to have no side effects: after reordering, an
+attribute lookup or ``__getitem__`` call that used to happen before a
+failing check may not happen any more, and vice versa.
+"""
+
+import collections.abc as cabc
+import math
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+
+from patma import (
+    AlternativesPattern,
+    AnnotatedPattern,
+    ConstantPattern,
+    InstancePattern,
+    MappingPattern,
+    Pattern,
+    SequencePattern,
+    VariablePattern,
+    WalrusPattern,
+    _as_cases,
+    _init,
+    _is_instance,
+    _is_sequence,
+    _positional_fields,
+)
+
+__all__ = [
+    "OrderedSequencePattern",
+    "OrderedMappingPattern",
+    "OrderedInstancePattern",
+    "Statistics",
+    "estimate",
+    "optimize",
+    "profile",
+]
+
+# Pattern -> [tries, passes], as collected by profile().
+Statistics = Dict[Pattern, List[int]]
+
+
+def _check_order(order: Iterable[int], n: int) -> Tuple[int, ...]:
+    order = tuple(order)
+    if sorted(order) != list(range(n)):
+        raise ValueError(f"order {order} is not a permutation of range({n})")
+    return order
+
+
+def _merge(results: List[Optional[Dict[str, object]]]) -> Dict[str, object]:
+    matches: Dict[str, object] = {}
+    for match in results:
+        matches.update(match)  # type: ignore
+    return matches
+
+
+class OrderedSequencePattern(SequencePattern):
+    """A SequencePattern trying its items in a given order."""
+
+    __slots__ = ("order",)
+    order: Tuple[int, ...]
+
+    def __init__(self, patterns: Iterable[Pattern], order: Iterable[int]):
+        super().__init__(patterns)
+        _init(self, order=_check_order(order, len(self.patterns)))
+
+    def _args(self) -> Tuple:
+        return (self.patterns, self.order)
+
+    def match(self, x: object) -> Optional[Dict[str, object]]:
+        cls = type(x)
+        if cls is not tuple and cls is not list and not _is_sequence(x):
+            return None
+        if len(x) != len(self.patterns):  # type: ignore
+            return None
+        results: List[Optional[Dict[str, object]]] = [None] * len(self.patterns)
+        for i in self.order:
+            match = self.patterns[i].match(x[i])  # type: ignore
+            if match is None:
+                return None
+            results[i] = match
+        return _merge(results)
+
+
+class OrderedMappingPattern(MappingPattern):
+    """A MappingPattern trying its keys in a given order."""
+
+    __slots__ = ("order",)
+    order: Tuple[int, ...]
+
+    def __init__(self, patterns: Mapping[object, Pattern], order: Iterable[int]):
+        super().__init__(patterns)
+        _init(self, order=_check_order(order, len(self.keys)))
+
+    def _args(self) -> Tuple:
+        return (self.patterns, self.order)
+
+    def match(self, x: object) -> Optional[Dict[str, object]]:
+        if not isinstance(x, cabc.Mapping):
+            return None
+        results: List[Optional[Dict[str, object]]] = [None] * len(self.keys)
+        for i in self.order:
+            try:
+                value = x[self.keys[i]]
+            except KeyError:
+                return None
+            match = self.values[i].match(value)
+            if match is None:
+                return None
+            results[i] = match
+        return _merge(results)
+
+
+class OrderedInstancePattern(InstancePattern):
+    """An InstancePattern trying its subpatterns in a given order.
+
+    The order indexes the positional subpatterns followed by the
+    keyword ones.
+    """
+
+    __slots__ = ("order",)
+    order: Tuple[int, ...]
+
+    def __init__(
+        self,
+        cls: type,
+        posargs: Iterable[Pattern],
+        kwargs: Mapping[str, Pattern],
+        order: Iterable[int],
+    ):
+        super().__init__(cls, posargs, kwargs)
+        _init(self, order=_check_order(order, len(self.posargs) + len(self.kwnames)))
+
+    def _args(self) -> Tuple:
+        return (self.cls, self.posargs, self.kwargs, self.order)
+
+    def match(self, x: object) -> Optional[Dict[str, object]]:
+        if not _is_instance(x, self.cls):
+            return None
+        fields = _positional_fields(x)
+        if len(self.posargs) > len(fields):
+            return None  # Can't match: more positional patterns than fields.
+        names = fields[: len(self.posargs)] + self.kwnames
+        patterns = self.posargs + self.kwpatterns
+        missing = object()
+        results: List[Optional[Dict[str, object]]] = [None] * len(patterns)
+        for i in self.order:
+            value = getattr(x, names[i], missing)
+            if value is missing:
+                return None  # Can't match: attribute not set.
+            match = patterns[i].match(value)
+            if match is None:
+                return None
+            results[i] = match
+        return _merge(results)
+
+
+def _children(pattern: Pattern) -> Sequence[Pattern]:
+    """The subpatterns of a compound pattern, in the order of order."""
+    if isinstance(pattern, SequencePattern):
+        return pattern.patterns
+    if isinstance(pattern, MappingPattern):
+        return pattern.values
+    if isinstance(pattern, InstancePattern):
+        return pattern.posargs + pattern.kwpatterns
+    return ()
+
+
+# Static guesses: (cost of the node's own check, pass rate).
+_CONSTANT = (1.0, 0.2)
+_VARIABLE = (0.5, 1.0)
+_ANNOTATED = (1.0, 0.5)
+_SEQUENCE = (2.0, 0.5)
+_MAPPING = (2.0, 0.5)
+_INSTANCE = (3.0, 0.5)
+_OTHER = (5.0, 0.5)
+
+
+def _rank(estimate: Tuple[float, float]) -> float:
+    cost, rate = estimate
+    return math.inf if rate >= 1.0 else cost / (1.0 - rate)
+
+
+def _best_order(estimates: Sequence[Tuple[float, float]]) -> List[int]:
+    return sorted(range(len(estimates)), key=lambda i: (_rank(estimates[i]), i))
+
+
+def _chain(base: Tuple[float, float], estimates: Sequence[Tuple[float, float]]) -> Tuple[float, float]:
+    """Estimate a check followed by independent checks in the best order."""
+    cost, rate = base
+    for i in _best_order(estimates):
+        cost += rate * estimates[i][0]
+        rate *= estimates[i][1]
+    return cost, rate
+
+
+def estimate(pattern: Pattern, stats: Optional[Statistics] = None) -> Tuple[float, float]:
+    """Estimate (expected cost, pass rate) of matching pattern.
+
+    Costs are in arbitrary units, about one per simple check.  The pass
+    rate is measured if stats has counts for pattern.
+    """
+    cost, rate = _estimate(pattern, stats)
+    if stats is not None:
+        counts = stats.get(pattern)
+        if counts is not None and counts[0]:
+            rate = (counts[1] + 1) / (counts[0] + 2)  # Smoothed.
+    return cost, rate
+
+
+def _estimate(pattern: Pattern, stats: Optional[Statistics]) -> Tuple[float, float]:
+    if isinstance(pattern, ConstantPattern):
+        return _CONSTANT
+    if isinstance(pattern, VariablePattern):
+        return _VARIABLE
+    if isinstance(pattern, AnnotatedPattern):
+        return _chain(_ANNOTATED, [estimate(pattern.pattern, stats)])
+    if isinstance(pattern, WalrusPattern):
+        return estimate(pattern.pattern, stats)
+    if isinstance(pattern, AlternativesPattern):
+        cost, fail = 0.0, 1.0
+        for p in pattern.patterns:
+            c, r = estimate(p, stats)
+            cost += fail * c
+            fail *= 1.0 - r
+        return cost, 1.0 - fail
+    children = [estimate(p, stats) for p in _children(pattern)]
+    if isinstance(pattern, SequencePattern):
+        return _chain(_SEQUENCE, children)
+    if isinstance(pattern, MappingPattern):
+        return _chain(_MAPPING, children)
+    if isinstance(pattern, InstancePattern):
+        return _chain(_INSTANCE, children)
+    return _OTHER
+
+
+def _names(pattern: Pattern) -> Set[str]:
+    """Every name pattern.match() may bind, including "_"."""
+    if isinstance(pattern, VariablePattern):
+        return {pattern.name}
+    if isinstance(pattern, WalrusPattern):
+        return {pattern.name} | _names(pattern.pattern)
+    if isinstance(pattern, AnnotatedPattern):
+        return _names(pattern.pattern)
+    if isinstance(pattern, AlternativesPattern):
+        return set().union(*map(_names, pattern.patterns))
+    children = _children(pattern)
+    if children:
+        return set().union(*map(_names, children))
+    if isinstance(pattern, (ConstantPattern, SequencePattern, MappingPattern, InstancePattern)):
+        return set()
+    return {"*"}  # A pattern we know nothing about: assume it binds anything.
+
+
+def _overlapping(patterns: Sequence[Pattern]) -> bool:
+    seen: Set[str] = set()
+    for p in patterns:
+        names = _names(p)
+        if "*" in names or seen & names:
+            return True
+        seen |= names
+    return False
+
+
+def optimize(pattern: Pattern, stats: Optional[Statistics] = None) -> Pattern:
+    """Return a pattern equivalent to pattern, with reordered checks.
+
+    Subpatterns are optimized too.  Compound patterns whose best order
+    is the original one keep their plain class.
+    """
+    if isinstance(pattern, AnnotatedPattern):
+        return AnnotatedPattern(optimize(pattern.pattern, stats), pattern.cls)
+    if isinstance(pattern, WalrusPattern):
+        return WalrusPattern(pattern.name, optimize(pattern.pattern, stats))
+    if isinstance(pattern, AlternativesPattern):
+        return AlternativesPattern([optimize(p, stats) for p in pattern.patterns])
+    children = _children(pattern)
+    if not children:
+        return pattern
+    order = _best_order([estimate(p, stats) for p in children])
+    if order == sorted(order) or _overlapping(children):
+        order = []  # Keep the original order.
+    optimized = [optimize(p, stats) for p in children]
+    if isinstance(pattern, SequencePattern):
+        if order:
+            return OrderedSequencePattern(optimized, order)
+        return SequencePattern(optimized)
+    if isinstance(pattern, MappingPattern):
+        items = dict(zip(pattern.keys, optimized))
+        if order:
+            return OrderedMappingPattern(items, order)
+        return MappingPattern(items)
+    if isinstance(pattern, InstancePattern):
+        npos = len(pattern.posargs)
+        kwargs = dict(zip(pattern.kwnames, optimized[npos:]))
+        if order:
+            return OrderedInstancePattern(pattern.cls, optimized[:npos], kwargs, order)
+        return InstancePattern(pattern.cls, optimized[:npos], kwargs)
+    return pattern
+
+
+def profile(
+    pattern_or_cases: "Pattern | Sequence[Pattern]",
+    subjects: Iterable[object],
+    stats: Optional[Statistics] = None,
+) -> Statistics:
+    """Count how often each subpattern matches, for optimize().
+
+    Every case is tried on every subject.  All subpatterns of a
+    compound pattern are tried whenever its own check passes, even
+    after one of them fails, so each gets an unbiased pass rate.
+    Pass an existing stats to add to it.
+    """
+    if stats is None:
+        stats = {}
+    cases = _as_cases(pattern_or_cases)
+    for x in subjects:
+        for case in cases:
+            _record(case, x, stats)
+    return stats
+
+
+def _record(pattern: Pattern, x: object, stats: Statistics) -> bool:
+    counts = stats.get(pattern)
+    if counts is None:
+        counts = stats[pattern] = [0, 0]
+    counts[0] += 1
+    passed = _record_node(pattern, x, stats)
+    if passed:
+        counts[1] += 1
+    return passed
+
+
+def _record_node(pattern: Pattern, x: object, stats: Statistics) -> bool:
+    if isinstance(pattern, AnnotatedPattern):
+        return _is_instance(x, pattern.cls) and _record(pattern.pattern, x, stats)
+    if isinstance(pattern, WalrusPattern):
+        return _record(pattern.pattern, x, stats)
+    if isinstance(pattern, AlternativesPattern):
+        results = [_record(p, x, stats) for p in pattern.patterns]
+        return any(results)
+    if isinstance(pattern, SequencePattern):
+        if not (type(x) is tuple or type(x) is list or _is_sequence(x)):
+            return False
+        if len(x) != len(pattern.patterns):  # type: ignore
+            return False
+        return all([_record(p, item, stats) for p, item in zip(pattern.patterns, x)])  # type: ignore
+    if isinstance(pattern, MappingPattern):
+        if not isinstance(x, cabc.Mapping):
+            return False
+        results = []
+        for key, p in zip(pattern.keys, pattern.values):
+            try:
+                value = x[key]
+            except KeyError:
+                results.append(False)
+                continue
+            results.append(_record(p, value, stats))
+        return all(results)
+    if isinstance(pattern, InstancePattern):
+        if not _is_instance(x, pattern.cls):
+            return False
+        fields = _positional_fields(x)
+        if len(pattern.posargs) > len(fields):
+            return False
+        names = fields[: len(pattern.posargs)] + pattern.kwnames
+        missing = object()
+        results = []
+        for name, p in zip(names, pattern.posargs + pattern.kwpatterns):
+            value = getattr(x, name, missing)
+            results.append(value is not missing and _record(p, value, stats))
+        return all(results)
+    return pattern.match(x) is not None
@@ -0,0 +1,104 @@
+# mypy: disallow-untyped-defs
+"""A registry of compiled case lists shared between threads.
+
+``MatcherRegistry`` compiles each named case list once and publishes
+the compiled matcher for lock-free use by any number of threads.  It
+is written not to rely on the GIL, for free-threaded builds:
+
+- Published matchers live in a dict that is never mutated; publishing
+  swaps in an updated copy, so readers always see a complete dict.
+- Compiling takes a lock per name, so different case lists compile in
+  parallel and a name is compiled only once.
+- Hit counters are per thread, written only by their own thread, and
+  merged when stats() is read.
+
+Compiled matchers must not be changed once built; the SequenceTrie and
+PatternTable engines aren't.
+"""
+
+import threading
+from typing import Callable, Dict, Hashable, List, Optional, Sequence
+
+from patma import CaseMatch, Pattern
+from patma_dispatch import SequenceTrie
+
+__all__ = ["MatcherRegistry"]
+
+
+class MatcherRegistry:
+    """Compile case lists once and share the matchers between threads.
+
+    ``compiler`` turns a tuple of cases into an object with a
+    ``match_first(x)`` method; the default is SequenceTrie.
+    """
+
+    def __init__(self, compiler: Callable[[Sequence[Pattern]], object] = SequenceTrie):
+        self.compiler = compiler
+        self._matchers: Dict[Hashable, object] = {}
+        self._lock = threading.Lock()  # Guards _locks, publishing and _counters.
+        self._locks: Dict[Hashable, threading.Lock] = {}
+        self._local = threading.local()
+        self._counters: List[Dict[Hashable, List[int]]] = []
+
+    def register(self, name: Hashable, cases: Sequence[Pattern]) -> object:
+        """Compile and publish cases under name, unless already done.
+
+        Returns the published matcher.  If name is already registered
+        the existing matcher is returned and cases is ignored.
+        """
+        matcher = self._matchers.get(name)
+        if matcher is not None:
+            return matcher
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            matcher = self._matchers.get(name)
+            if matcher is None:
+                matcher = self.compiler(tuple(cases))
+                with self._lock:
+                    matchers = dict(self._matchers)
+                    matchers[name] = matcher
+                    self._matchers = matchers
+        return matcher
+
+    def get(self, name: Hashable) -> object:
+        """The matcher published under name; raises KeyError if none."""
+        return self._matchers[name]
+
+    def __contains__(self, name: Hashable) -> bool:
+        return name in self._matchers
+
+    def _thread_counters(self) -> Dict[Hashable, List[int]]:
+        try:
+            return self._local.counters  # type: ignore
+        except AttributeError:
+            counters: Dict[Hashable, List[int]] = {}
+            self._local.counters = counters
+            with self._lock:
+                self._counters.append(counters)
+            return counters
+
+    def match_first(self, name: Hashable, x: object) -> Optional[CaseMatch]:
+        """Match x with the matcher registered under name, counting hits."""
+        result: Optional[CaseMatch] = self._matchers[name].match_first(x)  # type: ignore
+        counters = self._thread_counters()
+        counts = counters.get(name)
+        if counts is None:
+            counts = counters[name] = [0, 0]
+        counts[result is None] += 1
+        return result
+
+    def stats(self) -> Dict[Hashable, Dict[str, int]]:
+        """Matches and misses per name, summed over all threads.
+
+        Counts from threads still matching may be slightly behind.
+        """
+        with self._lock:
+            all_counters = list(self._counters)
+        result: Dict[Hashable, Dict[str, int]] = {}
+        for counters in all_counters:
+            for name, (matched, missed) in counters.copy().items():
+                totals = result.setdefault(name, {"matched": 0, "missed": 0})
+                totals["matched"] += matched
+                totals["missed"] += missed
+        return result
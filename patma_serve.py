@@ -0,0 +1,421 @@
+# mypy: disallow-untyped-defs
+"""A matching service sharing rule sets between processes.
+
+``python -m patma_serve --unix PATH name=rules.patt ...`` loads rule
+sets saved by ``patma_table.dump()`` once (mmapped, so they aren't
+even copied into the server's heap) and matches subjects sent by any
+number of local clients over a Unix or TCP socket.
+
+Requests and responses are frames with a fixed binary header::
+
+    payload length (u32), request id (u32), opcode or status (u8)
+
+all little-endian.  A match request's payload is the rule set name
+(u16 length, UTF-8) followed by the subject (or, for MATCH_MANY, a
+list of subjects) as JSON text; subjects are JSON so that the server
+never unpickles anything sent to it.  An OK response holds the
+result as JSON: null or ``[case_index, bindings]`` per subject.  An
+ERROR response holds a message, and the connection stays usable.
+
+Clients may pipeline: send any number of requests without waiting,
+then read the responses, which come back in request order.  The
+server matches the requests that have arrived (from all connections,
+up to max_batch) as one batch and hands each connection's responses
+to that connection's own writer task as one buffer, so a client that
+is slow to read its responses doesn't hold up the others.
+
+Like patma_async, this gives busy clients large batches and an idle
+one no added latency; a window of a few hundred microseconds can be
+set to wait for more requests before matching, which bounds the added
+latency to the window.
+
+``Client`` keeps a pool of connections for use from several threads,
+and reads responses while it sends, keeping at most max_inflight
+requests unanswered per connection.
+"""
+
+import argparse
+import asyncio
+import collections
+import contextlib
+import json
+import os
+import socket
+import struct
+import threading
+from typing import Deque, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from patma import CaseMatch
+from patma_table import PatternTable, load
+
+__all__ = ["Client", "Server", "ServiceError"]
+
+_HEADER = struct.Struct("<IIB")
+_NAME = struct.Struct("<H")
+
+# Request opcodes.
+MATCH = 1
+MATCH_MANY = 2
+RULESETS = 3
+
+# Response statuses.
+OK = 0
+ERROR = 1
+
+MAX_PAYLOAD = 64 << 20
+
+
+class ServiceError(Exception):
+    """The server couldn't handle a request."""
+
+
+def _parse_address(address: str) -> Union[str, Tuple[str, int]]:
+    """A "host:port" string as a TCP address; anything else is a socket path."""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and "/" not in address:
+        return host, int(port)
+    return address
+
+
+def _encode_result(result: Optional[CaseMatch]) -> object:
+    return None if result is None else [result[0], result[1]]
+
+
+def _decode_result(result: object) -> Optional[CaseMatch]:
+    if result is None:
+        return None
+    assert isinstance(result, list)
+    return result[0], result[1]
+
+
+class _Peer:
+    """A client connection's unanswered requests and queued responses."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.inflight = 0  # Requests read but not yet answered.
+        self.room = asyncio.Event()  # Set while inflight < max_inflight.
+        self.room.set()
+        self.eof = False  # No more requests will be read.
+        # Buffers of responses and the number of responses in each.
+        self.out: "asyncio.Queue[Tuple[bytes, int]]" = asyncio.Queue()
+
+
+# (peer, request id, opcode, payload)
+_Request = Tuple[_Peer, int, int, bytes]
+
+
+class Server:
+    """Serves match requests against named PatternTables.
+
+    window is how long (in seconds) to wait for more requests after
+    the first one before matching a batch (0 to match what has
+    arrived); max_batch caps the batch size.  Reading from a
+    connection pauses while max_inflight of its requests are
+    unanswered, so a client that doesn't read its responses only
+    stalls itself.
+    """
+
+    def __init__(
+        self,
+        rulesets: Dict[str, PatternTable],
+        window: float = 0.0,
+        max_batch: int = 1024,
+        max_inflight: int = 256,
+    ):
+        if window < 0 or max_batch <= 0 or max_inflight <= 0:
+            raise ValueError("Need window >= 0, max_batch > 0 and max_inflight > 0")
+        self.rulesets = rulesets
+        self.window = window
+        self.max_batch = max_batch
+        self.max_inflight = max_inflight
+        self._pending: Deque[_Request] = collections.deque()
+
+    async def serve(self, address: str, started: Optional[asyncio.Event] = None) -> None:
+        """Listen on address (a socket path or "host:port") until cancelled."""
+        self._ready = asyncio.Event()  # Something is pending.
+        self._full = asyncio.Event()  # A full batch is pending.
+        parsed = _parse_address(address)
+        if isinstance(parsed, str):
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(parsed)
+            server = await asyncio.start_unix_server(self._connection, parsed)
+        else:
+            server = await asyncio.start_server(self._connection, *parsed)
+        batcher = asyncio.ensure_future(self._batcher())
+        if started is not None:
+            started.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+    async def _connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = _Peer(writer)
+        sender = asyncio.ensure_future(self._sender(peer))
+        try:
+            while True:
+                header = await reader.readexactly(_HEADER.size)
+                length, request_id, opcode = _HEADER.unpack(header)
+                if length > MAX_PAYLOAD:
+                    break  # Can't resynchronize, so drop the connection.
+                payload = await reader.readexactly(length)
+                await peer.room.wait()
+                if writer.is_closing():
+                    break
+                peer.inflight += 1
+                if peer.inflight >= self.max_inflight:
+                    peer.room.clear()
+                self._pending.append((peer, request_id, opcode, payload))
+                self._ready.set()
+                if len(self._pending) >= self.max_batch:
+                    self._full.set()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            # The sender closes the connection once the requests already
+            # read are answered.
+            peer.eof = True
+            if not peer.inflight:
+                sender.cancel()
+
+    async def _sender(self, peer: _Peer) -> None:
+        """Write out peer's responses, one buffer per batch."""
+        try:
+            while True:
+                data, count = await peer.out.get()
+                peer.writer.write(data)
+                await peer.writer.drain()
+                peer.inflight -= count
+                if peer.inflight < self.max_inflight:
+                    peer.room.set()
+                if peer.eof and not peer.inflight:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            peer.writer.close()
+            peer.room.set()  # Let a waiting reader see the connection is gone.
+
+    async def _batcher(self) -> None:
+        pending = self._pending
+        while True:
+            await self._ready.wait()
+            if self.window and len(pending) < self.max_batch:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._full.wait(), self.window)
+            else:
+                await asyncio.sleep(0)  # Let requests already received (and senders) in.
+            batch = [pending.popleft() for _ in range(min(len(pending), self.max_batch))]
+            if not pending:
+                self._ready.clear()
+            if len(pending) < self.max_batch:
+                self._full.clear()
+            out: Dict[_Peer, Tuple[bytearray, List[int]]] = {}
+            for peer, request_id, opcode, payload in batch:
+                try:
+                    status, body = OK, json.dumps(self._handle(opcode, payload)).encode()
+                except Exception as exc:
+                    status, body = ERROR, f"{type(exc).__name__}: {exc}".encode()
+                buf, count = out.setdefault(peer, (bytearray(), [0]))
+                buf += _HEADER.pack(len(body), request_id, status)
+                buf += body
+                count[0] += 1
+            # Never wait for a client here: its sender does the writing.
+            for peer, (buf, count) in out.items():
+                peer.out.put_nowait((bytes(buf), count[0]))
+
+    def _handle(self, opcode: int, payload: bytes) -> object:
+        if opcode == RULESETS:
+            return {name: len(table) for name, table in self.rulesets.items()}
+        if opcode not in (MATCH, MATCH_MANY):
+            raise ValueError(f"Bad opcode {opcode}")
+        (n,) = _NAME.unpack_from(payload)
+        name = payload[_NAME.size : _NAME.size + n].decode()
+        table = self.rulesets.get(name)
+        if table is None:
+            raise KeyError(f"No rule set {name!r}")
+        subject = json.loads(payload[_NAME.size + n :])
+        if opcode == MATCH:
+            return _encode_result(table.match_first(subject))
+        if not isinstance(subject, list):
+            raise TypeError("MATCH_MANY needs a list of subjects")
+        return [_encode_result(table.match_first(x)) for x in subject]
+
+
+class _Connection:
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.file = sock.makefile("rb")
+        self.next_id = 0
+
+    def send(self, opcode: int, payload: bytes) -> int:
+        request_id = self.next_id
+        self.next_id = (request_id + 1) & 0xFFFFFFFF
+        self.sock.sendall(_HEADER.pack(len(payload), request_id, opcode) + payload)
+        return request_id
+
+    def receive(self, request_id: int) -> Tuple[int, bytes]:
+        header = self.file.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise ConnectionError("Server closed the connection")
+        length, response_id, status = _HEADER.unpack(header)
+        body = self.file.read(length)
+        if len(body) < length:
+            raise ConnectionError("Server closed the connection")
+        if response_id != request_id:
+            raise ConnectionError(f"Response {response_id} to request {request_id}")
+        return status, body
+
+    def close(self) -> None:
+        self.file.close()
+        self.sock.close()
+
+
+class Client:
+    """A thread-safe client keeping up to pool_size open connections."""
+
+    def __init__(
+        self,
+        address: str,
+        pool_size: int = 4,
+        timeout: Optional[float] = 10.0,
+        max_inflight: int = 16,
+    ):
+        self.address = _parse_address(address)
+        self.timeout = timeout
+        self.max_inflight = max_inflight
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+        self._idle: List[_Connection] = []
+
+    def _connect(self) -> _Connection:
+        if isinstance(self.address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.address)
+        except BaseException:
+            sock.close()
+            raise
+        return _Connection(sock)
+
+    @contextlib.contextmanager
+    def _connection(self) -> Iterator[_Connection]:
+        with self._slots:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._connect()
+            try:
+                yield conn
+            except BaseException:  # E.g. a timeout; the connection may be out of sync.
+                conn.close()
+                raise
+            with self._lock:
+                self._idle.append(conn)
+
+    def _call(self, opcode: int, payloads: Sequence[bytes]) -> List[object]:
+        """Pipeline requests on one connection and return their results."""
+        responses = []
+        with self._connection() as conn:
+            ids: Deque[int] = collections.deque()
+            for payload in payloads:
+                if len(ids) >= self.max_inflight:
+                    responses.append(conn.receive(ids.popleft()))
+                ids.append(conn.send(opcode, payload))
+            while ids:
+                responses.append(conn.receive(ids.popleft()))
+        results = []
+        for status, body in responses:
+            if status != OK:
+                raise ServiceError(body.decode(errors="replace"))
+            results.append(json.loads(body))
+        return results
+
+    def rulesets(self) -> Dict[str, int]:
+        """The served rule sets and their number of cases."""
+        return self._call(RULESETS, [b""])[0]  # type: ignore
+
+    def match(self, name: str, subject: object) -> Optional[CaseMatch]:
+        """Like match_first() on rule set name; subject must be JSON data."""
+        return _decode_result(self._call(MATCH, [_payload(name, subject)])[0])
+
+    def match_many(
+        self, name: str, subjects: Sequence[object], chunk_size: int = 256
+    ) -> List[Optional[CaseMatch]]:
+        """match() each subject, in pipelined requests of chunk_size subjects."""
+        payloads = [
+            _payload(name, list(subjects[i : i + chunk_size]))
+            for i in range(0, len(subjects), chunk_size)
+        ]
+        results: List[Optional[CaseMatch]] = []
+        for chunk in self._call(MATCH_MANY, payloads):
+            results.extend(_decode_result(result) for result in chunk)  # type: ignore
+        return results
+
+    def close(self) -> None:
+        """Close the idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+def _payload(name: str, subject: object) -> bytes:
+    encoded = name.encode()
+    return _NAME.pack(len(encoded)) + encoded + json.dumps(subject).encode()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument("--unix", metavar="PATH", help="Unix socket to listen on")
+    where.add_argument("--tcp", metavar="HOST:PORT", help="TCP address to listen on")
+    parser.add_argument("--window", type=float, default=0.0, help="batching window in ms")
+    parser.add_argument("--max-batch", type=int, default=1024)
+    parser.add_argument(
+        "--max-inflight", type=int, default=256, help="unanswered requests per connection"
+    )
+    parser.add_argument(
+        "rulesets", nargs="+", metavar="[NAME=]FILE", help="patma_table.dump() output"
+    )
+    args = parser.parse_args(argv)
+    rulesets = {}
+    for spec in args.rulesets:
+        name, sep, path = spec.rpartition("=")
+        if not sep:
+            name = os.path.splitext(os.path.basename(path))[0]
+        with open(path, "rb") as f:
+            rulesets[name] = load(f)
+    server = Server(rulesets, args.window / 1000, args.max_batch, args.max_inflight)
+    address = args.unix if args.unix is not None else args.tcp
+
+    async def run() -> None:
+        started = asyncio.Event()
+        task = asyncio.ensure_future(server.serve(address, started))
+        waiter = asyncio.ensure_future(started.wait())
+        try:
+            await asyncio.wait([task, waiter], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()  # If serving failed to start.
+        if started.is_set():
+            print(f"Serving {', '.join(sorted(rulesets))} on {address}", flush=True)
+        await task
+
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
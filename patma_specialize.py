@@ -0,0 +1,427 @@
+# mypy: disallow-untyped-defs
+"""Specialize patterns for subjects of a known static type.
+
+``specialize(pattern, schema)`` (also ``pattern.specialize(schema)``)
+partially evaluates a pattern against a type annotation that all its
+subjects are known to conform to, e.g. ``Tuple[str, int, dict]``, a
+dataclass, a TypedDict or ``Optional[List[Point]]``.  Checks that the
+schema guarantees are dropped:
+
+- A sequence pattern for ``Tuple[A, B, C]`` checks neither the type
+  nor the length; for ``List[A]`` or ``Tuple[A, ...]``, only the
+  length.
+- A mapping pattern for ``Dict[K, V]``, ``Mapping[K, V]`` or a
+  TypedDict doesn't check the type.
+- An instance pattern for a dataclass that is a subclass of its class
+  doesn't check the type, and looks up the attributes for positional
+  subpatterns from the dataclass fields, not per subject.
+- An annotated pattern whose class the schema guarantees is dropped.
+
+Subpatterns are specialized for the item, value and field types.
+
+Patterns that can never match a subject of the schema (e.g. a
+sequence pattern of the wrong length for a tuple type, or a constant
+of an unrelated builtin type) become a NeverPattern, which records the
+reason; ``unmatchable(cases, schema)`` lists the cases that do.  As in
+PEP 484, ``float`` is taken to mean ``float | int``, and ``complex``
+to mean ``complex | float | int``.
+
+The schema is trusted: a subject that doesn't conform to it may match
+where the original pattern wouldn't.  Specialized patterns subclass the
+plain pattern classes, so all engines accept them.
+"""
+
+import collections.abc as cabc
+import dataclasses
+import sys
+import typing
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from patma import (
+    AlternativesPattern,
+    AnnotatedPattern,
+    ConstantPattern,
+    InstancePattern,
+    MappingPattern,
+    Pattern,
+    SequencePattern,
+    VariablePattern,
+    WalrusPattern,
+    _as_cases,
+    _init,
+)
+
+__all__ = [
+    "NeverPattern",
+    "TrustedSequencePattern",
+    "TrustedMappingPattern",
+    "TrustedInstancePattern",
+    "specialize",
+    "unmatchable",
+]
+
+
+class NeverPattern(AlternativesPattern):
+    """A pattern that never matches, with the reason why."""
+
+    __slots__ = ("reason",)
+    reason: str
+
+    def __init__(self, reason: str):
+        super().__init__([])
+        _init(self, reason=reason)
+
+    def _args(self) -> Tuple:
+        return (self.reason,)
+
+    def match(self, x: object) -> None:
+        return None
+
+
+class TrustedSequencePattern(SequencePattern):
+    """A SequencePattern for subjects known to be sequences.
+
+    If check_length is false, they are also known to have the right
+    length.
+    """
+
+    __slots__ = ("check_length",)
+    check_length: bool
+
+    def __init__(self, patterns: Iterable[Pattern], check_length: bool):
+        super().__init__(patterns)
+        _init(self, check_length=check_length)
+
+    def _args(self) -> Tuple:
+        return (self.patterns, self.check_length)
+
+    def match(self, x: object) -> Optional[Dict[str, object]]:
+        if self.check_length and len(x) != len(self.patterns):  # type: ignore
+            return None
+        matches: Dict[str, object] = {}
+        for pattern, item in zip(self.patterns, x):  # type: ignore
+            match = pattern.match(item)
+            if match is None:
+                return None
+            matches.update(match)
+        return matches
+
+
+class TrustedMappingPattern(MappingPattern):
+    """A MappingPattern for subjects known to be mappings."""
+
+    __slots__ = ()
+
+    def match(self, x: object) -> Optional[Dict[str, object]]:
+        matches: Dict[str, object] = {}
+        for key, pattern in zip(self.keys, self.values):
+            try:
+                value = x[key]  # type: ignore
+            except KeyError:
+                return None
+            match = pattern.match(value)
+            if match is None:
+                return None
+            matches.update(match)
+        return matches
+
+
+class TrustedInstancePattern(InstancePattern):
+    """An InstancePattern for subjects known to be instances of cls.
+
+    fields names the attributes that the positional subpatterns match.
+    """
+
+    __slots__ = ("fields",)
+    fields: Tuple[str, ...]
+
+    def __init__(
+        self,
+        cls: type,
+        posargs: Iterable[Pattern],
+        kwargs: typing.Mapping[str, Pattern],
+        fields: Iterable[str],
+    ):
+        super().__init__(cls, posargs, kwargs)
+        _init(self, fields=tuple(fields))
+
+    def _args(self) -> Tuple:
+        return (self.cls, self.posargs, self.kwargs, self.fields)
+
+    def match(self, x: object) -> Optional[Dict[str, object]]:
+        missing = object()
+        matches: Dict[str, object] = {}
+        names = self.fields + self.kwnames
+        for name, pattern in zip(names, self.posargs + self.kwpatterns):
+            value = getattr(x, name, missing)
+            if value is missing:
+                return None  # Can't match: attribute not set.
+            match = pattern.match(value)
+            if match is None:
+                return None
+            matches.update(match)
+        return matches
+
+
+# The schema types of an annotation, by kind.
+_UNION_TYPES: Tuple[object, ...] = (typing.Union,)
+if sys.version_info >= (3, 10):
+    import types
+
+    _UNION_TYPES += (types.UnionType,)
+
+_ANNOTATED = getattr(typing, "Annotated", None)  # Python 3.9+.
+
+_SEQUENCES = (tuple, list)
+_MAPPINGS = (dict, cabc.Mapping, cabc.MutableMapping)
+_NUMBERS = (bool, int, float, complex)
+# PEP 484 admits an int where a float is expected, and an int or a
+# float where a complex is.
+_NUMERIC_TOWER = {float: (float, int), complex: (complex, float, int)}
+
+
+def _is_typeddict(schema: object) -> bool:
+    return (
+        isinstance(schema, type)
+        and issubclass(schema, dict)
+        and hasattr(schema, "__total__")
+        and hasattr(schema, "__annotations__")
+    )
+
+
+def _runtime_class(schema: object) -> Optional[type]:
+    """The class every subject of schema is an instance of, if known."""
+    if schema is None:
+        return type(None)
+    if _is_typeddict(schema):
+        return dict
+    origin = typing.get_origin(schema)
+    if origin is not None:
+        schema = origin
+    if isinstance(schema, type) and schema is not object:
+        return schema
+    return None
+
+
+_disjoint_types: Dict[Tuple[type, type], bool] = {}
+
+
+def _disjoint(t: type, cls: type) -> bool:
+    """Whether no object can be an instance of both builtin types.
+
+    Only builtin types are considered; user classes may always be
+    combined by a subclass.
+    """
+    if issubclass(t, cls) or issubclass(cls, t) or (cls is float and issubclass(t, int)):
+        return False
+    if t.__module__ != "builtins" or cls.__module__ != "builtins":
+        return False
+    result = _disjoint_types.get((t, cls))
+    if result is None:
+        try:
+            type("_Both", (t, cls), {})
+            result = False
+        except TypeError:
+            result = True  # Incompatible layouts, or a final class.
+        _disjoint_types[(t, cls)] = result
+    return result
+
+
+def _hints(cls: type) -> Dict[str, object]:
+    try:
+        return typing.get_type_hints(cls)
+    except Exception:  # Unresolvable forward references.
+        return {}
+
+
+def specialize(pattern: Pattern, schema: object) -> Pattern:
+    """Return a pattern for subjects of type schema; see the module docstring."""
+    if schema is typing.Any or schema is object:
+        return pattern
+    origin = typing.get_origin(schema)
+    if origin is not None and origin is _ANNOTATED:
+        return specialize(pattern, typing.get_args(schema)[0])
+    if origin in _UNION_TYPES:
+        return _specialize_union(pattern, typing.get_args(schema))
+    if schema in (float, complex):
+        return _specialize_union(pattern, _NUMERIC_TOWER[schema], _specialize)
+    if origin is typing.Literal:
+        values = typing.get_args(schema)
+        if all(pattern.match(v) is None for v in values):
+            return NeverPattern(f"no value of {schema!r} matches")
+        return pattern
+    return _specialize(pattern, schema)
+
+
+def _specialize_union(
+    pattern: Pattern,
+    schemas: Sequence[object],
+    arm: Callable[[Pattern, object], Pattern] = specialize,
+) -> Pattern:
+    """Specialize for a subject of one of several types."""
+    arms = [(s, arm(pattern, s)) for s in schemas]
+    possible = [(s, p) for s, p in arms if not isinstance(p, NeverPattern)]
+    if not possible:
+        reasons = "; ".join(p.reason for _, p in arms)  # type: ignore
+        return NeverPattern(reasons)
+    if len(possible) == len(arms) and all(p is possible[0][1] for _, p in possible):
+        return possible[0][1]  # The same for every arm.
+    if len(possible) == 1:
+        s, p = possible[0]
+        cls = _runtime_class(s)
+        others = [_runtime_class(other) for other, _ in arms if other is not s]
+        if (
+            cls is not None
+            and cls not in _NUMERIC_TOWER  # AnnotatedPattern admits ints for float.
+            and all(c is not None and not issubclass(c, cls) for c in others)
+        ):
+            # Checking the class is enough to tell the arms apart.
+            return AnnotatedPattern(p, cls)
+    return pattern
+
+
+def _specialize(pattern: Pattern, schema: object) -> Pattern:
+    cls = _runtime_class(schema)
+
+    if isinstance(pattern, VariablePattern):
+        return pattern
+
+    if isinstance(pattern, WalrusPattern):
+        inner = specialize(pattern.pattern, schema)
+        if isinstance(inner, NeverPattern):
+            return inner
+        return WalrusPattern(pattern.name, inner)
+
+    if isinstance(pattern, AlternativesPattern):
+        if isinstance(pattern, NeverPattern):
+            return pattern
+        alternatives = [specialize(p, schema) for p in pattern.patterns]
+        kept = [p for p in alternatives if not isinstance(p, NeverPattern)]
+        if not kept:
+            return NeverPattern(f"no alternative matches {schema!r}")
+        if len(kept) == 1:
+            return kept[0]
+        return AlternativesPattern(kept)
+
+    if cls is None:
+        return pattern
+
+    if isinstance(pattern, ConstantPattern):
+        if _disjoint(cls, type(pattern.constant)):
+            return NeverPattern(f"{pattern.constant!r} is not a {cls.__name__}")
+        return pattern
+
+    if isinstance(pattern, AnnotatedPattern):
+        if _disjoint(cls, pattern.cls):
+            return NeverPattern(f"{cls.__name__} is not a {pattern.cls.__name__}")
+        inner = specialize(pattern.pattern, schema)
+        if isinstance(inner, NeverPattern):
+            return inner
+        if issubclass(cls, pattern.cls) or (pattern.cls is float and issubclass(cls, int)):
+            return inner  # The schema guarantees the class.
+        return AnnotatedPattern(inner, pattern.cls)
+
+    if isinstance(pattern, SequencePattern):
+        return _specialize_sequence(pattern, schema, cls)
+
+    if isinstance(pattern, MappingPattern):
+        return _specialize_mapping(pattern, schema, cls)
+
+    if isinstance(pattern, InstancePattern):
+        return _specialize_instance(pattern, cls)
+
+    return pattern
+
+
+def _children(patterns: Sequence[Pattern], schemas: Sequence[object]) -> Optional[List[Pattern]]:
+    """Specialize patterns, or return None if one of them can't match."""
+    result = []
+    for p, s in zip(patterns, schemas):
+        p = specialize(p, s)
+        if isinstance(p, NeverPattern):
+            return None
+        result.append(p)
+    return result
+
+
+def _specialize_sequence(pattern: SequencePattern, schema: object, cls: type) -> Pattern:
+    n = len(pattern.patterns)
+    if not issubclass(cls, _SEQUENCES):
+        if cls.__module__ == "builtins" and (
+            issubclass(cls, (str, bytes)) or not issubclass(cls, cabc.Sequence)
+        ):
+            return NeverPattern(f"{cls.__name__} is not matched by sequence patterns")
+        return pattern
+    args = typing.get_args(schema)
+    if issubclass(cls, tuple) and args and args[-1] is not Ellipsis and args != ((),):
+        if len(args) != n:
+            return NeverPattern(f"{schema!r} has length {len(args)}, not {n}")
+        children = _children(pattern.patterns, args)
+        if children is None:
+            return NeverPattern(f"an item of {schema!r} can't match")
+        return TrustedSequencePattern(children, check_length=False)
+    item = args[0] if args else typing.Any
+    children = _children(pattern.patterns, [item] * n)
+    if children is None:
+        return NeverPattern(f"an item of {schema!r} can't match")
+    return TrustedSequencePattern(children, check_length=True)
+
+
+def _specialize_mapping(pattern: MappingPattern, schema: object, cls: type) -> Pattern:
+    if _is_typeddict(schema):
+        hints = _hints(schema)  # type: ignore
+        schemas = [hints.get(k, typing.Any) if isinstance(k, str) else typing.Any for k in pattern.keys]
+    elif issubclass(cls, _MAPPINGS):
+        args = typing.get_args(schema)
+        key_type, value_type = args if len(args) == 2 else (typing.Any, typing.Any)
+        key_class = _runtime_class(key_type)
+        for key in pattern.keys:
+            if (
+                key_class is not None
+                and not (isinstance(key, _NUMBERS) and issubclass(key_class, _NUMBERS))
+                and _disjoint(key_class, type(key))
+            ):
+                return NeverPattern(f"{key!r} can't be a key of {schema!r}")
+        schemas = [value_type] * len(pattern.keys)
+    else:
+        if cls.__module__ == "builtins" and not issubclass(cls, cabc.Mapping):
+            return NeverPattern(f"{cls.__name__} is not a mapping")
+        return pattern
+    children = _children(pattern.values, schemas)
+    if children is None:
+        return NeverPattern(f"a value of {schema!r} can't match")
+    return TrustedMappingPattern(dict(zip(pattern.keys, children)))
+
+
+def _specialize_instance(pattern: InstancePattern, cls: type) -> Pattern:
+    if _disjoint(cls, pattern.cls):
+        return NeverPattern(f"{cls.__name__} is not a {pattern.cls.__name__}")
+    if not (issubclass(cls, pattern.cls) and dataclasses.is_dataclass(cls)):
+        return pattern
+    fields = [f.name for f in dataclasses.fields(cls)]
+    if len(pattern.posargs) > len(fields):
+        return pattern  # A subclass may have more fields.
+    names = fields[: len(pattern.posargs)]
+    hints = _hints(cls)
+    schemas = [hints.get(name, typing.Any) for name in names + list(pattern.kwnames)]
+    children = _children(pattern.posargs + pattern.kwpatterns, schemas)
+    if children is None:
+        return NeverPattern(f"an attribute of {cls.__name__} can't match")
+    npos = len(pattern.posargs)
+    kwargs = dict(zip(pattern.kwnames, children[npos:]))
+    return TrustedInstancePattern(pattern.cls, children[:npos], kwargs, names)
+
+
+def unmatchable(
+    pattern_or_cases: "Pattern | Sequence[Pattern]", schema: object
+) -> List[Tuple[int, str]]:
+    """The cases that can never match a subject of type schema.
+
+    Returns (case index, reason) pairs.
+    """
+    result = []
+    for i, case in enumerate(_as_cases(pattern_or_cases)):
+        specialized = specialize(case, schema)
+        if isinstance(specialized, NeverPattern):
+            result.append((i, specialized.reason))
+    return result
@@ -0,0 +1,229 @@
+# mypy: disallow-untyped-defs
+"""Patterns matching strings by prefix, suffix and regular expression.
+
+``StringPattern(prefix, suffix, regex)`` matches a str that starts
+with prefix and ends with suffix (without overlapping), where the rest
+in between fully matches regex; the named groups of regex become
+bindings.  For example::
+
+    StringPattern("/users/", regex=r"(?P<id>\\d+)")
+
+matches ``"/users/42"`` and binds ``id`` to ``"42"``.
+
+``StringDispatch(cases)`` matches a subject against a case list like
+``match_first()``, but combines the string patterns in it into one
+alternation regex, so a single scan finds the first string case that
+matches.  Each case is a branch wrapped in a group of its own; the
+regex engine tries the branches in order, so the wrapper group that
+matched (``lastindex``) is the first matching case.
+"""
+
+import re
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from patma import CaseMatch, Pattern, _init
+
+__all__ = ["StringDispatch", "StringPattern"]
+
+# Flags that can be given to one branch of a combined regex.
+_SCOPED_FLAGS = {re.ASCII: "a", re.IGNORECASE: "i", re.MULTILINE: "m", re.DOTALL: "s"}
+
+_GLOBAL_FLAGS = re.compile(r"\(\?[aiLmsux]+\)")
+
+
+class StringPattern(Pattern):
+    """A pattern matching a str by prefix, suffix and regex.
+
+    An empty prefix or suffix always matches, as does a regex of None.
+    flags are passed to ``re.compile()`` and apply to the prefix and
+    suffix as well, so with ``re.IGNORECASE`` they match in any case.
+    """
+
+    __slots__ = ("prefix", "suffix", "regex", "flags", "compiled")
+    prefix: str
+    suffix: str
+    regex: Optional[str]
+    flags: int
+    compiled: "Optional[re.Pattern[str]]"  # The regex for the whole subject, if needed.
+
+    def __init__(self, prefix: str = "", suffix: str = "", regex: Optional[str] = None, flags: int = 0):
+        compiled = None
+        if regex is not None or flags:
+            compiled = re.compile(_source(prefix, suffix, regex, flags), flags)
+        _init(self, prefix=prefix, suffix=suffix, regex=regex, flags=flags, compiled=compiled)
+
+    def _args(self) -> Tuple:
+        return (self.prefix, self.suffix, self.regex, self.flags)
+
+    def match(self, x: object) -> Optional[Dict[str, object]]:
+        if not isinstance(x, str):
+            return None
+        if self.compiled is not None:
+            m = self.compiled.fullmatch(x)
+            return None if m is None else m.groupdict()
+        if (
+            len(x) >= len(self.prefix) + len(self.suffix)
+            and x.startswith(self.prefix)
+            and x.endswith(self.suffix)
+        ):
+            return {}
+        return None
+
+    def translate(self, target: str) -> str:
+        if self.compiled is None:
+            return (
+                f"(isinstance({target}, str) and len({target}) >= {len(self.prefix) + len(self.suffix)}"
+                f" and {target}.startswith({self.prefix!r}) and {target}.endswith({self.suffix!r}))"
+            )
+        names = list(self.compiled.groupindex)
+        check = (
+            f"isinstance({target}, str) and (_m := __import__('re').fullmatch("
+            f"{self.compiled.pattern!r}, {target}, {int(self.flags)})) is not None"
+        )
+        if not names:
+            return f"({check})"
+        assignments = "".join(f"{name} := _m.group({name!r}), " for name in names)
+        return f"({check} and ({assignments}))"
+
+    def bindings(self, strict: bool = True) -> Set[str]:
+        if self.compiled is None:
+            return set()
+        return set(self.compiled.groupindex) - {"_"}
+
+
+def _source(prefix: str, suffix: str, regex: Optional[str], flags: int = 0) -> str:
+    """A regex fully matching the strings a StringPattern matches."""
+    if regex is None:
+        middle = "(?s:.*)"
+    elif flags & re.VERBOSE:
+        middle = f"(?:{regex}\n)"  # End a trailing comment.
+    else:
+        middle = f"(?:{regex})"
+    return re.escape(prefix) + middle + re.escape(suffix)
+
+
+def _branch(pattern: StringPattern) -> Optional[str]:
+    """The source of pattern for a combined regex, if it can be combined.
+
+    Group names are removed (so cases can use the same names) without
+    changing the group numbers.  Regexes whose groups can't be
+    renumbered (backreferences, conditionals) or that set global flags
+    aren't combined.
+    """
+    if pattern.flags & ~(re.UNICODE | sum(_SCOPED_FLAGS)):
+        return None
+    regex = pattern.regex
+    if regex is not None and _GLOBAL_FLAGS.search(regex):
+        return None
+    if regex is None:
+        source: Optional[str] = _source(pattern.prefix, pattern.suffix, None)
+    else:
+        source = _branch_source(pattern, regex)
+        if source is None:
+            return None
+    letters = "".join(v for k, v in _SCOPED_FLAGS.items() if pattern.flags & k)
+    if letters:
+        return f"(?{letters}:{source})"
+    return source
+
+
+def _branch_source(pattern: StringPattern, regex: str) -> Optional[str]:
+    """The source of pattern with group names removed, if possible."""
+    out = []
+    i, n = 0, len(regex)
+    in_class = False
+    while i < n:
+        c = regex[i]
+        if c == "\\":
+            if not in_class and regex[i + 1 : i + 2] in tuple("123456789"):
+                return None  # A numbered backreference.
+            out.append(regex[i : i + 2])
+            i += 2
+        elif in_class:
+            in_class = c != "]"
+            out.append(c)
+            i += 1
+        elif c == "[":
+            in_class = True
+            j = i + 1
+            if regex.startswith("^", j):
+                j += 1
+            if regex.startswith("]", j):
+                j += 1  # A leading "]" is literal.
+            out.append(regex[i:j])
+            i = j
+        elif regex.startswith("(?P<", i):
+            out.append("(")
+            i = regex.index(">", i) + 1
+        elif regex.startswith("(?P=", i) or regex.startswith("(?(", i):
+            return None
+        else:
+            out.append(c)
+            i += 1
+    source = _source(pattern.prefix, pattern.suffix, "".join(out))
+    try:
+        groups = re.compile(source, pattern.flags).groups
+    except re.error:
+        return None
+    assert pattern.compiled is not None
+    if groups != pattern.compiled.groups:
+        return None
+    return source
+
+
+class StringDispatch:
+    """Match a subject against many cases, mostly string patterns.
+
+    Gives the same results as ``patma.match_first()`` over the case
+    list.  The StringPatterns are combined into one regex; the other
+    cases (and string patterns that can't be combined) are tried in
+    order only up to the first string case that matched.
+    """
+
+    def __init__(self, cases: Sequence[Pattern]):
+        self.cases = tuple(cases)
+        branches = []
+        # Wrapper group number -> case index and its {name: group number}.
+        self._groups: Dict[int, Tuple[int, Dict[str, int]]] = {}
+        self._others: List[int] = []  # Cases not in the combined regex.
+        self._nonstring: List[int] = []  # Cases that can match non-str subjects.
+        group = 1
+        for i, case in enumerate(self.cases):
+            branch = _branch(case) if isinstance(case, StringPattern) else None
+            if branch is None:
+                self._others.append(i)
+                if not isinstance(case, StringPattern):
+                    self._nonstring.append(i)
+                continue
+            assert isinstance(case, StringPattern)
+            names = case.compiled.groupindex if case.compiled is not None else {}
+            self._groups[group] = (i, {name: group + j for name, j in names.items()})
+            branches.append(f"({branch})")
+            group += 1 + (case.compiled.groups if case.compiled is not None else 0)
+        self.combined: "Optional[re.Pattern[str]]" = None
+        if branches:
+            self.combined = re.compile("|".join(branches))
+
+    def match_first(self, x: object) -> Optional[CaseMatch]:
+        cases = self.cases
+        if not isinstance(x, str):
+            for i in self._nonstring:
+                match = cases[i].match(x)
+                if match is not None:
+                    return i, match
+            return None
+        m = self.combined.fullmatch(x) if self.combined is not None else None
+        if m is None:
+            first = len(cases)
+        else:
+            assert m.lastindex is not None  # The wrapper group closes last.
+            first, names = self._groups[m.lastindex]
+        for i in self._others:
+            if i > first:
+                break
+            match = cases[i].match(x)
+            if match is not None:
+                return i, match
+        if m is None:
+            return None
+        return first, {name: m.group(j) for name, j in names.items()}
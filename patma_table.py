@@ -0,0 +1,689 @@
+# mypy: disallow-untyped-defs
+"""A flat, array-backed representation of a list of patterns.
+
+A ``PatternTable`` stores every node as a fixed-size record of ints::
+
+    kind, arg, arg2, first_child, child_count
+
+in one ``array('i')`` (or any buffer cast to ints, e.g. an mmap).  The
+nodes are laid out breadth-first, so the children of a node are the
+contiguous records ``first_child .. first_child + child_count - 1``,
+and the case patterns themselves are records ``0 .. len(table) - 1``.
+``arg`` and ``arg2`` index a side table of Python objects (constants,
+names, mapping keys, classes), with -1 meaning unused.  Equal objects
+are stored once.
+
+The table is matched directly by ``PatternTable.match()``, with the
+same results as the ``Pattern`` objects it was built from.
+
+``dump()``/``load()`` save and load tables in a compact, versioned
+binary format that doesn't use pickle; loading doesn't construct any
+Pattern objects.  ``freeze()`` embeds that format in the source of a
+Python module, so a precompiled rule set can be imported.
+"""
+
+import array
+import collections.abc as cabc
+import enum
+import importlib
+import mmap
+import struct
+import sys
+from typing import IO, Dict, FrozenSet, List, Optional, Sequence, Set, Tuple, Union
+
+from patma import (
+    AlternativesPattern,
+    AnnotatedPattern,
+    CaseMatch,
+    ConstantPattern,
+    DuplicateBindings,
+    InconsistentBindings,
+    InstancePattern,
+    MappingPattern,
+    Pattern,
+    SequencePattern,
+    VariablePattern,
+    WalrusPattern,
+    _as_cases,
+    _is_instance,
+    _is_sequence,
+    _positional_fields,
+)
+
+__all__ = ["PatternTable", "dump", "dumps", "freeze", "load", "loads"]
+
+CONSTANT = 0
+ALTERNATIVES = 1
+VARIABLE = 2
+ANNOTATED = 3
+SEQUENCE = 4
+MAPPING = 5
+INSTANCE = 6
+WALRUS = 7
+
+RECORD = 5  # Ints per node.
+
+_MAGIC = b"PATT"
+_VERSION = 2
+_HEADER = struct.Struct("<4sBxxxIII")  # magic, version, nroots, nnodes, nobjects
+
+_NodeArray = Union["array.array[int]", memoryview]
+
+
+class PatternTable:
+    """A list of patterns flattened into an array of node records."""
+
+    def __init__(self, nodes: _NodeArray, objects: List[object], nroots: int):
+        self.nodes = nodes
+        self.objects = objects
+        self.nroots = nroots
+        # Class references loaded by name, imported on first use.
+        self._refs = [i for i, o in enumerate(objects) if isinstance(o, _Ref)]
+
+    def _resolve(self) -> None:
+        # Several threads may get here at once; resolving is idempotent.
+        for i in self._refs:
+            obj = self.objects[i]
+            if isinstance(obj, _Ref):
+                self.objects[i] = obj.resolve()
+        self._refs = []
+
+    def __len__(self) -> int:
+        return self.nroots
+
+    @classmethod
+    def from_patterns(
+        cls, pattern_or_cases: Union[Pattern, Sequence[Pattern]]
+    ) -> "PatternTable":
+        order: List[Pattern] = list(_as_cases(pattern_or_cases))
+        nroots = len(order)
+        nodes = array.array("i")
+        objects: List[object] = []
+        index: Dict[object, int] = {}
+
+        def obj(value: object) -> int:
+            try:
+                key: object = (type(value), value)
+                hash(key)
+            except TypeError:
+                key = id(value)
+            i = index.get(key)
+            if i is None:
+                i = index[key] = len(objects)
+                objects.append(value)
+            return i
+
+        i = 0
+        while i < len(order):
+            p = order[i]
+            i += 1
+            arg = arg2 = -1
+            children: Sequence[Pattern] = ()
+            if isinstance(p, ConstantPattern):
+                kind = CONSTANT
+                arg = obj(p.constant)
+            elif isinstance(p, AlternativesPattern):
+                kind = ALTERNATIVES
+                children = p.patterns
+            elif isinstance(p, VariablePattern):
+                kind = VARIABLE
+                arg = obj(p.name)
+            elif isinstance(p, AnnotatedPattern):
+                kind = ANNOTATED
+                arg = obj(p.cls)
+                children = (p.pattern,)
+            elif isinstance(p, SequencePattern):
+                kind = SEQUENCE
+                children = p.patterns
+            elif isinstance(p, MappingPattern):
+                kind = MAPPING
+                arg = obj(p.keys)
+                children = p.values
+            elif isinstance(p, InstancePattern):
+                kind = INSTANCE
+                arg = obj(p.cls)
+                arg2 = obj(p.kwnames)
+                children = p.posargs + p.kwpatterns
+            elif isinstance(p, WalrusPattern):
+                kind = WALRUS
+                arg = obj(p.name)
+                children = (p.pattern,)
+            else:
+                raise TypeError(f"Can't flatten {type(p).__name__}")
+            nodes.extend((kind, arg, arg2, len(order), len(children)))
+            order.extend(children)
+        return cls(nodes, objects, nroots)
+
+    def pattern(self, i: int) -> Pattern:
+        """Rebuild the Pattern object for node i."""
+        if self._refs:
+            self._resolve()
+        nodes = self.nodes
+        base = i * RECORD
+        kind, arg, arg2, first, count = nodes[base : base + RECORD]
+        children = [self.pattern(c) for c in range(first, first + count)]
+        if kind == CONSTANT:
+            return ConstantPattern(self.objects[arg])
+        if kind == ALTERNATIVES:
+            return AlternativesPattern(children)
+        if kind == VARIABLE:
+            return VariablePattern(self.objects[arg])  # type: ignore
+        if kind == ANNOTATED:
+            return AnnotatedPattern(children[0], self.objects[arg])  # type: ignore
+        if kind == SEQUENCE:
+            return SequencePattern(children)
+        if kind == MAPPING:
+            return MappingPattern(dict(zip(self.objects[arg], children)))  # type: ignore
+        if kind == INSTANCE:
+            kwnames: Tuple[str, ...] = self.objects[arg2]  # type: ignore
+            npos = count - len(kwnames)
+            return InstancePattern(
+                self.objects[arg],  # type: ignore
+                children[:npos],
+                dict(zip(kwnames, children[npos:])),
+            )
+        if kind == WALRUS:
+            return WalrusPattern(self.objects[arg], children[0])  # type: ignore
+        raise ValueError(f"Bad node kind {kind} at {i}")
+
+    def patterns(self) -> List[Pattern]:
+        return [self.pattern(i) for i in range(self.nroots)]
+
+    def match(self, i: int, x: object) -> Optional[Dict[str, object]]:
+        """Match x against node i, like Pattern.match()."""
+        if self._refs:
+            self._resolve()
+        return self._match(i, x)
+
+    def _match(self, i: int, x: object) -> Optional[Dict[str, object]]:
+        nodes = self.nodes
+        base = i * RECORD
+        kind = nodes[base]
+        if kind == CONSTANT:
+            constant = self.objects[nodes[base + 1]]
+            if _is_instance(x, type(constant)) and x == constant:
+                return {}
+            return None
+        if kind == VARIABLE:
+            return {self.objects[nodes[base + 1]]: x}  # type: ignore
+        first = nodes[base + 3]
+        count = nodes[base + 4]
+        if kind == SEQUENCE:
+            if (
+                type(x) is tuple or type(x) is list or _is_sequence(x)
+            ) and len(x) == count:  # type: ignore
+                matches: Dict[str, object] = {}
+                for child, item in zip(range(first, first + count), x):  # type: ignore
+                    match = self._match(child, item)
+                    if match is None:
+                        return None
+                    matches.update(match)
+                return matches
+            return None
+        if kind == ALTERNATIVES:
+            for child in range(first, first + count):
+                match = self._match(child, x)
+                if match is not None:
+                    return match
+            return None
+        if kind == ANNOTATED:
+            if _is_instance(x, self.objects[nodes[base + 1]]):  # type: ignore
+                return self._match(first, x)
+            return None
+        if kind == MAPPING:
+            if not isinstance(x, cabc.Mapping):
+                return None
+            keys: Tuple[object, ...] = self.objects[nodes[base + 1]]  # type: ignore
+            matches = {}
+            for key, child in zip(keys, range(first, first + count)):
+                try:
+                    value = x[key]
+                except KeyError:
+                    return None
+                match = self._match(child, value)
+                if match is None:
+                    return None
+                matches.update(match)
+            return matches
+        if kind == INSTANCE:
+            return self._match_instance(base, x)
+        if kind == WALRUS:
+            match = self._match(first, x)
+            if match is not None:
+                match[self.objects[nodes[base + 1]]] = x  # type: ignore
+            return match
+        raise ValueError(f"Bad node kind {kind} at {i}")
+
+    def _match_instance(self, base: int, x: object) -> Optional[Dict[str, object]]:
+        nodes = self.nodes
+        if not _is_instance(x, self.objects[nodes[base + 1]]):  # type: ignore
+            return None
+        kwnames: Tuple[str, ...] = self.objects[nodes[base + 2]]  # type: ignore
+        first = nodes[base + 3]
+        npos = nodes[base + 4] - len(kwnames)
+        fields = _positional_fields(x)
+        if npos > len(fields):
+            return None
+        names = fields[:npos] + kwnames
+        missing = object()
+        matches: Dict[str, object] = {}
+        for child, name in enumerate(names, first):
+            value = getattr(x, name, missing)
+            if value is missing:
+                return None
+            match = self._match(child, value)
+            if match is None:
+                return None
+            matches.update(match)
+        return matches
+
+    def match_first(self, x: object) -> Optional[CaseMatch]:
+        """Like patma.match_first() over the table's cases."""
+        if self._refs:
+            self._resolve()
+        for i in range(self.nroots):
+            match = self._match(i, x)
+            if match is not None:
+                return i, match
+        return None
+
+    def check_bindings(self) -> List[Set[str]]:
+        """Compute bindings() of every case in one pass over the table.
+
+        Raises the same BindingsError subclasses as
+        Pattern.bindings(strict=True).  Since children always follow
+        their parent, walking the records backwards visits every node
+        after its children.
+        """
+        nodes = self.nodes
+        kinds, args, firsts, counts = (
+            nodes[k::RECORD].tolist() for k in (0, 1, 3, 4)  # type: ignore
+        )
+        objects = self.objects
+        empty: FrozenSet[str] = frozenset()
+        names: Dict[int, FrozenSet[str]] = {}  # Shared sets for VARIABLE nodes.
+        unions: Dict[Tuple[int, Tuple[FrozenSet[str], ...]], FrozenSet[str]] = {}
+        result: List[FrozenSet[str]] = [empty] * len(kinds)
+        for i in reversed(range(len(kinds))):
+            kind = kinds[i]
+            if kind == CONSTANT:
+                continue
+            arg = args[i]
+            first = firsts[i]
+            count = counts[i]
+            if kind == VARIABLE:
+                b = names.get(arg)
+                if b is None:
+                    name = objects[arg]
+                    b = names[arg] = empty if name == "_" else frozenset((name,))  # type: ignore
+                result[i] = b
+            elif kind == ALTERNATIVES:
+                if count:
+                    b0 = result[first]
+                    for j in range(1, count):
+                        b = result[first + j]
+                        if b != b0:
+                            raise InconsistentBindings(
+                                f"Alternatives 0 and {j} bind inconsistent sets of variables: "
+                                + f"{sorted(b0)} vs. {sorted(b)} "
+                                + f"(difference: {sorted(b ^ b0)})"
+                            )
+                    result[i] = b0
+            elif kind in (ANNOTATED, WALRUS):
+                b = result[first]
+                if kind == WALRUS and objects[arg] != "_":
+                    if objects[arg] in b:
+                        raise DuplicateBindings("Duplicate bindings in walrus pattern")
+                    b = b | {objects[arg]}  # type: ignore
+                result[i] = b
+            elif kind in _COMPOUND:
+                # Generated rule sets repeat the same shapes, so memoize
+                # on the children's bindings.
+                key = (kind, tuple(result[first : first + count]))
+                union = unions.get(key)
+                if union is None:
+                    acc: Set[str] = set()
+                    for b in key[1]:
+                        if b & acc:
+                            raise DuplicateBindings(
+                                f"Duplicate bindings in {_COMPOUND[kind]} pattern: "
+                                + f"{sorted(b & acc)}"
+                            )
+                        acc |= b
+                    union = unions[key] = frozenset(acc)
+                result[i] = union
+        return [set(b) for b in result[: self.nroots]]
+
+    def to_bytes(self) -> bytes:
+        """Serialize to the binary format described in dumps()."""
+        nodes = array.array("i", self.nodes)
+        if sys.byteorder != "little":
+            nodes.byteswap()
+        writer = _Writer()
+        for obj in self.objects:
+            writer.write(obj)
+        header = _HEADER.pack(
+            _MAGIC, _VERSION, self.nroots, len(nodes) // RECORD, len(self.objects)
+        )
+        return header + nodes.tobytes() + writer.strings() + writer.out
+
+    @classmethod
+    def from_buffer(
+        cls, buffer: Union[bytes, memoryview, mmap.mmap]
+    ) -> "PatternTable":
+        """Load from to_bytes() output, e.g. an mmap of a file.
+
+        On little-endian machines the node array is used in place,
+        without copying.  Classes are imported on first use.
+        """
+        view = memoryview(buffer)
+        if len(view) < _HEADER.size:
+            raise ValueError("Not a pattern table")
+        magic, version, nroots, nnodes, nobjects = _HEADER.unpack_from(view)
+        if magic != _MAGIC:
+            raise ValueError("Not a pattern table")
+        if version != _VERSION:
+            raise ValueError(f"Unsupported pattern table version {version}")
+        start = _HEADER.size
+        end = start + nnodes * RECORD * 4
+        nodes: _NodeArray = view[start:end].cast("i")
+        if sys.byteorder != "little":
+            nodes = array.array("i", nodes)
+            nodes.byteswap()
+        reader = _Reader(view, end)
+        objects = [reader.read() for _ in range(nobjects)]
+        return cls(nodes, objects, nroots)
+
+
+# Serialization format
+# --------------------
+#
+# After the header and the node array (little-endian int32) come:
+#
+# - The string table: a u32 count n, n + 1 u32 offsets into a blob,
+#   then the UTF-8 blob itself.
+# - The objects, each a tag byte followed by a tag-specific payload;
+#   strings (including class names) are u32 string table indices.
+
+_U32 = struct.Struct("<I")
+_I64 = struct.Struct("<q")
+_F64 = struct.Struct("<d")
+_C128 = struct.Struct("<dd")
+
+_NONE = 0
+_FALSE = 1
+_TRUE = 2
+_INT = 3  # i64
+_BIGINT = 4  # u32 length, signed little-endian bytes
+_FLOAT = 5  # f64
+_COMPLEX = 6  # f64 real, f64 imag
+_STR = 7  # string index
+_BYTES = 8  # u32 length, bytes
+_TUPLE = 9  # u32 count, objects
+_CLASS = 10  # string index of "module:qualname"
+_ENUM = 11  # class string index, member name string index
+
+_COMPOUND = {SEQUENCE: "sequence", MAPPING: "mapping", INSTANCE: "instance"}
+
+
+def _qualified_name(obj: object) -> str:
+    name = f"{obj.__module__}:{obj.__qualname__}"  # type: ignore
+    if "<locals>" in name or _import_name(name) is not obj:
+        raise TypeError(f"Can't serialize reference to {obj!r}: not importable")
+    return name
+
+
+def _import_name(name: str) -> object:
+    module, _, qualname = name.partition(":")
+    obj: object = importlib.import_module(module)
+    for attr in qualname.split("."):
+        obj = getattr(obj, attr)
+    return obj
+
+
+class _Ref:
+    """A placeholder for an object that must be imported by name."""
+
+    def resolve(self) -> object:
+        raise NotImplementedError
+
+
+class _ClassRef(_Ref):
+    def __init__(self, name: str):
+        self.name = name
+
+    def resolve(self) -> object:
+        return _import_name(self.name)
+
+
+class _EnumRef(_Ref):
+    def __init__(self, cls: str, member: str):
+        self.cls = cls
+        self.member = member
+
+    def resolve(self) -> object:
+        return getattr(_import_name(self.cls), self.member)
+
+
+class _TupleRef(_Ref):
+    def __init__(self, items: List[object]):
+        self.items = items
+
+    def resolve(self) -> object:
+        return tuple(i.resolve() if isinstance(i, _Ref) else i for i in self.items)
+
+
+class _Writer:
+    def __init__(self) -> None:
+        self.out = bytearray()
+        self.index: Dict[str, int] = {}
+
+    def string(self, s: str) -> bytes:
+        i = self.index.get(s)
+        if i is None:
+            i = self.index[s] = len(self.index)
+        return _U32.pack(i)
+
+    def strings(self) -> bytes:
+        blob = bytearray()
+        offsets = array.array("I", [0])
+        for s in self.index:  # Insertion order is index order.
+            blob += s.encode("utf-8", "surrogatepass")
+            offsets.append(len(blob))
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        return _U32.pack(len(self.index)) + offsets.tobytes() + blob
+
+    def write(self, obj: object) -> None:
+        out = self.out
+        if obj is None:
+            out.append(_NONE)
+        elif obj is False:
+            out.append(_FALSE)
+        elif obj is True:
+            out.append(_TRUE)
+        elif isinstance(obj, enum.Enum):
+            out.append(_ENUM)
+            out += self.string(_qualified_name(type(obj)))
+            out += self.string(obj.name)
+        elif type(obj) is int:
+            if -(2 ** 63) <= obj < 2 ** 63:
+                out.append(_INT)
+                out += _I64.pack(obj)
+            else:
+                data = obj.to_bytes((obj.bit_length() + 8) // 8, "little", signed=True)
+                out.append(_BIGINT)
+                out += _U32.pack(len(data)) + data
+        elif type(obj) is float:
+            out.append(_FLOAT)
+            out += _F64.pack(obj)
+        elif type(obj) is complex:
+            out.append(_COMPLEX)
+            out += _C128.pack(obj.real, obj.imag)
+        elif type(obj) is str:
+            out.append(_STR)
+            out += self.string(obj)
+        elif type(obj) is bytes:
+            out.append(_BYTES)
+            out += _U32.pack(len(obj)) + obj
+        elif type(obj) is tuple:
+            out.append(_TUPLE)
+            out += _U32.pack(len(obj))
+            for item in obj:
+                self.write(item)
+        elif isinstance(obj, type):
+            out.append(_CLASS)
+            out += self.string(_qualified_name(obj))
+        # Unresolved references from a loaded table are written back as is.
+        elif isinstance(obj, _ClassRef):
+            out.append(_CLASS)
+            out += self.string(obj.name)
+        elif isinstance(obj, _EnumRef):
+            out.append(_ENUM)
+            out += self.string(obj.cls)
+            out += self.string(obj.member)
+        elif isinstance(obj, _TupleRef):
+            out.append(_TUPLE)
+            out += _U32.pack(len(obj.items))
+            for item in obj.items:
+                self.write(item)
+        else:
+            raise TypeError(f"Can't serialize constant of type {type(obj).__name__}")
+
+
+class _Reader:
+    def __init__(self, view: memoryview, pos: int):
+        (count,) = _U32.unpack_from(view, pos)
+        pos += 4
+        offsets = view[pos : pos + 4 * (count + 1)].cast("I").tolist()
+        if sys.byteorder != "little":
+            swapped = array.array("I", offsets)
+            swapped.byteswap()
+            offsets = swapped.tolist()
+        pos += 4 * (count + 1)
+        blob = bytes(view[pos : pos + offsets[-1]])
+        self.table = [
+            blob[offsets[i] : offsets[i + 1]].decode("utf-8", "surrogatepass")
+            for i in range(count)
+        ]
+        self.view = view
+        self.pos = pos + offsets[-1]
+
+    def u32(self) -> int:
+        (value,) = _U32.unpack_from(self.view, self.pos)
+        self.pos += 4
+        return value
+
+    def string(self) -> str:
+        return self.table[self.u32()]
+
+    def read(self) -> object:
+        tag = self.view[self.pos]
+        self.pos += 1
+        if tag == _STR:
+            return self.string()
+        if tag == _NONE:
+            return None
+        if tag == _FALSE:
+            return False
+        if tag == _TRUE:
+            return True
+        if tag == _INT:
+            (value,) = _I64.unpack_from(self.view, self.pos)
+            self.pos += 8
+            return value
+        if tag == _FLOAT:
+            (value,) = _F64.unpack_from(self.view, self.pos)
+            self.pos += 8
+            return value
+        if tag == _TUPLE:
+            items = [self.read() for _ in range(self.u32())]
+            if any(isinstance(item, _Ref) for item in items):
+                return _TupleRef(items)
+            return tuple(items)
+        if tag == _CLASS:
+            return _ClassRef(self.string())
+        if tag == _ENUM:
+            cls = self.string()
+            return _EnumRef(cls, self.string())
+        if tag == _BIGINT:
+            n = self.u32()
+            data = bytes(self.view[self.pos : self.pos + n])
+            self.pos += n
+            return int.from_bytes(data, "little", signed=True)
+        if tag == _COMPLEX:
+            real, imag = _C128.unpack_from(self.view, self.pos)
+            self.pos += 16
+            return complex(real, imag)
+        if tag == _BYTES:
+            n = self.u32()
+            data = bytes(self.view[self.pos : self.pos + n])
+            self.pos += n
+            return data
+        raise ValueError(f"Bad object tag {tag}")
+
+
+def dumps(pattern_or_cases: Union[Pattern, Sequence[Pattern]]) -> bytes:
+    """Serialize a list of patterns to bytes.
+
+    The format is a header (magic ``PATT``, format version, and the
+    case, node and object counts), the node array of a PatternTable,
+    a string table and the encoded constants.  Constants may be None,
+    bools, ints, floats, complex numbers, str, bytes, tuples of these,
+    importable classes and enum members; classes and enums are stored
+    by qualified name.
+    """
+    return PatternTable.from_patterns(pattern_or_cases).to_bytes()
+
+
+def loads(
+    data: Union[bytes, memoryview, mmap.mmap], validate: bool = True
+) -> PatternTable:
+    """Load dumps() output as a PatternTable.
+
+    If validate is true, check the bindings of every case (see
+    PatternTable.check_bindings()).  Use table.patterns() to get
+    Pattern objects back.
+    """
+    table = PatternTable.from_buffer(data)
+    if validate:
+        table.check_bindings()
+    return table
+
+
+def dump(pattern_or_cases: Union[Pattern, Sequence[Pattern]], file: IO[bytes]) -> None:
+    file.write(dumps(pattern_or_cases))
+
+
+def load(file: IO[bytes], validate: bool = True) -> PatternTable:
+    """Load a table from a binary file, using mmap where possible."""
+    try:
+        fileno = file.fileno()
+        data: Union[bytes, mmap.mmap] = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):  # ValueError: an empty file.
+        data = file.read()
+    return loads(data, validate)
+
+
+def freeze(
+    pattern_or_cases: Union[Pattern, Sequence[Pattern]], file: IO[str], name: str = "TABLE"
+) -> None:
+    """Write the source of a module that defines name as a PatternTable.
+
+    The module holds dumps() output as a bytes constant, so importing
+    it (from its .pyc) just unmarshals the bytes and loads the table,
+    without building Pattern objects.  Bindings are checked here rather
+    than at import time.  The module only imports patma_table.
+    """
+    if not name.isidentifier():
+        raise ValueError(f"Not an identifier: {name!r}")
+    table = PatternTable.from_patterns(pattern_or_cases)
+    table.check_bindings()
+    data = table.to_bytes()
+    file.write("# Generated by patma_table.freeze(); do not edit.\n")
+    file.write("from patma_table import loads\n\n")
+    file.write("_DATA = (\n")
+    for i in range(0, len(data), 64):
+        file.write(f"    {data[i : i + 64]!r}\n")
+    file.write(")\n")
+    file.write(f"{name} = loads(_DATA, validate=False)\n")
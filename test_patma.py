@@ -1,6 +1,7 @@
 import array
 import collections.abc
 import dataclasses
+import os
 import sys
 
 from typing import Dict, Optional
@@ -134,8 +135,8 @@ def test_sequence_pattern():
     assert checks(pat, (1, 2, 3, 4)) is None
     assert checks(pat, 123) is None
     # Check that character/byte strings don't match sequences
-    assert pat.match("abc") is None  # TODO: translate should disallow strings
-    assert pat.match(b"abc") is None  # TODO: translate ditto
+    assert checks(pat, "abc") is None
+    assert checks(pat, b"abc") is None
     assert pat.match(array.array("b", b"abc")) is None  # TODO: translate ditto
     ## assert checks(pat, memoryview(b'abc')) is None
     ## assert checks(pat, bytearray(b'abc')) is None
@@ -242,3 +243,100 @@ def test_bindings():
     assert p.bindings(False) == {"a"}
     with pytest.raises(DuplicateBindings):
         p.bindings()
+
+
+def test_match_first():
+    cases = [
+        SequencePattern([ConstantPattern(1), VariablePattern("x")]),
+        SequencePattern([VariablePattern("x"), VariablePattern("y")]),
+    ]
+    assert match_first(cases, (1, 2)) == (0, {"x": 2})
+    assert match_first(cases, (2, 2)) == (1, {"x": 2, "y": 2})
+    assert match_first(cases, 12) is None
+    assert match_first(VariablePattern("x"), 12) == (0, {"x": 12})
+    assert match_batch(cases, [(1, 2), 12]) == [(0, {"x": 2}), None]
+
+
+def test_patterns_are_immutable():
+    p = SequencePattern([VariablePattern("a"), ConstantPattern(1)])
+    assert isinstance(p.patterns, tuple)
+    assert not hasattr(p, "__dict__")
+    with pytest.raises(AttributeError):
+        p.patterns = ()
+    with pytest.raises(AttributeError):
+        p.extra = 1
+    with pytest.raises(AttributeError):
+        del p.patterns
+
+
+@dataclasses.dataclass
+class Tagged:
+    x: int
+    tags: Dict[str, str]
+
+    __match_args__ = ("x", "tags")
+
+
+def test_pickle():
+    import pickle
+
+    p = InstancePattern(
+        Tagged,
+        [AnnotatedPattern(VariablePattern("x"), int)],
+        {"tags": MappingPattern({"k": WalrusPattern("w", ConstantPattern("v"))})},
+    )
+    q = pickle.loads(pickle.dumps(p))
+    assert q.kwargs.keys() == {"tags"}
+    assert q.match(Tagged(1, {"k": "v"})) == p.match(Tagged(1, {"k": "v"})) == {"x": 1, "w": "v"}
+
+
+def test_sequence_pattern_registered_abc():
+    # case (x, y):
+    pat = SequencePattern([VariablePattern("x"), VariablePattern("y")])
+
+    class Pair:
+        def __len__(self):
+            return 2
+
+        def __getitem__(self, i):
+            return (1, 2)[i]
+
+        def __iter__(self):
+            return iter((1, 2))
+
+    assert checks(pat, Pair()) is None
+    collections.abc.Sequence.register(Pair)
+    assert checks(pat, Pair()) == {"x": 1, "y": 2}
+
+    class Tuple2(tuple):
+        pass
+
+    assert checks(pat, Tuple2((1, 2))) == {"x": 1, "y": 2}
+
+
+def test_import_is_lazy():
+    # Neither dataclasses nor any engine module is imported by "import patma".
+    import subprocess
+
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import patma"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imported = {line.rsplit("|", 1)[-1].strip() for line in out.stderr.splitlines()}
+    assert "patma" in imported
+    assert not {"dataclasses", "inspect", "asyncio", "numpy"} & imported
+    assert not {name for name in imported if name.startswith("patma_")}
+
+
+def test_lazy_engine_names():
+    import patma
+    import patma_table
+
+    assert patma.PatternTable is patma_table.PatternTable
+    assert "loads" in dir(patma)
+    assert "PatternTable" not in patma.__all__
+    with pytest.raises(AttributeError):
+        patma.no_such_name
@@ -0,0 +1,106 @@
+import asyncio
+import concurrent.futures
+from typing import Any, AsyncIterator, Iterable, List, Optional, Tuple
+
+import pytest
+
+from patma import *
+from patma_async import amatch_stream
+
+CASES = [
+    SequencePattern([ConstantPattern("add"), VariablePattern("x")]),
+    SequencePattern([ConstantPattern("del"), VariablePattern("x")]),
+    VariablePattern("_"),
+]
+
+
+async def agen(items: Iterable[object], log: Optional[List[object]] = None) -> AsyncIterator[object]:
+    for item in items:
+        if log is not None:
+            log.append(item)
+        yield item
+        await asyncio.sleep(0)
+
+
+async def collect(*args: Any, **kwargs: Any) -> List[Tuple[object, Optional[int], object]]:
+    return [r async for r in amatch_stream(*args, **kwargs)]
+
+
+def test_amatch_stream():
+    items = [("add", 1), ("del", 2), 42, ("add", 3)]
+    result = asyncio.run(collect(CASES, agen(items), batch_size=2))
+    assert result == [
+        (("add", 1), 0, {"x": 1}),
+        (("del", 2), 1, {"x": 2}),
+        (42, 2, {"_": 42}),
+        (("add", 3), 0, {"x": 3}),
+    ]
+    assert [(i, b) for _, i, b in result] == match_batch(CASES, items)
+
+
+def test_amatch_stream_single_pattern():
+    pat = SequencePattern([VariablePattern("a"), VariablePattern("b")])
+    result = asyncio.run(collect(pat, agen([(1, 2), 3])))
+    assert result == [((1, 2), 0, {"a": 1, "b": 2}), (3, None, None)]
+
+
+def test_amatch_stream_executor():
+    items = [("add", i) if i % 2 else ("del", i) for i in range(1000)]
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        result = asyncio.run(
+            collect(CASES, agen(items), batch_size=16, executor=executor)
+        )
+    assert [item for item, _, _ in result] == items
+    assert [(i, b) for _, i, b in result] == match_batch(CASES, items)
+
+
+def test_amatch_stream_backpressure():
+    log: List[object] = []
+
+    async def main() -> object:
+        stream = amatch_stream(CASES, agen(range(1000), log), batch_size=4, max_pending=2)
+        first = await stream.__anext__()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        await stream.aclose()
+        return first
+
+    assert asyncio.run(main()) == (0, 2, {"_": 0})
+    # Bounded buffer (8) + batches in flight (8) + one blocked put.
+    assert len(log) <= 8 + 8 + 1
+
+
+def test_amatch_stream_source_error():
+    async def failing() -> AsyncIterator[object]:
+        yield ("add", 1)
+        raise RuntimeError("boom")
+
+    async def main() -> List[object]:
+        seen: List[object] = []
+        with pytest.raises(RuntimeError):
+            async for r in amatch_stream(CASES, failing()):
+                seen.append(r)
+        return seen
+
+    assert asyncio.run(main()) == [(("add", 1), 0, {"x": 1})]
+
+
+def test_amatch_stream_source_base_exception():
+    async def source(exc: BaseException) -> AsyncIterator[object]:
+        yield ("add", 1)
+        raise exc
+
+    async def consume(exc: BaseException, seen: List[object]) -> None:
+        async for r in amatch_stream(CASES, source(exc), batch_size=1):
+            seen.append(r)
+
+    async def main() -> List[object]:
+        seen: List[object] = []
+        with pytest.raises(asyncio.CancelledError):
+            # Not a TimeoutError: the error ends the stream at once.
+            await asyncio.wait_for(consume(asyncio.CancelledError(), seen), 5)
+        return seen
+
+    assert asyncio.run(main()) == [(("add", 1), 0, {"x": 1})]
+    with pytest.raises(KeyboardInterrupt):
+        asyncio.run(consume(KeyboardInterrupt(), []))
@@ -0,0 +1,151 @@
+import collections.abc
+import dataclasses
+import random
+from typing import Iterator, List
+
+from patma import *
+from patma_dispatch import SequenceTrie, TypeDispatch
+
+VERBS = ["get", "put", "del", "list"]
+NOUNS = ["user", "group", "file"]
+
+
+def command_table() -> List[Pattern]:
+    rng = random.Random(42)
+    cases: List[Pattern] = []
+    for _ in range(300):
+        elements: List[Pattern] = [ConstantPattern(rng.choice(VERBS))]
+        for _ in range(rng.randrange(3)):
+            r = rng.random()
+            if r < 0.4:
+                elements.append(ConstantPattern(rng.choice(NOUNS)))
+            elif r < 0.6:
+                elements.append(
+                    AlternativesPattern([ConstantPattern(n) for n in rng.sample(NOUNS, 2)])
+                )
+            elif r < 0.8:
+                elements.append(AnnotatedPattern(VariablePattern("n"), int))
+            else:
+                elements.append(ConstantPattern(rng.choice([1, 1.0, True])))
+        cases.append(SequencePattern(elements))
+    cases.insert(150, WalrusPattern("w", SequencePattern([VariablePattern("a")])))
+    cases.append(VariablePattern("_"))
+    return cases
+
+
+def subjects() -> Iterator[object]:
+    rng = random.Random(1)
+    words = VERBS + NOUNS + [1, 1.0, True, 7, 2.5, None, [1]]
+    for _ in range(500):
+        yield tuple(rng.choice(words) for _ in range(rng.randrange(4)))
+    yield ["get", "user"]
+    yield "get"
+    yield 42
+
+
+def test_sequence_trie_same_as_match_first():
+    cases = command_table()
+    trie = SequenceTrie(cases)
+    for x in subjects():
+        assert trie.match_first(x) == match_first(cases, x), x
+        expected = [(i, m) for i, c in enumerate(cases) if (m := c.match(x)) is not None]
+        assert trie.match_all(x) == expected, x
+
+
+def test_sequence_trie_candidates():
+    cases = [
+        SequencePattern([ConstantPattern("get"), ConstantPattern("user")]),
+        SequencePattern([ConstantPattern("get"), VariablePattern("noun")]),
+        SequencePattern([ConstantPattern("put"), VariablePattern("noun")]),
+        SequencePattern([ConstantPattern("get")]),
+    ]
+    trie = SequenceTrie(cases)
+    assert trie.candidates(("get", "user")) == [0, 1]
+    assert trie.candidates(("get", "file")) == [1]
+    assert trie.candidates(("del", "file")) == []
+    assert trie.candidates("get") == []
+    assert trie.match_first(("put", "file")) == (2, {"noun": "file"})
+
+
+@dataclasses.dataclass
+class BinaryOp:
+    op: object  # Not always a str: unhashable ops must not break dispatch.
+    left: object
+    right: object
+
+
+@dataclasses.dataclass
+class UnaryOp:
+    op: str
+    arg: object
+
+
+@dataclasses.dataclass
+class VarExpr:
+    name: str
+
+
+def expr_cases() -> List[Pattern]:
+    # Like simplify_expr() in examples/expr.py.
+    x = VariablePattern("x")
+    return [
+        InstancePattern(BinaryOp, [ConstantPattern("+"), ConstantPattern(0), x], {}),
+        InstancePattern(BinaryOp, [ConstantPattern("+"), x, ConstantPattern(0)], {}),
+        InstancePattern(BinaryOp, [AlternativesPattern([ConstantPattern("*"), ConstantPattern("/")]), x, ConstantPattern(1)], {}),
+        InstancePattern(BinaryOp, [ConstantPattern("*"), ConstantPattern(0), VariablePattern("_")], {}),
+        InstancePattern(BinaryOp, [VariablePattern("op"), x, VariablePattern("y")], {}),
+        InstancePattern(UnaryOp, [ConstantPattern("-"), InstancePattern(UnaryOp, [ConstantPattern("-"), x], {})], {}),
+        InstancePattern(UnaryOp, [ConstantPattern("+"), x], {}),
+        InstancePattern(VarExpr, [x], {}),
+        AnnotatedPattern(VariablePattern("n"), float),
+        SequencePattern([x]),
+    ]
+
+
+def expr_subjects() -> Iterator[object]:
+    leaves = [0, 1, 1.0, True, 2.5, VarExpr("a"), "s", None, (1,), {"k": 1}, [0]]
+    rng = random.Random(3)
+    for _ in range(500):
+        r = rng.random()
+        if r < 0.5:
+            yield BinaryOp(rng.choice("+-*/"), rng.choice(leaves), rng.choice(leaves))
+        elif r < 0.7:
+            yield UnaryOp(rng.choice("+-"), rng.choice(leaves + [UnaryOp("-", 1)]))
+        else:
+            yield rng.choice(leaves)
+    yield BinaryOp(["unhashable"], 0, 0)
+
+
+def test_type_dispatch_same_as_match_first():
+    cases = expr_cases()
+    dispatch = TypeDispatch(cases)
+    for x in expr_subjects():
+        assert dispatch.match_first(x) == match_first(cases, x), x
+        expected = [(i, m) for i, c in enumerate(cases) if (m := c.match(x)) is not None]
+        assert dispatch.match_all(x) == expected, x
+
+
+def test_type_dispatch_candidates():
+    dispatch = TypeDispatch(expr_cases())
+    assert dispatch.candidates(BinaryOp("+", 1, 2)) == [0, 1, 4]
+    assert dispatch.candidates(BinaryOp("/", 1, 2)) == [2, 4]
+    assert dispatch.candidates(BinaryOp("%", 1, 2)) == [4]
+    assert dispatch.candidates(BinaryOp([], 1, 2)) == [4]
+    assert dispatch.candidates(UnaryOp("-", 1)) == [5]
+    assert dispatch.candidates(3) == [8]
+    assert dispatch.candidates("s") == []  # Unrelated type, no case is tried.
+    assert dispatch.candidates([1]) == [9]
+
+
+def test_type_dispatch_abc_registration():
+    class Pair:
+        def __len__(self):
+            return 1
+
+        def __getitem__(self, i):
+            return (1,)[i]
+
+    dispatch = TypeDispatch(expr_cases())
+    assert dispatch.match_first(Pair()) is None
+    collections.abc.Sequence.register(Pair)
+    assert dispatch.match_first(Pair()) == (9, {"x": 1})
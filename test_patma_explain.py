@@ -0,0 +1,69 @@
+from patma import *
+from patma_explain import Explanation, Trace, explain, explain_cases
+from test_patma import MyClass
+
+
+def check(pat: Pattern, x: object) -> Explanation:
+    """Explain pat against x, checking it agrees with pat.match(x)."""
+    explanation = explain(pat, x)
+    assert explanation.bindings == pat.match(x)
+    assert (explanation.failure is None) == explanation.matched
+    return explanation
+
+
+def failure(pat: Pattern, x: object) -> Trace:
+    """The failing check of explaining pat against x, which must fail."""
+    f = check(pat, x).failure
+    assert f is not None
+    return f
+
+
+def test_explain_match():
+    pat = SequencePattern([ConstantPattern("add"), VariablePattern("x")])
+    e = check(pat, ("add", 1))
+    assert e.matched and e.bindings == {"x": 1}
+    assert [c.path for c in e.trace.children] == ["x[0]", "x[1]"]
+
+
+def test_explain_failures():
+    sequence = SequencePattern([ConstantPattern("add"), VariablePattern("x")])
+    assert failure(sequence, 42).check == "type"
+    assert failure(sequence, (1, 2, 3)).check == "length"
+    f = failure(sequence, ("del", 1))
+    assert (f.check, f.path, f.subject) == ("constant", "x[0]", "del")
+    assert failure(sequence, (1, 2)).check == "type"
+
+    mapping = MappingPattern({"k": MappingPattern({"l": ConstantPattern(1)})})
+    f = failure(mapping, {"k": {}})
+    assert (f.check, f.path, f.reason) == ("key", "x['k']", "missing key 'l'")
+
+    instance = InstancePattern(MyClass, [VariablePattern("x")], {"z": VariablePattern("z")})
+    f = failure(instance, MyClass(1, "a"))
+    assert (f.check, f.path) == ("attribute", "x")
+    instance = InstancePattern(MyClass, [VariablePattern(s) for s in "abc"], {})
+    assert failure(instance, MyClass(1, "a")).check == "fields"
+    instance = InstancePattern(MyClass, [], {"y": ConstantPattern("b")})
+    assert failure(instance, MyClass(1, "a")).path == "x.y"
+
+    alternatives = AlternativesPattern([ConstantPattern(1), ConstantPattern(2)])
+    assert failure(alternatives, 3).check == "alternatives"
+    assert [c.check for c in check(alternatives, 3).trace.children] == ["constant", "constant"]
+
+    walrus = WalrusPattern("w", AnnotatedPattern(VariablePattern("v"), int))
+    assert failure(walrus, 1.5).check == "type"
+    assert check(walrus, 1).bindings == {"v": 1, "w": 1}
+
+
+def test_explain_cases():
+    cases = [
+        SequencePattern([ConstantPattern("add"), VariablePattern("x")]),
+        SequencePattern([VariablePattern("x")]),
+        VariablePattern("_"),
+        ConstantPattern(1),
+    ]
+    explanations = explain_cases(cases, ("del", 1))
+    assert [e.matched for e in explanations] == [False, False, True]
+    assert str(explanations[0]).splitlines() == [
+        "x: SequencePattern FAIL",
+        "  x[0]: ConstantPattern('add') FAIL (constant: 'del' != 'add')",
+    ]
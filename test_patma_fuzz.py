@@ -0,0 +1,24 @@
+import pytest
+
+from patma import *
+from patma_fuzz import ENGINES, Mismatch, fuzz, show
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_engines_agree(seed):
+    times = fuzz(seed, rounds=40)
+    assert set(times) == set(ENGINES)
+
+
+def test_mismatch_reported(monkeypatch):
+    def broken(cases):
+        return lambda subjects: [None for x in subjects]
+
+    monkeypatch.setitem(ENGINES, "broken", broken)
+    with pytest.raises(Mismatch, match="engine 'broken'"):
+        fuzz(0, rounds=10, engines=["match", "broken"])
+
+
+def test_show():
+    pat = SequencePattern([ConstantPattern(1), AnnotatedPattern(VariablePattern("x"), int)])
+    assert show(pat) == "SequencePattern([ConstantPattern(1), AnnotatedPattern(VariablePattern('x'), int)])"
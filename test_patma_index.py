@@ -0,0 +1,126 @@
+import dataclasses
+import random
+from typing import List
+
+import pytest
+
+from patma import *
+from patma_index import IndexedCollection, Key, leaves
+
+
+@dataclasses.dataclass
+class Order:
+    customer: str
+    status: object  # Usually a str; one test uses an unhashable value.
+    address: dict
+    items: list
+
+
+CUSTOMERS = ["ann", "bob", "cid", "dee"]
+STATUSES = ["new", "paid", "shipped", "returned"]
+CITIES = ["Paris", "Oslo", "Lima"]
+
+
+def orders(n: int, seed: int = 0) -> List[Order]:
+    rng = random.Random(seed)
+    return [
+        Order(
+            rng.choice(CUSTOMERS),
+            rng.choice(STATUSES),
+            {"city": rng.choice(CITIES), "zip": rng.randrange(10)},
+            [rng.choice(["book", "pen", 1, 1.0])],
+        )
+        for _ in range(n)
+    ]
+
+
+def paid_in(city: str) -> InstancePattern:
+    return InstancePattern(
+        Order,
+        [VariablePattern("who")],
+        {
+            "status": ConstantPattern("paid"),
+            "address": MappingPattern({"city": ConstantPattern(city)}),
+        },
+    )
+
+
+QUERIES = [
+    paid_in("Oslo"),
+    paid_in("Nowhere"),
+    InstancePattern(Order, [ConstantPattern("ann"), AlternativesPattern([ConstantPattern("new"), ConstantPattern("paid")])], {}),
+    InstancePattern(Order, [], {"items": SequencePattern([ConstantPattern(1)])}),
+    InstancePattern(Order, [], {"items": SequencePattern([ConstantPattern(1.0)])}),
+    AnnotatedPattern(VariablePattern("o"), Order),
+]
+
+
+def brute_force(objects: List[Order], pattern: Pattern) -> List[Order]:
+    return [o for o in objects if pattern.match(o) is not None]
+
+
+def test_leaves():
+    assert list(leaves(paid_in("Oslo"))) == [
+        (("status",), ["paid"]),
+        (("address", Key("city")), ["Oslo"]),
+    ]
+    assert list(leaves(SequencePattern([VariablePattern("x"), ConstantPattern(2)]))) == [((Key(1),), [2])]
+
+
+def test_query_same_as_brute_force():
+    objects = orders(500)
+    collection = IndexedCollection(objects, indexes=[("status",)], auto_index=2)
+    for _ in range(3):  # Unindexed, then auto-indexed.
+        for pattern in QUERIES:
+            assert collection.query(pattern) == brute_force(objects, pattern)
+    assert set(collection.indexes) >= {
+        ("status",),
+        ("customer",),
+        ("address", Key("city")),
+        ("items", Key(0)),
+    }
+    matches = collection.matches(paid_in("Oslo"))
+    assert matches == [(o, {"who": o.customer}) for o in brute_force(objects, paid_in("Oslo"))]
+
+
+def test_candidates_narrowed():
+    objects = orders(500)
+    collection = IndexedCollection(objects, indexes=[("status",), ("address", Key("city"))], auto_index=0)
+    candidates = collection.candidates(paid_in("Oslo"))
+    assert candidates == brute_force(objects, paid_in("Oslo"))
+    assert collection.candidates(paid_in("Nowhere")) == []
+    # customer isn't indexed, so only the status alternatives narrow this.
+    assert collection.candidates(QUERIES[2]) == [o for o in objects if o.status in ("new", "paid")]
+
+
+def test_incremental_updates():
+    objects = orders(200, seed=1)
+    collection = IndexedCollection(objects[:100], indexes=[("status",), ("address", Key("city"))])
+    for o in objects[100:]:
+        collection.add(o)
+    for o in objects[::3]:
+        collection.remove(o)
+    remaining = [o for i, o in enumerate(objects) if i % 3]
+    assert list(collection) == remaining
+    changed = remaining[0]
+    changed.status = "paid"
+    changed.address = {"city": "Oslo"}
+    collection.update(changed)
+    assert collection.query(paid_in("Oslo")) == brute_force(remaining, paid_in("Oslo"))
+    assert changed in collection.query(paid_in("Oslo"))
+    with pytest.raises(ValueError):
+        collection.remove(objects[0])
+    with pytest.raises(ValueError):
+        collection.add(changed)
+
+
+def test_unhashable_and_missing_values():
+    collection = IndexedCollection(indexes=[("status",)])
+    odd = Order("ann", ["not", "hashable"], {}, [])
+    collection.add(odd)
+    collection.add(object())
+    pattern = InstancePattern(Order, [], {"status": ConstantPattern("paid")})
+    assert collection.query(pattern) == []
+    assert collection.query(AnnotatedPattern(VariablePattern("o"), Order)) == [odd]
+    collection.remove(odd)
+    assert len(collection) == 1
@@ -0,0 +1,101 @@
+import io
+import json
+
+import pytest
+
+from patma import *
+from patma_json import compile_json, match_json
+
+DOC = {
+    "id": 7,
+    "kind": "event",
+    "payload": {"big": list(range(100)), "text": 'a "quoted" \\ string'},
+    "tags": ["x", 1.5, None, True],
+    "flag": False,
+}
+
+PATTERNS = [
+    MappingPattern({"kind": ConstantPattern("event"), "id": VariablePattern("id")}),
+    MappingPattern({"kind": ConstantPattern("other")}),
+    MappingPattern({"missing": VariablePattern("m")}),
+    MappingPattern({1: VariablePattern("m")}),
+    MappingPattern({"tags": SequencePattern([VariablePattern(s) for s in "abcd"])}),
+    MappingPattern({"tags": SequencePattern([VariablePattern(s) for s in "abc"])}),
+    MappingPattern(
+        {
+            "tags": SequencePattern(
+                [
+                    ConstantPattern("x"),
+                    ConstantPattern(1.5),
+                    ConstantPattern(None),
+                    AnnotatedPattern(VariablePattern("t"), bool),
+                ]
+            )
+        }
+    ),
+    MappingPattern({"payload": MappingPattern({"text": VariablePattern("text")})}),
+    MappingPattern({"payload": VariablePattern("p"), "flag": ConstantPattern(0)}),
+    MappingPattern({"id": AlternativesPattern([ConstantPattern(1), ConstantPattern(7)])}),
+    MappingPattern({"id": WalrusPattern("w", ConstantPattern(7.0))}),
+    SequencePattern([VariablePattern("x")]),
+    VariablePattern("doc"),
+]
+
+
+@pytest.mark.parametrize("pat", PATTERNS)
+@pytest.mark.parametrize("chunk_size", [1, 7, 65536])
+def test_same_as_match(pat, chunk_size):
+    text = json.dumps(DOC, indent=1)
+    expected = pat.match(json.loads(text))
+    assert compile_json(pat).match(io.StringIO(text), chunk_size) == expected
+    assert match_json(pat, text) == expected
+
+
+def test_early_reject():
+    # Everything after the failing constant is garbage, but never read.
+    mapping = MappingPattern({"kind": ConstantPattern("event")})
+    assert match_json(mapping, '{"kind": "other", "x": [}}}') is None
+    assert match_json(mapping, '[1, 2, @@@') is None
+    sequence = SequencePattern([ConstantPattern(1), VariablePattern("x")])
+    assert match_json(sequence, "[2, {{{") is None
+    assert match_json(sequence, "[1, 2, 3, @@@") is None
+
+
+class CountingIO(io.StringIO):
+    reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return super().read(size)
+
+
+@pytest.mark.parametrize("scalar", ["null", "true", "false", "-Infinity", "NaN", "-12", "2.5e-3", '"s"'])
+def test_early_reject_reads_little(scalar):
+    big = json.dumps([{"k": i, "v": None} for i in range(20000)])
+    text = '{"a": %s, "kind": "other", "x": %s}' % (scalar, big)
+    for pat in [
+        MappingPattern({"kind": ConstantPattern("event")}),
+        MappingPattern({"a": VariablePattern("a"), "kind": ConstantPattern("event")}),
+    ]:
+        file = CountingIO(text)
+        assert compile_json(pat).match(file, 4096) is None
+        assert file.reads == 1
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5])
+def test_scalars_across_chunks(chunk_size):
+    text = '[1, -2.5e-3, 10E+2, 0, true, false, null, NaN, -Infinity, Infinity, "a\\\\\\"b", -0.0]'
+    expected = json.loads(text)
+    match = compile_json(VariablePattern("x")).match(io.StringIO(text), chunk_size)
+    assert repr(match) == repr({"x": expected})
+
+
+def test_malformed():
+    pat = MappingPattern({"kind": VariablePattern("k")})
+    with pytest.raises(json.JSONDecodeError):
+        match_json(pat, '{"kind": [1, 2')
+    with pytest.raises(json.JSONDecodeError):
+        match_json(pat, '{"kind": 1} extra')
+    for text in ['{"kind": nul}', '{"kind": -}', '{"kind": "open']:
+        with pytest.raises(json.JSONDecodeError):
+            compile_json(pat).match(io.StringIO(text), 2)
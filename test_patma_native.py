@@ -0,0 +1,121 @@
+import collections
+import dataclasses
+import enum
+from typing import List
+
+from patma import *
+from patma_native import compile_native
+
+
+class Color(enum.Enum):
+    RED = 1
+    GREEN = 2
+
+
+@dataclasses.dataclass
+class Point:
+    x: object
+    y: object
+
+
+@dataclasses.dataclass
+class Point3(Point):
+    z: object = 0
+
+
+class Plain:
+    pass
+
+
+def cases() -> List[Pattern]:
+    return [
+        ConstantPattern(1.0),
+        ConstantPattern(2),
+        ConstantPattern("s"),
+        ConstantPattern(None),
+        ConstantPattern(True),
+        ConstantPattern(Color.RED),
+        ConstantPattern(float("inf")),
+        SequencePattern([VariablePattern("_"), ConstantPattern("end")]),
+        SequencePattern([VariablePattern("a"), VariablePattern("a")]),  # Not native.
+        MappingPattern({"k": AnnotatedPattern(VariablePattern("v"), float), (1, 2): VariablePattern("t")}),
+        InstancePattern(Point, [ConstantPattern(0)], {"y": VariablePattern("y")}),
+        InstancePattern(Point, [VariablePattern("px"), VariablePattern("py")], {}),
+        ConstantPattern(frozenset({1})),  # Not native.
+        AnnotatedPattern(VariablePattern("p"), Plain),
+        AlternativesPattern([ConstantPattern("a"), ConstantPattern(b"a")]),
+        AlternativesPattern([ConstantPattern("b"), VariablePattern("b")]),  # Not native.
+        WalrusPattern("w", SequencePattern([AnnotatedPattern(VariablePattern("i"), int)])),
+        VariablePattern("rest"),
+        ConstantPattern(3),  # Unreachable, but still allowed.
+    ]
+
+
+SUBJECTS = [
+    1, 1.0, True, 2, 2.0, "s", b"s", None, False, Color.RED, Color.GREEN, 1.5,
+    float("inf"), ("x", "end"), ["x", "end"], "xend", bytearray(b"ab"), (1, 1), (1, 2),
+    {"k": 1, (1, 2): "t"}, {"k": "no", (1, 2): "t"}, {"k": 1.5}, frozenset({1}), {1},
+    Point(0, 1), Point(1, 0), Point3(0, 1, 2), Plain(), "a", b"a", "b", (5,), (5.0,),
+]
+
+
+def test_native_same_as_match_first():
+    matcher = compile_native(cases())
+    for x in SUBJECTS:
+        assert matcher.match_first(x) == match_first(cases(), x), x
+
+
+def test_native_int_float():
+    matcher = compile_native([ConstantPattern(1.0), ConstantPattern(2)])
+    assert matcher.match_first(1) == (0, {})
+    assert matcher.match_first(True) == (0, {})
+    assert matcher.match_first(2.0) is None  # Native "case 2" would match.
+    assert "case (float(1.0) | int(1.0)):" in matcher.source
+
+
+def test_native_fallback():
+    matcher = compile_native(cases())
+    assert matcher.native == [
+        True, True, True, True, True, True, True, True, False, True,
+        True, True, False, True, True, False, True, True, True,
+    ]
+    assert "match x:" in matcher.source
+
+
+def test_native_single_pattern():
+    matcher = compile_native(SequencePattern([VariablePattern("a"), VariablePattern("b")]))
+    assert matcher.match_first([1, 2]) == (0, {"a": 1, "b": 2})
+    assert matcher.match_first([1]) is None
+
+
+def test_native_keywords_after_positional():
+    pat = InstancePattern(Point3, [ConstantPattern(0)], {"z": VariablePattern("z")})
+    matcher = compile_native([pat])
+    assert matcher.native == [True]
+    assert matcher.match_first(Point3(0, 1, 2)) == (0, {"z": 2})
+    assert matcher.match_first(Point3(1, 0, 2)) is None
+
+
+def test_native_complex():
+    cases = [ConstantPattern(1j), MappingPattern({1j: VariablePattern("v")})]
+    matcher = compile_native(cases)
+    assert matcher.native == [False, True]
+    for x in [1j, 2j, 1, {1j: 0}, {2j: 0}]:
+        assert matcher.match_first(x) == match_first(cases, x), x
+
+
+def test_native_mapping_subclasses():
+    cases = [
+        MappingPattern({"k": VariablePattern("v")}),
+        SequencePattern([MappingPattern({"k": VariablePattern("v")})]),  # Not native.
+        VariablePattern("_"),
+    ]
+    matcher = compile_native(cases)
+    assert matcher.native == [True, False, True]
+    subjects = [
+        {"k": 1}, {}, collections.defaultdict(int), collections.OrderedDict(k=2),
+        [collections.defaultdict(int)], [{"k": 3}], [{}],
+    ]
+    for x in subjects:
+        assert matcher.match_first(x) == match_first(cases, x), x
+    assert matcher.match_first(collections.defaultdict(int)) == (0, {"v": 0})
@@ -0,0 +1,95 @@
+import pickle
+import random
+
+import pytest
+
+from patma import *
+from patma_fuzz import PatternGenerator, Point
+from patma_optimize import (
+    OrderedInstancePattern,
+    OrderedMappingPattern,
+    OrderedSequencePattern,
+    estimate,
+    optimize,
+    profile,
+)
+
+DEEP = InstancePattern(
+    Point,
+    [SequencePattern([VariablePattern("a"), AnnotatedPattern(VariablePattern("b"), int)])],
+    {"y": MappingPattern({"k": VariablePattern("k")})},
+)
+
+
+def test_cheap_checks_first():
+    pat = SequencePattern([DEEP, VariablePattern("v"), ConstantPattern(3)])
+    opt = optimize(pat)
+    assert isinstance(opt, OrderedSequencePattern)
+    assert opt.order == (2, 0, 1)
+    assert opt.match([Point(None, None), 1, 4]) is None
+    x = [Point((1, 2), {"k": 3}), 0, 3]
+    match = opt.match(x)
+    assert match is not None
+    assert list(match.items()) == list((pat.match(x) or {}).items())
+
+
+def test_mapping_and_instance_reordered():
+    mapping = optimize(MappingPattern({"deep": DEEP, "kind": ConstantPattern("point")}))
+    assert isinstance(mapping, OrderedMappingPattern)
+    assert mapping.order == (1, 0)
+    assert mapping.keys == ("deep", "kind")
+
+    pat = InstancePattern(Point, [DEEP], {"y": ConstantPattern(0)})
+    instance = optimize(pat)
+    assert isinstance(instance, OrderedInstancePattern)
+    assert instance.order == (1, 0)
+    assert instance.match(Point(Point((1, 2), {"k": 3}), 0)) == pat.match(Point(Point((1, 2), {"k": 3}), 0))
+
+
+def test_overlapping_bindings_not_reordered():
+    pat = SequencePattern([VariablePattern("a"), WalrusPattern("a", ConstantPattern(1))])
+    opt = optimize(pat)
+    assert type(opt) is SequencePattern
+    assert opt.match([2, 1]) == {"a": 1}
+
+
+def test_already_optimal_keeps_class():
+    pat = SequencePattern([ConstantPattern(1), VariablePattern("x")])
+    assert type(optimize(pat)) is SequencePattern
+
+
+def test_profile():
+    # Static guesses put the constant first; measured, it always passes.
+    pat = SequencePattern([AnnotatedPattern(VariablePattern("x"), str), ConstantPattern(0)])
+    opt = optimize(pat)
+    assert isinstance(opt, OrderedSequencePattern)
+    assert opt.order == (1, 0)
+    subjects = [(s, 0) for s in [1, 2, "a", 3]]
+    stats = profile(pat, subjects)
+    assert stats[pat.patterns[1]] == [4, 4]
+    assert stats[pat.patterns[0]] == [4, 1]
+    assert estimate(pat.patterns[1], stats)[1] > 0.8
+    assert type(optimize(pat, stats)) is SequencePattern
+
+
+def test_ordered_patterns_pickle_and_validate():
+    opt = optimize(SequencePattern([DEEP, ConstantPattern(3)]))
+    assert isinstance(opt, OrderedSequencePattern)
+    copy = pickle.loads(pickle.dumps(opt))
+    assert type(copy) is OrderedSequencePattern
+    assert copy.order == opt.order
+    with pytest.raises(ValueError):
+        OrderedSequencePattern([ConstantPattern(1)], [1])
+
+
+def test_optimize_same_results():
+    rng = random.Random(7)
+    generator = PatternGenerator(rng)
+    for _ in range(200):
+        pat = generator.pattern()
+        opt = optimize(pat)
+        for x in generator.subjects([pat], 10):
+            expected = pat.match(x)
+            match = opt.match(x)
+            assert match == expected
+            assert list(match or {}) == list(expected or {})
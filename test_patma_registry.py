@@ -0,0 +1,80 @@
+import threading
+
+from patma import *
+from patma_registry import MatcherRegistry
+from patma_table import PatternTable, dumps, loads
+from test_patma import MyClass
+
+CASES = [
+    SequencePattern([ConstantPattern("add"), AnnotatedPattern(VariablePattern("n"), int)]),
+    SequencePattern([ConstantPattern("del"), VariablePattern("n")]),
+    MappingPattern({"op": AlternativesPattern([ConstantPattern("a"), ConstantPattern("b")])}),
+    InstancePattern(MyClass, [VariablePattern("x")], {"y": ConstantPattern("hello")}),
+    WalrusPattern("w", SequencePattern([VariablePattern("p"), VariablePattern("q")])),
+    ConstantPattern(1.0),
+]
+
+SUBJECTS = [
+    ("add", 1), ("add", "x"), ["del", 2], {"op": "b"}, {"op": "c"},
+    MyClass(3, "hello"), MyClass(3, "bye"), (5, 6), 1, 1.0, "no", None,
+]
+
+
+def test_registry_compiles_once():
+    compiled = []
+
+    def compiler(cases):
+        compiled.append(cases)
+        return PatternTable.from_patterns(cases)
+
+    registry = MatcherRegistry(compiler)
+    matcher = registry.register("cmd", CASES)
+    assert registry.register("cmd", []) is matcher is registry.get("cmd")
+    assert "cmd" in registry and "other" not in registry
+    assert len(compiled) == 1
+    assert registry.match_first("cmd", ("add", 1)) == (0, {"n": 1})
+    assert registry.match_first("cmd", "no") is None
+    assert registry.stats() == {"cmd": {"matched": 1, "missed": 1}}
+
+
+def test_registry_threads():
+    nthreads = 16
+    rounds = 200
+    compiled = []
+
+    def compiler(cases):
+        # Loaded tables import their classes lazily, on first use.
+        compiled.append(cases)
+        return loads(dumps(cases))
+
+    registry = MatcherRegistry(compiler)
+    names = [f"set{i}" for i in range(4)]
+    expected = [match_first(CASES, x) for x in SUBJECTS]
+    direct = [[c.match(x) for c in CASES] for x in SUBJECTS]
+    barrier = threading.Barrier(nthreads)
+    errors = []
+
+    def worker(k):
+        try:
+            barrier.wait()
+            for r in range(rounds):
+                name = names[(k + r) % len(names)]
+                registry.register(name, CASES)
+                results = [registry.match_first(name, x) for x in SUBJECTS]
+                assert results == expected
+                assert [[c.match(x) for c in CASES] for x in SUBJECTS] == direct
+        except BaseException as err:  # pragma: no cover
+            errors.append(err)
+
+    threads = [threading.Thread(target=worker, args=(k,)) for k in range(nthreads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert len(compiled) == len(names)
+    stats = registry.stats()
+    nmatched = sum(r is not None for r in expected)
+    total = nthreads * rounds
+    assert sum(s["matched"] for s in stats.values()) == total * nmatched
+    assert sum(s["missed"] for s in stats.values()) == total * (len(SUBJECTS) - nmatched)
@@ -0,0 +1,127 @@
+import concurrent.futures
+import random
+import socket
+import subprocess
+import sys
+import time
+from typing import Iterator
+
+import pytest
+
+from patma import *
+from patma_serve import MATCH, MATCH_MANY, Client, ServiceError, _HEADER, _payload
+from patma_table import dump
+
+ROUTES = [
+    SequencePattern([ConstantPattern("get"), ConstantPattern("user"), AnnotatedPattern(VariablePattern("id"), int)]),
+    SequencePattern([ConstantPattern("get"), VariablePattern("what")]),
+    MappingPattern({"op": ConstantPattern("add"), "x": VariablePattern("x"), "y": VariablePattern("y")}),
+    MappingPattern({"op": AlternativesPattern([ConstantPattern("neg"), ConstantPattern("abs")]), "x": VariablePattern("x")}),
+    ConstantPattern(1.0),
+]
+OTHER = [AnnotatedPattern(VariablePattern("s"), str), VariablePattern("_")]
+
+
+def subjects(n: int) -> Iterator[object]:
+    rng = random.Random(5)
+    values = ["get", "user", "add", "neg", 1, 2.5, None, True]
+    for _ in range(n):
+        r = rng.random()
+        if r < 0.4:
+            yield [rng.choice(values) for _ in range(rng.randrange(4))]
+        elif r < 0.8:
+            yield {rng.choice(["op", "x", "y"]): rng.choice(values) for _ in range(rng.randrange(4))}
+        else:
+            yield rng.choice(values)
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("serve")
+    with open(tmp / "routes.patt", "wb") as f:
+        dump(ROUTES, f)
+    with open(tmp / "other.patt", "wb") as f:
+        dump(OTHER, f)
+    address = str(tmp / "patma.sock")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "patma_serve", "--unix", address, "--max-inflight", "64", str(tmp / "routes.patt"), f"catchall={tmp / 'other.patt'}"],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert proc.stdout is not None
+        assert proc.stdout.readline().startswith("Serving catchall, routes on ")
+        yield address
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+
+def test_match(server):
+    with Client(server) as client:
+        assert client.rulesets() == {"routes": len(ROUTES), "catchall": len(OTHER)}
+        assert client.match("routes", ["get", "user", 42]) == (0, {"id": 42})
+        assert client.match("routes", {"op": "add", "x": 1.5, "y": [1]}) == (2, {"x": 1.5, "y": [1]})
+        assert client.match("routes", 1) == (4, {})
+        assert client.match("routes", "nothing") is None
+        assert client.match("catchall", "s") == (0, {"s": "s"})
+        with pytest.raises(ServiceError, match="No rule set 'missing'"):
+            client.match("missing", 1)
+        assert client.match("routes", 1.0) == (4, {})  # The connection is still usable.
+
+
+def test_match_many_pipelined(server):
+    items = list(subjects(3000))
+    expected = [match_first(ROUTES, x) for x in items]
+    with Client(server, pool_size=1) as client:
+        assert client.match_many("routes", items, chunk_size=100) == expected
+        assert client.match_many("routes", []) == []
+        assert len(client._idle) == 1
+
+
+def test_concurrent_clients(server):
+    items = list(subjects(200))
+    expected = [match_first(ROUTES, x) for x in items]
+    with Client(server, pool_size=3) as client:
+        with concurrent.futures.ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda x: client.match("routes", x), items))
+        assert results == expected
+        assert 1 <= len(client._idle) <= 3
+
+
+def test_raw_protocol(server):
+    with socket.socket(socket.AF_UNIX) as sock:
+        sock.settimeout(10)
+        sock.connect(server)
+        file = sock.makefile("rb")
+        sock.sendall(
+            _HEADER.pack(3, 7, 99) + b"xyz"
+            + _HEADER.pack(len(_payload("routes", ["get", 1])), 8, MATCH) + _payload("routes", ["get", 1])
+            + _HEADER.pack(9, 9, MATCH) + b"\x06\x00routes{"
+        )
+        responses = []
+        for _ in range(3):
+            length, request_id, status = _HEADER.unpack(file.read(_HEADER.size))
+            responses.append((request_id, status, file.read(length)))
+        assert responses[0] == (7, 1, b"ValueError: Bad opcode 99")
+        assert responses[1] == (8, 0, b'[1, {"what": 1}]')
+        assert responses[2][:2] == (9, 1) and responses[2][2].startswith(b"JSONDecodeError")
+        file.close()
+
+
+def test_peer_not_reading_responses(server):
+    frame = _payload("routes", [["get", "user", i] for i in range(100)])
+    frame = _HEADER.pack(len(frame), 0, MATCH_MANY) + frame
+    with socket.socket(socket.AF_UNIX) as greedy:
+        greedy.connect(server)
+        greedy.settimeout(0.5)
+        with pytest.raises(socket.timeout):
+            for _ in range(20000):
+                greedy.sendall(frame)  # Until the server stops reading.
+        with Client(server, timeout=5) as client:
+            start = time.perf_counter()
+            assert client.match("routes", ["get", 2]) == (1, {"what": 2})
+            assert time.perf_counter() - start < 1
+            # Many frames with large responses, which the client reads as it sends.
+            items = [["get", "user", i] for i in range(20000)]
+            assert client.match_many("routes", items, chunk_size=10) == [(0, {"id": i}) for i in range(20000)]
@@ -0,0 +1,155 @@
+import dataclasses
+import pickle
+from typing import Any, Dict, List, Literal, Optional, Tuple, TypedDict, Union
+
+from patma import *
+from patma_specialize import (
+    NeverPattern,
+    TrustedInstancePattern,
+    TrustedMappingPattern,
+    TrustedSequencePattern,
+    specialize,
+    unmatchable,
+)
+
+
+@dataclasses.dataclass
+class Point:
+    x: int
+    y: int
+
+
+@dataclasses.dataclass
+class Point3(Point):
+    z: str
+
+
+class Movie(TypedDict):
+    title: str
+    year: int
+
+
+ROW = SequencePattern(
+    [
+        ConstantPattern("add"),
+        AnnotatedPattern(VariablePattern("n"), int),
+        MappingPattern({"k": VariablePattern("v")}),
+    ]
+)
+ROWS = [("add", 1, {"k": 2}), ("add", 2, {}), ("sub", 1, {"k": 2}), ("add", True, {"k": 0})]
+
+
+def test_fixed_tuple():
+    spec = ROW.specialize(Tuple[str, int, Dict[str, int]])
+    assert type(spec) is TrustedSequencePattern
+    assert not spec.check_length
+    assert type(spec.patterns[1]) is VariablePattern  # int is guaranteed.
+    assert type(spec.patterns[2]) is TrustedMappingPattern
+    for x in ROWS:
+        assert spec.match(x) == ROW.match(x)
+
+
+def test_never_matches():
+    assert isinstance(ROW.specialize(Tuple[str, int]), NeverPattern)
+    assert isinstance(ROW.specialize(Tuple[int, int, dict]), NeverPattern)
+    assert isinstance(ROW.specialize(str), NeverPattern)
+    assert isinstance(ConstantPattern(1).specialize(str), NeverPattern)
+    assert isinstance(ConstantPattern("1").specialize(float), NeverPattern)
+    assert not isinstance(ConstantPattern(1.0).specialize(int), NeverPattern)
+    assert isinstance(MappingPattern({1: VariablePattern("x")}).specialize(Dict[str, int]), NeverPattern)
+    assert not isinstance(MappingPattern({1: VariablePattern("x")}).specialize(Dict[float, int]), NeverPattern)
+    cases = [ROW, SequencePattern([VariablePattern("a"), VariablePattern("b")]), VariablePattern("_")]
+    assert unmatchable(cases, Tuple[str, int]) == [(0, "typing.Tuple[str, int] has length 2, not 3")]
+    assert unmatchable(cases, int) == [(0, "int is not matched by sequence patterns"), (1, "int is not matched by sequence patterns")]
+
+
+def test_variable_length():
+    annotated = AnnotatedPattern(VariablePattern("a"), int)
+    pat = SequencePattern([annotated, VariablePattern("b")])
+    spec = pat.specialize(List[int])
+    assert type(spec) is TrustedSequencePattern
+    assert spec.check_length
+    assert spec.match([1, 2]) == {"a": 1, "b": 2}
+    assert spec.match([1, 2, 3]) is None
+    assert spec.patterns == (annotated.pattern, pat.patterns[1])
+    assert type(pat.specialize(Tuple[int, ...])) is TrustedSequencePattern
+
+
+def test_dataclass():
+    pat = InstancePattern(Point, [VariablePattern("x")], {"y": AnnotatedPattern(VariablePattern("y"), int)})
+    spec = pat.specialize(Point3)
+    assert type(spec) is TrustedInstancePattern
+    assert spec.fields == ("x",)
+    assert type(spec.kwpatterns[0]) is VariablePattern
+    assert spec.match(Point3(1, 2, "z")) == {"x": 1, "y": 2}
+    assert not isinstance(InstancePattern(Point, [], {}).specialize(int), NeverPattern)
+    assert isinstance(InstancePattern(int, [], {}).specialize(str), NeverPattern)
+    # A subclass of Point might be a Point3, so nothing is known.
+    assert type(InstancePattern(Point3, [], {}).specialize(Point)) is InstancePattern
+
+
+@dataclasses.dataclass
+class Measure:
+    value: float
+    phase: complex
+
+
+def test_numeric_tower():
+    # As in PEP 484, an int is a float, and an int or float a complex.
+    for schema in [float, complex]:
+        spec = ConstantPattern(1).specialize(schema)
+        assert not isinstance(spec, NeverPattern)
+        assert spec.match(1) == {} and spec.match(1.0) is None
+    assert spec.match(1j) is None
+    assert not isinstance(ConstantPattern(1.5).specialize(complex), NeverPattern)
+    assert isinstance(ConstantPattern(1j).specialize(float), NeverPattern)
+    assert unmatchable([ConstantPattern(1), ConstantPattern("1")], float) == [(1, "'1' is not a float; '1' is not a int")]
+    assert type(AnnotatedPattern(VariablePattern("v"), float).specialize(float)) is VariablePattern
+    annotated = AnnotatedPattern(VariablePattern("v"), int).specialize(float)
+    assert annotated.match(1) == {"v": 1} and annotated.match(1.5) is None
+
+    pat = InstancePattern(Measure, [ConstantPattern(0), AnnotatedPattern(VariablePattern("p"), int)], {})
+    spec = pat.specialize(Measure)
+    assert type(spec) is TrustedInstancePattern
+    assert unmatchable([pat], Measure) == []
+    for x in [Measure(0, 1), Measure(0.0, 1), Measure(0, 1.0), Measure(0, 1j), Measure(1, 1)]:
+        assert spec.match(x) == pat.match(x), x
+    assert spec.match(Measure(0, 2)) == {"p": 2}
+
+
+def test_union():
+    pat = SequencePattern([VariablePattern("a"), VariablePattern("b")])
+    spec = pat.specialize(Optional[Tuple[int, int]])
+    assert type(spec) is AnnotatedPattern and spec.cls is tuple
+    assert spec.match(None) is None
+    assert spec.match((1, 2)) == {"a": 1, "b": 2}
+    assert isinstance(pat.specialize(Union[int, str]), NeverPattern)
+    assert pat.specialize(Union[Tuple[int, int], List[int]]) is pat
+
+
+def test_typeddict_and_literal():
+    pat = MappingPattern({"title": AnnotatedPattern(VariablePattern("t"), str), "year": ConstantPattern(1999)})
+    spec = pat.specialize(Movie)
+    assert type(spec) is TrustedMappingPattern
+    assert spec.match({"title": "Matrix", "year": 1999}) == {"t": "Matrix"}
+    assert spec.match({"title": "Matrix", "year": 2003}) is None
+    assert isinstance(ConstantPattern("x").specialize(Literal["a", "b"]), NeverPattern)
+    literal = ConstantPattern("a")
+    assert literal.specialize(Literal["a", "b"]) is literal
+
+
+def test_alternatives_and_any():
+    pat = AlternativesPattern([ConstantPattern("a"), ConstantPattern(1), ConstantPattern(2)])
+    spec = pat.specialize(int)
+    assert type(spec) is AlternativesPattern and len(spec.patterns) == 2
+    assert type(pat.specialize(str)) is ConstantPattern
+    assert pat.specialize(Any) is pat
+
+
+def test_specialized_pickle():
+    spec = ROW.specialize(Tuple[str, int, Dict[str, int]])
+    copy = pickle.loads(pickle.dumps(spec))
+    assert type(copy) is TrustedSequencePattern
+    assert copy.match(ROWS[0]) == spec.match(ROWS[0])
+    never = pickle.loads(pickle.dumps(ROW.specialize(int)))
+    assert never.reason == "int is not matched by sequence patterns"
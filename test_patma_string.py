@@ -0,0 +1,99 @@
+import pickle
+import random
+import re
+from typing import Iterator, List
+
+from patma import *
+from patma_string import StringDispatch, StringPattern
+from test_patma import checks
+
+
+def test_string_pattern():
+    pat = StringPattern("/users/", regex=r"(?P<id>\d+)")
+    assert checks(pat, "/users/42") == {"id": "42"}
+    assert checks(pat, "/users/") is None
+    assert checks(pat, "/users/42/") is None
+    assert checks(pat, 42) is None
+    assert pat.bindings() == {"id"}
+    pat = StringPattern("ab", "ba")
+    assert checks(pat, "abba") == {}
+    assert checks(pat, "aba") is None  # Prefix and suffix can't overlap.
+    assert checks(pat, b"abba") is None
+    assert pat.bindings() == set()
+    pat = StringPattern(regex="(?P<a>x)|(?P<b>y)")
+    assert checks(pat, "y") == {"a": None, "b": "y"}
+    pat = StringPattern(suffix=".", regex="a  # One a.", flags=re.VERBOSE)
+    assert pat.match("a.") == {}
+    pat = StringPattern("/", regex="(?P<name>x+)", flags=re.IGNORECASE)
+    assert pickle.loads(pickle.dumps(pat)).match("/xX") == {"name": "xX"}
+    assert SequencePattern([pat, VariablePattern("y")]).match(["/x", 1]) == {"name": "x", "y": 1}
+
+
+def test_flags_apply_to_prefix_and_suffix():
+    with_regex = StringPattern("/users/", ".json", regex=r"\d+", flags=re.IGNORECASE)
+    without_regex = StringPattern("/users/", ".json", flags=re.IGNORECASE)
+    for pat in [with_regex, without_regex]:
+        assert checks(pat, "/USERS/1.JSON") == {}
+        assert checks(pat, "/Users/1.json") == {}
+        assert checks(pat, "/groups/1.json") is None
+        assert StringDispatch([pat, VariablePattern("_")]).match_first("/USERS/1.Json") == (0, {})
+        assert pickle.loads(pickle.dumps(pat)).match("/users/1.JSON") == {}
+    assert checks(without_regex, "/USERS/.JSON") == {}
+    assert checks(StringPattern("/users/"), "/USERS/1") is None
+    assert checks(StringPattern("a b#", flags=re.VERBOSE), "a b#c") == {}
+
+
+def routes() -> List[Pattern]:
+    cases: List[Pattern] = []
+    for resource in ["users", "groups", "files", "repos", "teams"]:
+        cases += [
+            StringPattern(f"/{resource}", regex="/?"),
+            StringPattern(f"/{resource}/", regex=r"(?P<id>\d+)"),
+            StringPattern(f"/{resource}/", regex=r"(?P<id>\d+)/(?P<action>[a-z]+)"),
+            StringPattern(f"/{resource}/", ".json", regex=r"(?P<id>\d+)"),
+            StringPattern(f"/{resource}/", regex=r"(?P<name>[^/]+)"),
+        ]
+    cases.insert(3, ConstantPattern("/users/1"))
+    cases.insert(7, StringPattern("/", regex=r"(?P<x>a)(?P=x)"))  # Not combined.
+    cases.insert(9, StringPattern("/", regex=r"(\w)\1"))  # Not combined.
+    cases.insert(12, StringPattern("/", regex="UP", flags=re.IGNORECASE))
+    cases.insert(15, AnnotatedPattern(VariablePattern("n"), int))
+    cases.append(StringPattern("/static/"))
+    cases.append(VariablePattern("_"))
+    return cases
+
+
+def subjects() -> Iterator[object]:
+    rng = random.Random(3)
+    parts = ["users", "groups", "files", "x", "42", "1", "7.json", "up", "aa", "bb", "edit", "static", ""]
+    for _ in range(2000):
+        yield "/" + "/".join(rng.choice(parts) for _ in range(rng.randrange(1, 4)))
+    yield from [1, None, 2.5, b"/users/1", ["/users/1"]]
+
+
+def test_dispatch_same_as_match_first():
+    cases = routes()
+    dispatch = StringDispatch(cases)
+    assert dispatch.combined is not None
+    assert dispatch.combined.pattern.count("|") > 20
+    assert [cases[i] for i in dispatch._others] == [
+        c
+        for c in cases
+        if not isinstance(c, StringPattern) or (c.regex and ("\\1" in c.regex or "(?P=" in c.regex))
+    ]
+    seen = set()
+    for x in subjects():
+        result = dispatch.match_first(x)
+        assert result == match_first(cases, x), x
+        assert result is not None  # The last case matches anything.
+        seen.add(result[0])
+    assert len(seen) > 15
+
+
+def test_dispatch_without_string_cases():
+    cases = [ConstantPattern(1), VariablePattern("x")]
+    dispatch = StringDispatch(cases)
+    assert dispatch.combined is None
+    assert dispatch.match_first("s") == (1, {"x": "s"})
+    assert dispatch.match_first(1) == (0, {})
+    assert StringDispatch([StringPattern("a")]).match_first("b") is None
@@ -0,0 +1,166 @@
+import collections
+import enum
+import io
+import mmap
+import re
+from typing import Sequence
+
+import pytest
+
+from patma import *
+from patma_table import PatternTable, dump, dumps, freeze, load, loads
+from test_patma import MyClass
+
+CASES = [
+    ConstantPattern(42),
+    ConstantPattern(1.0),
+    SequencePattern([ConstantPattern("add"), VariablePattern("x")]),
+    AlternativesPattern(
+        [
+            SequencePattern([ConstantPattern(1), ConstantPattern(2)]),
+            SequencePattern([ConstantPattern(3), AnnotatedPattern(VariablePattern("z"), int)]),
+        ]
+    ),
+    MappingPattern({"k": VariablePattern("k"), "l": ConstantPattern("l")}),
+    InstancePattern(MyClass, [VariablePattern("x")], {"y": ConstantPattern("hello")}),
+    WalrusPattern("w", SequencePattern([VariablePattern("p"), VariablePattern("q")])),
+    VariablePattern("_"),
+]
+
+SUBJECTS = [
+    42, 1, 1.0, 2, "42", ("add", 5), ["add", 5], (1, 2), (3, 4), (3, 4.0),
+    {"k": 1, "l": "l"}, {"k": 1}, MyClass(1, "hello"), MyClass(1, "bye"),
+    (7, 8), "ab", None,
+]
+
+
+# CASES without the alternatives binding z in one arm only, which
+# validation rejects.
+VALID_CASES = CASES[:3] + CASES[4:]
+
+
+def check(table: PatternTable, cases: Sequence[Pattern] = CASES) -> None:
+    for i, case in enumerate(cases):
+        for x in SUBJECTS:
+            assert table.match(i, x) == case.match(x), (i, x)
+    for x in SUBJECTS:
+        assert table.match_first(x) == match_first(cases, x)
+
+
+def test_table_matches_like_patterns():
+    table = PatternTable.from_patterns(CASES)
+    assert len(table) == len(CASES)
+    check(table)
+
+
+def test_table_children_contiguous():
+    table = PatternTable.from_patterns(SequencePattern([VariablePattern("a"), VariablePattern("b")]))
+    assert list(table.nodes[:5]) == [4, -1, -1, 1, 2]
+    assert table.objects == ["a", "b"]
+
+
+def test_table_roundtrip():
+    table = PatternTable.from_patterns(CASES)
+    rebuilt = PatternTable.from_patterns(table.patterns())
+    assert list(rebuilt.nodes) == list(table.nodes)
+    assert rebuilt.objects == table.objects
+
+
+def test_table_mmap(tmp_path):
+    path = tmp_path / "rules.pat"
+    path.write_bytes(PatternTable.from_patterns(CASES).to_bytes())
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        table = PatternTable.from_buffer(m)
+        assert isinstance(table.nodes, memoryview)
+        check(table)
+        del table
+
+
+class Color(enum.Enum):
+    RED = 1
+
+
+def test_dump_load(tmp_path):
+    cases = CASES + [
+        ConstantPattern(Color.RED),
+        ConstantPattern(2 ** 100),
+        ConstantPattern(-1.5j),
+        ConstantPattern(b"\x00raw"),
+        ConstantPattern(None),
+        ConstantPattern(True),
+        MappingPattern({(Color.RED, 1): VariablePattern("t")}),
+        AnnotatedPattern(VariablePattern("v"), collections.OrderedDict),
+    ]
+    subjects = SUBJECTS + [Color.RED, 2 ** 100, -1.5j, b"\x00raw", True, {(Color.RED, 1): 5}]
+    path = tmp_path / "rules.pat"
+    with open(path, "wb") as f:
+        dump(cases, f)
+    with open(path, "rb") as f:
+        with pytest.raises(InconsistentBindings):
+            load(f)
+        f.seek(0)
+        table = load(f, validate=False)
+    assert table._refs  # Classes are not imported yet.
+    for i, case in enumerate(cases):
+        for x in subjects:
+            assert table.match(i, x) == case.match(x), (i, x)
+    assert not table._refs
+    assert [type(p) for p in table.patterns()] == [type(p) for p in cases]
+    assert loads(dumps(cases), validate=False).to_bytes() == dumps(cases)
+    assert loads(dumps(VALID_CASES)).to_bytes() == dumps(VALID_CASES)
+
+
+def test_load_rejects_empty_file(tmp_path):
+    path = tmp_path / "empty.pat"
+    path.write_bytes(b"")
+    with open(path, "rb") as f:
+        with pytest.raises(ValueError, match="Not a pattern table"):
+            load(f)
+    with pytest.raises(ValueError, match="Not a pattern table"):
+        loads(b"PAT")
+
+
+def test_dump_rejects_unimportable():
+    class Local:
+        pass
+
+    with pytest.raises(TypeError):
+        dumps(InstancePattern(Local, [], {}))
+    with pytest.raises(TypeError):
+        dumps(ConstantPattern([1, 2]))
+
+
+def test_load_checks_bindings():
+    cases = [
+        SequencePattern([VariablePattern("a"), VariablePattern("b")]),
+        InstancePattern(MyClass, [VariablePattern("x")], {"y": VariablePattern("x")}),
+        AlternativesPattern([VariablePattern("a"), ConstantPattern(1)]),
+        WalrusPattern("a", AlternativesPattern([VariablePattern("a"), VariablePattern("a")])),
+        MappingPattern({"k": VariablePattern("_"), "l": VariablePattern("_")}),
+    ]
+    for case in cases:
+        single = loads(dumps(case), validate=False)
+        try:
+            expected = case.bindings()
+        except BindingsError as err:
+            with pytest.raises(type(err), match=re.escape(str(err))):
+                single.check_bindings()
+            with pytest.raises(type(err)):
+                loads(dumps(case))
+        else:
+            assert single.check_bindings() == [expected]
+
+
+def test_freeze(tmp_path, monkeypatch):
+    with open(tmp_path / "frozen_rules.py", "w") as f:
+        freeze(VALID_CASES, f, "RULES")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    import frozen_rules  # type: ignore
+
+    check(frozen_rules.RULES, VALID_CASES)
+    with pytest.raises(InconsistentBindings):
+        freeze(CASES, io.StringIO())
+    with pytest.raises(ValueError):
+        freeze(VALID_CASES, io.StringIO(), "not a name")
+    with pytest.raises(BindingsError):
+        freeze(SequencePattern([VariablePattern("a"), VariablePattern("a")]), io.StringIO())